@@ -23,6 +23,7 @@ __version__ = '0.0.1'
 
 import os
 import sys
+import time
 import types
 import fcntl
 import string
@@ -36,10 +37,20 @@ from pkg_resources import resource_filename, resource_string
 import gevent
 import gevent.monkey
 
+from mxcubeqt.utils import gevent_hub_loop
+
+# the hub loop has to be chosen before the hub is created
+gevent_hub_loop.install()
 gevent.monkey.patch_all(thread=False)
 
 from mxcubecore import HardwareRepository as HWR
-from mxcubeqt.utils import gui_log_handler, error_handler, qt_import
+from mxcubeqt.utils import (
+    gui_log_handler,
+    error_handler,
+    gevent_loop,
+    qt_import,
+    startup_profiler,
+)
 from mxcubeqt.gui_supervisor import (
     GUISupervisor,
     LOAD_GUI_EVENT,
@@ -158,19 +169,6 @@ def set_log_file(filename):
     LOGGER.addHandler(HWR_LOG_HANDLER)
 
 
-def do_gevent():
-    """Can't call gevent.run inside inner event loops (message boxes...)"""
-
-    if qt_import.QEventLoop():
-        try:
-            gevent.wait(timeout=0.01)
-        except AssertionError:
-            pass
-    else:
-        # all that I tried with gevent here fails! => seg fault
-        pass
-
-
 class MyCustomEvent(qt_import.QEvent):
     """Custom event"""
 
@@ -324,6 +322,54 @@ def create_app(gui_config_path=None, core_config_path=None):
         dest="mockupMode",
         help="Runs MXCuBE with mockup configuration",
     )
+    parser.add_option(
+        "",
+        "--geventLoop",
+        action="store",
+        type="choice",
+        choices=gevent_loop.LOOP_MODES,
+        help="gevent and Qt event loop integration: 'event' runs gevent "
+        + "only when it has work to do, 'poll' pumps gevent continuously "
+        + "(default: poll)",
+        dest="geventLoop",
+        default=gevent_loop.LOOP_MODE_POLL,
+    )
+    parser.add_option(
+        "",
+        "--geventLoopStats",
+        action="store_true",
+        default=False,
+        dest="geventLoopStats",
+        help="Periodically log cpu usage and event dispatch latency "
+        + "of the gevent loop integration",
+    )
+    parser.add_option(
+        "",
+        "--profileStartup",
+        action="store_true",
+        default=False,
+        dest="profileStartup",
+        help="Time startup phases and bricks, writes startup_profile.json "
+        + "and startup_profile.html in the user file directory",
+    )
+    parser.add_option(
+        "",
+        "--profileStartupDump",
+        action="store_true",
+        default=False,
+        dest="profileStartupDump",
+        help="With --profileStartup, also writes a cProfile dump of the "
+        + "startup in startup_profile.prof",
+    )
+    parser.add_option(
+        "",
+        "--lazyBricks",
+        action="store_true",
+        default=False,
+        dest="lazyBricks",
+        help="Create the bricks of hidden tab pages and windows when "
+        + "they are first shown",
+    )
     parser.add_option(
         "",
         "--pyqt4",
@@ -353,6 +399,9 @@ def create_app(gui_config_path=None, core_config_path=None):
         print(__version__)
         exit(0)
 
+    if opts.profileStartup or opts.profileStartupDump:
+        startup_profiler.enable(cprofile=opts.profileStartupDump)
+
     log_file = start_log(opts.logFile, opts.logLevel)
     log_template = opts.logTemplate
     hwobj_directories = opts.hardwareObjectsDirs.split(os.path.pathsep)
@@ -441,8 +490,12 @@ def create_app(gui_config_path=None, core_config_path=None):
     if hwobj_directories:
         # Must be done before init_hardware_repository
         HWR.add_hardware_objects_dirs(hwobj_directories)
+    phase_start = time.time()
     HWR.init_hardware_repository(core_config_path)
     HWR.set_user_file_directory(user_file_dir)
+    startup_profiler.add_phase(
+        "Initializing hardware repository", time.time() - phase_start
+    )
     if custom_bricks_directories:
         add_custom_bricks_dirs(custom_bricks_directories)
 
@@ -548,6 +601,7 @@ def create_app(gui_config_path=None, core_config_path=None):
         design_mode=opts.designMode,
         show_maximized=opts.showMaximized,
         no_border=opts.noBorder,
+        lazy_bricks=opts.lazyBricks,
     )
 
     supervisor.set_user_file_directory(user_file_dir)
@@ -559,9 +613,10 @@ def create_app(gui_config_path=None, core_config_path=None):
     # redirect errors to logger
     error_handler.enable_std_err_redirection()
 
-    gevent_timer = qt_import.QTimer()
-    gevent_timer.timeout.connect(do_gevent)
-    gevent_timer.start(0)
+    gevent_loop_integration = gevent_loop.GeventLoopIntegration(
+        mode=opts.geventLoop, report_stats=opts.geventLoopStats
+    )
+    gevent_loop_integration.start()
 
     palette = main_application.palette()
     palette.setColor(qt_import.QPalette.ToolTipBase, qt_import.QColor(255, 241, 204))
@@ -576,6 +631,7 @@ def create_app(gui_config_path=None, core_config_path=None):
     main_application.exec_()
 
     supervisor.finalize()
+    gevent_loop_integration.stop()
 
     if log_lockfile is not None:
         filename = log_lockfile.name
@@ -21,11 +21,14 @@ import pprint
 import os
 import sys
 import time
-import operator
 import weakref
+import threading
+import collections
 
 import mxcubeqt
 from mxcubeqt.utils import property_bag, connectable, colors, qt_import
+from mxcubeqt.utils import startup_profiler
+from mxcubeqt.utils.event_cache import EventCache, get_slot_key
 
 from mxcubecore import HardwareRepository as HWR
 from mxcubecore.BaseHardwareObjects import HardwareObject
@@ -126,22 +129,268 @@ class SignalSlotFilter:
     def __init__(self, signal, slot, should_cache):
         self.signal = signal
         self.slot = WeakMethod(slot)
+        self.slot_key = get_slot_key(slot)
         self.should_cache = should_cache
 
-    def __call__(self, *args):
+    def cache_event(self, args):
+        """Stores the event in the cache if the gui runs in slave mode
+           and mirroring is prevented
+
+        :returns: True if the event has been cached
+        """
         if (
                 BaseWidget._instance_mode == BaseWidget.INSTANCE_MODE_SLAVE
                 and BaseWidget._instance_mirror == BaseWidget.INSTANCE_MIRROR_PREVENT
            ):
             if self.should_cache:
-                BaseWidget._events_cache[self.slot] = (time.time(), self.slot, args)
-                return
+                BaseWidget._events_cache.add(
+                    self.slot_key, time.time(), self.slot, args
+                )
+                return True
+        return False
+
+    def __call__(self, *args):
+        if self.cache_event(args):
+            return
 
         s = self.slot()
         if s is not None:
+            # an older cached event must not be replayed after this one
+            BaseWidget._events_cache.discard(self.slot_key)
             s(*args)
 
 
+# Signals delivered in the priority lane when a connection is coalesced
+PRIORITY_SIGNALS = (
+    "stateChanged",
+    "specificStateChanged",
+    "statusChanged",
+    "hardwareObjectDiscarded",
+)
+
+# Per signal delivery counters of coalesced connections
+_signal_statistics = {}
+_signal_scheduler = None
+
+
+def get_sender_name(sender):
+    """Returns a readable name of a signal sender"""
+    try:
+        return sender.name()
+    except BaseException:
+        return sender.__class__.__name__
+
+
+class CoalescingSignalSlotFilter(SignalSlotFilter):
+    """Signal slot filter that delivers signals on the gui thread.
+
+       Emissions are coalesced: only the latest arguments are delivered,
+       at most max_rate times per second. Priority connections (state
+       changes) are never merged and are delivered ahead of coalesced ones.
+    """
+
+    def __init__(
+        self,
+        signal,
+        slot,
+        should_cache,
+        max_rate=None,
+        priority=False,
+        key=None,
+        instance_filter=False,
+    ):
+        """
+        :param signal: signal name
+        :param slot: callable
+        :param should_cache: cache events in slave mode
+        :param max_rate: maximal number of deliveries per second (None: no limit)
+        :param priority: deliver every emission, ahead of coalesced signals
+        :param key: statistics key
+        :param instance_filter: filter (cache) events in slave mode
+        """
+        SignalSlotFilter.__init__(self, signal, slot, should_cache)
+        self.instance_filter = instance_filter
+        self.min_interval = 1.0 / max_rate if max_rate else 0
+        self.priority = priority
+        self.pending_args = collections.deque() if priority else None
+        # pending_args is set from the emitting thread
+        self._lock = threading.Lock()
+        self.last_delivery_time = 0
+
+        if key not in _signal_statistics:
+            _signal_statistics[key] = {
+                "emitted": 0,
+                "delivered": 0,
+                "merged": 0,
+                "dropped": 0,
+                "priority": priority,
+            }
+        self.statistics = _signal_statistics[key]
+
+    def __call__(self, *args):
+        self.statistics["emitted"] += 1
+        if self.instance_filter and self.cache_event(args):
+            return
+
+        if self.priority:
+            if threading.current_thread() is threading.main_thread():
+                self.deliver(args)
+            else:
+                self.pending_args.append(args)
+                get_signal_scheduler().submit(self)
+        else:
+            with self._lock:
+                if self.pending_args is not None:
+                    # latest value wins
+                    self.statistics["merged"] += 1
+                self.pending_args = args
+            get_signal_scheduler().submit(self)
+
+    def is_pending(self):
+        if self.priority:
+            return len(self.pending_args) > 0
+        return self.pending_args is not None
+
+    def next_delivery_time(self):
+        return self.last_delivery_time + self.min_interval
+
+    def deliver_pending(self):
+        if self.priority:
+            while self.pending_args:
+                self.deliver(self.pending_args.popleft())
+        else:
+            with self._lock:
+                args = self.pending_args
+                self.pending_args = None
+            if args is not None:
+                self.deliver(args)
+
+    def deliver(self, args):
+        self.last_delivery_time = time.time()
+        s = self.slot()
+        if s is None:
+            self.statistics["dropped"] += 1
+            return
+        self.statistics["delivered"] += 1
+        BaseWidget._events_cache.discard(self.slot_key)
+        s(*args)
+
+
+class SignalDeliveryScheduler(qt_import.QObject):
+    """Delivers coalesced signals from the gui thread.
+
+       Priority filters are always delivered first. Coalesced filters
+       are delivered when their minimal interval has elapsed, within a
+       time budget per run so that chatty hardware objects do not starve
+       the event loop.
+    """
+
+    deliveryRequested = qt_import.pyqtSignal(object)
+
+    def __init__(self, time_budget=0.02):
+        """
+        :param time_budget: maximal time spent delivering coalesced signals
+                            in one run (s)
+        """
+        qt_import.QObject.__init__(self)
+        self.time_budget = time_budget
+        self._priority_filters = collections.OrderedDict()
+        self._filters = collections.OrderedDict()
+        self._timer = qt_import.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.deliver_pending)
+        # queued connection when emitted from another thread: the
+        # filter dicts are only used from the gui thread
+        self.deliveryRequested.connect(self._add)
+
+    def submit(self, signal_filter):
+        """Registers a filter with pending arguments. Can be called from
+           any thread.
+        """
+        if threading.current_thread() is threading.main_thread():
+            self._add(signal_filter)
+        else:
+            self.deliveryRequested.emit(signal_filter)
+
+    def _add(self, signal_filter):
+        if signal_filter.priority:
+            self._priority_filters[signal_filter] = None
+        else:
+            self._filters[signal_filter] = None
+        self._schedule()
+
+    def _schedule(self):
+        if self._priority_filters:
+            self._timer.start(0)
+            return
+        if not self._filters:
+            return
+
+        due_time = min(
+            signal_filter.next_delivery_time() for signal_filter in self._filters
+        )
+        delay = max(int((due_time - time.time()) * 1000), 0)
+        if not self._timer.isActive() or self._timer.remainingTime() > delay:
+            self._timer.start(delay)
+
+    def deliver_pending(self):
+        """Delivers priority filters and coalesced filters which are due"""
+        while self._priority_filters:
+            signal_filter, _ = self._priority_filters.popitem(last=False)
+            self._deliver(signal_filter)
+
+        start_time = time.time()
+        for signal_filter in list(self._filters):
+            if time.time() - start_time > self.time_budget:
+                break
+            if signal_filter.next_delivery_time() <= time.time():
+                del self._filters[signal_filter]
+                self._deliver(signal_filter)
+        self._schedule()
+
+    def _deliver(self, signal_filter):
+        try:
+            signal_filter.deliver_pending()
+        except BaseException:
+            logging.getLogger().exception(
+                "Could not deliver signal %s", signal_filter.signal
+            )
+
+
+def get_signal_scheduler():
+    """Returns the scheduler of coalesced signals"""
+    global _signal_scheduler
+    if _signal_scheduler is None:
+        _signal_scheduler = SignalDeliveryScheduler()
+    return _signal_scheduler
+
+
+def get_signal_statistics():
+    """Returns delivery counters of the coalesced connections
+
+    :returns: dict {"sender.signal": {"emitted", "delivered", "merged",
+              "dropped", "priority"}}
+    """
+    return dict(
+        (key, dict(counters)) for key, counters in _signal_statistics.items()
+    )
+
+
+def log_signal_statistics():
+    """Logs delivery counters of the coalesced connections"""
+    for key, counters in sorted(_signal_statistics.items()):
+        logging.getLogger("HWR").debug(
+            "Signal %s: %d emitted, %d delivered, %d merged, %d dropped"
+            % (
+                key,
+                counters["emitted"],
+                counters["delivered"],
+                counters["merged"],
+                counters["dropped"],
+            )
+        )
+
+
 class BaseWidget(connectable.Connectable, qt_import.QFrame):
     """Base class for MXCuBE bricks"""
 
@@ -179,7 +428,9 @@ class BaseWidget(connectable.Connectable, qt_import.QFrame):
     _instance_user_id = INSTANCE_USERID_UNKNOWN
     _instance_mirror = INSTANCE_MIRROR_UNKNOWN
     _filter_installed = False
-    _events_cache = {}
+    _events_cache = EventCache()
+    _events_replay_time_budget = 0.05
+    _events_replay_pending = False
     _menu_background_color = None
     _menubar = None
     _toolbar = None
@@ -637,20 +888,39 @@ class BaseWidget(connectable.Connectable, qt_import.QFrame):
             method_to_add = WeakMethod(method)
         except TypeError:
             method_to_add = method
-        BaseWidget._events_cache[method_to_add] = (timestamp, method_to_add, args)
+        BaseWidget._events_cache.add(
+            get_slot_key(method), timestamp, method_to_add, args
+        )
+
+    @staticmethod
+    def discard_cached_event(method):
+        """Removes the cached event of a slot called with a newer event"""
+        BaseWidget._events_cache.discard(get_slot_key(method))
 
     @staticmethod
     def synchronize_with_cache():
-        events = list(BaseWidget._events_cache.values())
-        ordered_events = sorted(events, key=operator.itemgetter(0))
-        for event_timestamp, event_method, event_args in ordered_events:
-            try:
-                method = event_method()
-                if method is not None:
-                    method(*event_args)
-            except BaseException:
-                pass
-        BaseWidget._events_cache = {}
+        """Replays cached events in timestamp order. Replay is done in
+           slices of _events_replay_time_budget, remaining events are
+           replayed from the event loop. A call while a replay is running
+           joins it.
+        """
+        if not BaseWidget._events_replay_pending:
+            BaseWidget._replay_events_cache()
+
+    @staticmethod
+    def _replay_events_cache():
+        BaseWidget._events_replay_pending = False
+        remaining = BaseWidget._events_cache.replay(
+            BaseWidget._events_replay_time_budget
+        )
+        if remaining:
+            BaseWidget._events_replay_pending = True
+            qt_import.QTimer.singleShot(0, BaseWidget._replay_events_cache)
+        else:
+            logging.getLogger("HWR").debug(
+                "Event cache synchronized: %s"
+                % str(BaseWidget._events_cache.get_statistics())
+            )
 
     @staticmethod
     def set_gui_enabled(enabled):
@@ -720,7 +990,11 @@ class BaseWidget(connectable.Connectable, qt_import.QFrame):
         # self.run_mode_pushbutton = QPushButton("Simulation", self)
 
         try:
+            start_time = time.time()
             self.run()
+            startup_profiler.add_brick_time(
+                str(self.objectName()), "run", time.time() - start_time
+            )
         except BaseException:
             logging.getLogger().exception(
                 "Could not set %s to run mode", self.objectName()
@@ -750,8 +1024,27 @@ class BaseWidget(connectable.Connectable, qt_import.QFrame):
         # qt_import.QObject.connect(sender, signal, signal_slot_filter)
 
     def connect_hwobj(
-        self, sender, signal, slot, instance_filter=False, should_cache=True
+        self,
+        sender,
+        signal,
+        slot,
+        instance_filter=False,
+        should_cache=True,
+        max_rate=None,
+        priority=None,
     ):
+        """Connects a signal of a hardware object or QObject to a slot
+
+        :param sender: HardwareObject or QObject
+        :param signal: signal name
+        :param slot: callable
+        :param instance_filter: filter signals in slave mode
+        :param should_cache: cache filtered signals in slave mode
+        :param max_rate: if set, emissions are coalesced (latest value wins)
+                         and delivered at most max_rate times per second
+        :param priority: with max_rate, deliver every emission in the
+                         priority lane. By default True for state signals
+        """
 
         if sys.version_info > (3, 0):
             signal = str(signal.decode("utf8") if isinstance(signal, bytes) else signal)
@@ -764,6 +1057,12 @@ class BaseWidget(connectable.Connectable, qt_import.QFrame):
         else:
             pysignal = True
 
+        if max_rate is not None or priority:
+            self.connect_coalescing_filter(
+                sender, signal, slot, instance_filter, should_cache, max_rate, priority
+            )
+            return
+
         if not isinstance(sender, qt_import.QObject):
             if isinstance(sender, HardwareObject):
                 sender.connect(signal, slot)
@@ -794,6 +1093,31 @@ class BaseWidget(connectable.Connectable, qt_import.QFrame):
         # if hasattr(sender, "connectNotify"):
         #    sender.connect_notify(QtCore.pyqtSignal(signal))
 
+    def connect_coalescing_filter(
+        self, sender, signal, slot, instance_filter, should_cache, max_rate, priority
+    ):
+        if priority is None:
+            priority = signal in PRIORITY_SIGNALS
+        uid = (sender, signal, hash(slot))
+        signal_slot_filter = CoalescingSignalSlotFilter(
+            signal,
+            slot,
+            should_cache,
+            max_rate,
+            priority,
+            "%s.%s" % (get_sender_name(sender), signal),
+            instance_filter,
+        )
+        # filter is weakly referenced by the dispatcher
+        self._signal_slot_filters[uid] = signal_slot_filter
+
+        if isinstance(sender, HardwareObject):
+            sender.connect(signal, signal_slot_filter)
+        else:
+            if not isinstance(sender, qt_import.QObject):
+                sender = emitter(sender)
+            getattr(sender, signal).connect(signal_slot_filter)
+
     def disconnect_hwobj(self, sender, signal, slot):
         signal = str(signal)
         if signal[0].isdigit():
@@ -802,6 +1126,18 @@ class BaseWidget(connectable.Connectable, qt_import.QFrame):
         else:
             pysignal = True
 
+        coalescing_filter = self._signal_slot_filters.pop(
+            (sender, signal, hash(slot)), None
+        )
+        if coalescing_filter is not None:
+            if isinstance(sender, HardwareObject):
+                sender.disconnect(signal, coalescing_filter)
+            else:
+                if not isinstance(sender, qt_import.QObject):
+                    sender = emitter(sender)
+                getattr(sender, signal).disconnect(coalescing_filter)
+            return
+
         if isinstance(sender, HardwareObject):
             sender.disconnect(sender, signal, slot)
             return
@@ -868,6 +1204,7 @@ class BaseWidget(connectable.Connectable, qt_import.QFrame):
         self.run()
 
     def set_persistent_property_bag(self, persistent_property_bag):
+        start_time = time.time()
         if id(persistent_property_bag) != id(self.property_bag):
             for prop in persistent_property_bag:
                 if hasattr(prop, "get_name"):
@@ -886,6 +1223,9 @@ class BaseWidget(connectable.Connectable, qt_import.QFrame):
                         self.property_bag[prop["name"]] = prop
 
         self.read_properties()
+        startup_profiler.add_brick_time(
+            str(self.objectName()), "properties", time.time() - start_time
+        )
 
     def read_properties(self):
         for prop in self.property_bag:
@@ -918,9 +1258,13 @@ class BaseWidget(connectable.Connectable, qt_import.QFrame):
                 splash_screen.inc_progress_value()
             self.__loaded_hardware_objects.append(hardware_object_name)
 
+        start_time = time.time()
         hwobj = HWR.get_hardware_repository().get_hardware_object(
             hardware_object_name
         )
+        startup_profiler.add_hardware_object_time(
+            str(self.objectName()), hardware_object_name, time.time() - start_time
+        )
 
         if hwobj is not None:
             self.connect(hwobj, "progressInit", self.progress_init)
@@ -1088,3 +1432,136 @@ class NullBrick(BaseWidget):
             painter.setPen(qt_import.QPen(qt_import.Qt.black, 1))
             painter.drawLine(0, 0, self.width(), self.height())
             painter.drawLine(0, self.height(), self.width(), 0)
+
+
+class LazyBrick(BaseWidget):
+    """Placeholder of a brick that is created when first shown.
+
+       Used for bricks of hidden tab pages and windows when the GUI is
+       started with lazy brick loading. The placeholder keeps the brick
+       properties and connections: signals sent to the brick are queued
+       and replayed once it is created, signals of the brick are
+       connected when it is created.
+    """
+
+    MAX_PENDING_CALLS = 1000
+
+    def __init__(self, parent, widget_name, create_brick):
+        """
+        :param create_brick: callable returning the real brick
+        """
+        BaseWidget.__init__(self, parent, widget_name)
+
+        self.property_bag = property_bag.PropertyBag()
+        self.brick = None
+        self._create_brick = create_brick
+        self._connections = []
+        self._pending_calls = collections.deque(maxlen=LazyBrick.MAX_PENDING_CALLS)
+        self._dropped_calls = 0
+
+        self._main_vlayout = qt_import.QVBoxLayout(self)
+        self._main_vlayout.setSpacing(0)
+        self._main_vlayout.setContentsMargins(0, 0, 0, 0)
+
+    def set_persistent_property_bag(self, persistent_property_bag):
+        self.property_bag = persistent_property_bag
+        if self.brick is not None:
+            self.brick.set_persistent_property_bag(persistent_property_bag)
+
+    def is_loaded(self):
+        return self.brick is not None
+
+    def add_connection(self, signal_name, slot):
+        """Connects a signal of the brick to slot, now if the brick is
+           loaded, otherwise when it is created
+        """
+        if self.brick is not None:
+            getattr(self.brick, signal_name).connect(slot)
+        else:
+            self._connections.append((signal_name, slot))
+
+    def get_slot(self, slot_name):
+        """Returns a callable calling slot_name of the brick, calls are
+           queued until the brick is created
+        """
+
+        def slot(*args):
+            self.call_slot(slot_name, args)
+
+        return slot
+
+    def call_slot(self, slot_name, args):
+        if self.brick is not None:
+            getattr(self.brick, slot_name)(*args)
+        else:
+            if len(self._pending_calls) == self._pending_calls.maxlen:
+                self._dropped_calls += 1
+            self._pending_calls.append((slot_name, args))
+
+    def load(self):
+        """Creates the brick, connects it, sets it in run mode and replays
+           the queued calls
+        """
+        if self.brick is not None:
+            return self.brick
+
+        start_time = time.time()
+        brick = self._create_brick()
+        self.brick = brick
+        brick.set_persistent_property_bag(self.property_bag)
+        self._main_vlayout.addWidget(brick)
+        self.setSizePolicy(brick.sizePolicy())
+        # the brick is found by name from now on
+        self.setObjectName("%s_lazy" % self.objectName())
+
+        for signal_name, slot in self._connections:
+            try:
+                getattr(brick, signal_name).connect(slot)
+            except AttributeError:
+                logging.getLogger().error(
+                    "No signal '%s' in brick %s" % (signal_name, brick.objectName())
+                )
+        self._connections = []
+
+        if BaseWidget.is_running():
+            brick._BaseWidget__run()
+            try:
+                brick.set_expert_mode(False)
+            except BaseException:
+                logging.getLogger().exception(
+                    "Could not set %s to user mode", brick.objectName()
+                )
+        brick.show()
+
+        if self._dropped_calls:
+            logging.getLogger().warning(
+                "%s: %d queued calls dropped before loading"
+                % (brick.objectName(), self._dropped_calls)
+            )
+        while self._pending_calls:
+            slot_name, args = self._pending_calls.popleft()
+            try:
+                getattr(brick, slot_name)(*args)
+            except BaseException:
+                logging.getLogger().exception(
+                    "%s: replay of %s failed" % (brick.objectName(), slot_name)
+                )
+
+        logging.getLogger("HWR").debug(
+            "Brick %s loaded in %.2f s"
+            % (brick.objectName(), time.time() - start_time)
+        )
+        return brick
+
+    def run(self):
+        if self.isVisible():
+            self.load()
+
+    def stop(self):
+        pass
+
+    def showEvent(self, event):
+        BaseWidget.showEvent(self, event)
+        if BaseWidget.is_running() and self.brick is None:
+            # after the show event, so that the page is displayed first
+            qt_import.QTimer.singleShot(0, self.load)
@@ -36,6 +36,53 @@ __license__ = "LGPLv3+"
 __category__ = "EMBL"
 
 
+CELL_NO_DATA, CELL_NO_HIT, CELL_HIT, CELL_COLLECT, CELL_PROCESSING = range(5)
+CELL_COLORS = (
+    colors.LIGHT_GRAY,
+    colors.WHITE,
+    colors.LIGHT_BLUE,
+    colors.LIGHT_ORANGE,
+    colors.DARK_GREEN,
+)
+
+
+def get_block_maxima(values, offset, block_size, num_blocks):
+    """
+    Returns the maximum of consecutive blocks of values
+    :param values: one dimensional numpy array
+    :param offset: index of the first value of the first block
+    :param block_size: number of values in one block
+    :param num_blocks: number of blocks
+    :return: (maxima, has_data) numpy arrays with num_blocks elements,
+             has_data is False for blocks without any value
+    """
+    offset = max(int(offset), 0)
+    block_size = max(int(block_size), 1)
+    total = block_size * num_blocks
+    data = values[offset : offset + total]
+    if data.size == total:
+        # reshape of the results is a view, no copy needed
+        maxima = data.reshape(num_blocks, block_size).max(axis=1)
+    else:
+        padded = np.full(total, -np.inf)
+        padded[: data.size] = data
+        maxima = padded.reshape(num_blocks, block_size).max(axis=1)
+    has_data = np.arange(num_blocks) * block_size < data.size
+    return maxima, has_data
+
+
+def get_cell_colors(maxima, has_data):
+    """
+    Returns cell color indexes (see CELL_COLORS) based on the cell maxima
+    :param maxima: numpy array
+    :param has_data: numpy bool array
+    :return: numpy int array
+    """
+    return np.where(
+        has_data, np.where(maxima > 0, CELL_HIT, CELL_NO_HIT), CELL_NO_DATA
+    )
+
+
 class SsxResultsBrick(BaseWidget):
     def __init__(self, *args):
 
@@ -59,6 +106,8 @@ class SsxResultsBrick(BaseWidget):
         self.score_type_list = ("score", "spots_resolution", "spots_num")
         self.grid_table_item_fixed = False
         self.comp_table_item_fixed = False
+        self.grid_table_colors = None
+        self.comp_table_colors = None
 
         # Properties ----------------------------------------------------------
         self.add_property("cell_size", "integer", 22)
@@ -247,6 +296,14 @@ class SsxResultsBrick(BaseWidget):
         self.comp_table.setFixedWidth(table_width + 10)
         self.comp_table.setFixedHeight(table_height)
 
+        # color indexes of the table cells, -1: not set
+        self.grid_table_colors = np.full(
+            (self.grid_table.rowCount(), self.grid_table.columnCount()), -1
+        )
+        self.comp_table_colors = np.full(
+            (self.comp_table.rowCount(), self.comp_table.columnCount()), -1
+        )
+
         self.hit_map_plot.setFixedWidth(table_width)
         self.hit_map_plot.setFixedHeight(200)
 
@@ -511,6 +568,7 @@ class SsxResultsBrick(BaseWidget):
         """
         self.processing_frame_num = frame_num
         self.update_gui()
+        self.grid_graphics_overlay.update_hits()
         self.grid_graphics_view.scene().update()
 
     def collect_frame_changed(self, frame_num):
@@ -592,36 +650,28 @@ class SsxResultsBrick(BaseWidget):
         if self.params_dict is None or not self.image_tracking_cbox.isChecked():
             return
 
-        for row in range(self.current_chip_config["num_comp_v"]):
-            for col in range(self.current_chip_config["num_comp_h"]):
-                grid_table_item = self.grid_table.item(row, col)
-                grid_cell = row * self.current_chip_config["num_comp_v"] + col
+        num_rows = self.current_chip_config["num_comp_v"]
+        num_cols = self.current_chip_config["num_comp_h"]
+        rows, cols = np.indices((num_rows, num_cols))
+        grid_cells = rows * num_rows + cols
 
-                start_index = (
-                    grid_cell
-                    * self.current_chip_config["num_crystal_v"]
-                    * self.current_chip_config["num_crystal_h"]
-                    * self.params_dict["num_images_per_trigger"]
-                )
-                end_index = min(
-                    start_index
-                    + self.current_chip_config["num_crystal_v"]
-                    * self.current_chip_config["num_crystal_h"]
-                    * self.params_dict["num_images_per_trigger"],
-                    self.results[self.score_type].size - 1,
-                )
-
-                color = colors.LIGHT_GRAY
-                if grid_cell == self.info_dict["processing_grid_cell"]:
-                    color = colors.DARK_GREEN
-                elif grid_cell == self.info_dict["collect_grid_cell"]:
-                    color = colors.LIGHT_ORANGE
-                elif start_index < self.results[self.score_type].size:
-                    if self.results[self.score_type][start_index:end_index].max() > 0:
-                        color = colors.LIGHT_BLUE
-                    else:
-                        color = colors.WHITE
-                grid_table_item.setBackground(color)
+        maxima, has_data = get_block_maxima(
+            self.results[self.score_type],
+            0,
+            self.current_chip_config["num_crystal_v"]
+            * self.current_chip_config["num_crystal_h"]
+            * self.params_dict["num_images_per_trigger"],
+            int(grid_cells.max()) + 1,
+        )
+        cell_colors = get_cell_colors(maxima, has_data)[grid_cells]
+        cell_colors[grid_cells == self.info_dict["collect_grid_cell"]] = CELL_COLLECT
+        cell_colors[
+            grid_cells == self.info_dict["processing_grid_cell"]
+        ] = CELL_PROCESSING
+
+        self.set_table_colors(
+            self.grid_table, self.grid_table_colors, rows, cols, cell_colors
+        )
 
     def update_comp_table(self):
         """
@@ -631,54 +681,56 @@ class SsxResultsBrick(BaseWidget):
         if self.params_dict is None or not self.image_tracking_cbox.isChecked():
             return
 
-        for row in range(self.current_chip_config["num_crystal_h"]):
-            for col in range(self.current_chip_config["num_crystal_v"]):
-
-                if self.inverted_rows_cbox.isChecked() and row % 2:
-                    table_col = self.current_chip_config["num_crystal_v"] - col - 1
-                else:
-                    table_col = col
-
-                comp_table_item = self.comp_table.item(row, table_col)
-                start_index = (
-                    self.info_dict["processing_grid_cell"]
-                    * self.current_chip_config["num_crystal_v"]
-                    * self.current_chip_config["num_crystal_h"]
-                    * self.params_dict["num_images_per_trigger"]
-                    + (row * self.current_chip_config["num_crystal_h"] + col)
-                    * self.params_dict["num_images_per_trigger"]
-                )
+        num_crystal_v = self.current_chip_config["num_crystal_v"]
+        num_crystal_h = self.current_chip_config["num_crystal_h"]
+        num_images_per_trigger = self.params_dict["num_images_per_trigger"]
+
+        rows, cols = np.indices((num_crystal_h, num_crystal_v))
+        comp_cells = rows * num_crystal_h + cols
+        if self.inverted_rows_cbox.isChecked():
+            table_cols = np.where(rows % 2, num_crystal_v - cols - 1, cols)
+        else:
+            table_cols = cols
+
+        maxima, has_data = get_block_maxima(
+            self.results[self.score_type],
+            max(self.info_dict["processing_grid_cell"], 0)
+            * num_crystal_v
+            * num_crystal_h
+            * num_images_per_trigger,
+            num_images_per_trigger,
+            int(comp_cells.max()) + 1,
+        )
+        cell_colors = get_cell_colors(maxima, has_data)[comp_cells]
+        cell_colors[
+            comp_cells == self.info_dict["processing_comp_cell"]
+        ] = CELL_PROCESSING
+        cell_colors[comp_cells == self.info_dict["collect_comp_cell"]] = CELL_COLLECT
+
+        self.set_table_colors(
+            self.comp_table, self.comp_table_colors, rows, table_cols, cell_colors
+        )
 
-                end_index = min(
-                    start_index + self.params_dict["num_images_per_trigger"],
-                    self.results[self.score_type].size - 1,
-                )
-                color = colors.LIGHT_GRAY
-                if (
-                    self.info_dict["collect_comp_cell"]
-                    == row * self.current_chip_config["num_crystal_h"] + col
-                ):
-                    color = colors.LIGHT_ORANGE
-                elif (
-                    self.info_dict["processing_comp_cell"]
-                    == row * self.current_chip_config["num_crystal_h"] + col
-                ):
-                    color = colors.DARK_GREEN
-                elif start_index < self.results[self.score_type].size:
-                    if start_index != end_index:
-                        if (
-                            self.results[self.score_type][start_index:end_index].max()
-                            > 0
-                        ):
-                            color = colors.LIGHT_BLUE
-                        else:
-                            color = colors.WHITE
-                    else:
-                        if self.results[self.score_type][start_index] > 0:
-                            color = colors.LIGHT_BLUE
-                        else:
-                            color = colors.WHITE
-                comp_table_item.setBackground(color)
+    def set_table_colors(self, table, table_colors, rows, cols, cell_colors):
+        """
+        Sets background of the table cells which color has changed
+        :param table: QTableWidget
+        :param table_colors: numpy array with the current cell color indexes
+        :param rows: numpy array with table rows
+        :param cols: numpy array with table columns
+        :param cell_colors: numpy array with new color indexes
+        :return: None
+        """
+        valid = (rows < table_colors.shape[0]) & (cols < table_colors.shape[1])
+        rows, cols, cell_colors = rows[valid], cols[valid], cell_colors[valid]
+        changed = table_colors[rows, cols] != cell_colors
+        for row, col, color_index in zip(
+            rows[changed].tolist(),
+            cols[changed].tolist(),
+            cell_colors[changed].tolist(),
+        ):
+            table.item(row, col).setBackground(CELL_COLORS[color_index])
+        table_colors[rows, cols] = cell_colors
 
     def update_stats(self):
         return
@@ -725,6 +777,9 @@ class GridViewGraphicsItem(qt_import.QGraphicsItem):
         self.size_chip_y = None
         self.images_per_crystal = 1
 
+        # grid is drawn once in a cached image
+        self.cached_image = None
+
     def boundingRect(self):
         """Returns adjusted rect
 
@@ -734,26 +789,42 @@ class GridViewGraphicsItem(qt_import.QGraphicsItem):
 
     def paint(self, painter, option, widget):
         """Main beam painter method
-           Draws ellipse or rectangle with a cross in the middle
+           Draws the cached grid image
         """
-        if self.size_hole:
-            self.custom_brush.setColor(qt_import.Qt.lightGray)
-            painter.setBrush(self.custom_brush)
-            for comp_y in range(self.num_comp_y):
-                for comp_x in range(self.num_comp_x):
-                    for hole_y in range(1, self.num_holes_y + 1):
-                        for hole_x in range(1, self.num_holes_x + 1):
-                            # comp_y = self.num_comp_y - comp_y + 1
-                            hole_y = self.num_holes_y - hole_y + 1
-                            corner_x = (
-                                comp_x * (self.size_comp_x + self.offset_comp)
-                            ) + (hole_x * (self.size_hole + self.offset_hole))
-                            corner_y = (
-                                comp_y * (self.size_comp_y + self.offset_comp)
-                            ) + (hole_y * (self.size_hole + self.offset_hole))
-                            painter.drawRect(
-                                corner_x, corner_y, self.size_hole, self.size_hole
-                            )
+        if self.cached_image is not None:
+            painter.drawImage(0, 0, self.cached_image)
+
+    def init_cached_image(self):
+        """
+        Creates an empty transparent image with the size of the chip
+        :return: None
+        """
+        self.cached_image = qt_import.QImage(
+            int(self.size_chip_x) + 1,
+            int(self.size_chip_y) + 1,
+            qt_import.QImage.Format_ARGB32_Premultiplied,
+        )
+        self.cached_image.fill(qt_import.Qt.transparent)
+
+    def draw_holes(self, corners_x, corners_y, color):
+        """
+        Draws holes in the cached image
+        :param corners_x: numpy array with the x coordinates of the holes
+        :param corners_y: numpy array with the y coordinates of the holes
+        :param color: Qt color
+        :return: None
+        """
+        if self.cached_image is None or not len(corners_x):
+            return
+
+        self.custom_brush.setColor(color)
+        painter = qt_import.QPainter(self.cached_image)
+        painter.setBrush(self.custom_brush)
+        for corner_x, corner_y in zip(corners_x.tolist(), corners_y.tolist()):
+            painter.drawRect(
+                qt_import.QRectF(corner_x, corner_y, self.size_hole, self.size_hole)
+            )
+        painter.end()
 
     def init_item(self, params_dict, results=None):
         """
@@ -781,8 +852,34 @@ class GridViewGraphicsItem(qt_import.QGraphicsItem):
             self.num_comp_y + 0.5
         )
 
+        self.prepareGeometryChange()
+        self.rect = qt_import.QRectF(0, 0, self.size_chip_x, self.size_chip_y)
         self.scene().setSceneRect(0, 0, self.size_chip_x + 10, self.size_chip_y + 10)
 
+        self.init_cached_image()
+        self.draw_cached_image()
+        self.update()
+
+    def draw_cached_image(self):
+        """
+        Draws all holes of the chip in the cached image
+        :return: None
+        """
+        comp_y, comp_x, hole_y, hole_x = np.indices(
+            (self.num_comp_y, self.num_comp_x, self.num_holes_y, self.num_holes_x)
+        )
+        self.draw_holes(
+            (
+                comp_x * (self.size_comp_x + self.offset_comp)
+                + (hole_x + 1) * (self.size_hole + self.offset_hole)
+            ).ravel(),
+            (
+                comp_y * (self.size_comp_y + self.offset_comp)
+                + (hole_y + 1) * (self.size_hole + self.offset_hole)
+            ).ravel(),
+            qt_import.Qt.lightGray,
+        )
+
     def set_results(self, params_dict, results):
         """
         Updates results
@@ -796,16 +893,25 @@ class GridViewGraphicsItem(qt_import.QGraphicsItem):
 
 class GridViewOverlayItem(GridViewGraphicsItem):
     """
-    Overlay to draw fits over the grid view
+    Overlay to draw fits over the grid view.
+    Hits are drawn incrementally in the cached image: only images which
+    became hits since the last update are drawn.
     """
 
+    def __init__(self):
+        GridViewGraphicsItem.__init__(self)
+        self.drawn_hits = None
+
     def calc_hole_coordinates(self, image_index):
         """
         Calculates hole coordinates
-        :param img_index:
-        :return:
+        :param image_index: int or numpy array of image indexes
+        :return: (comp_x, comp_y, hole_x, hole_y, timepoint_x, timepoint_y)
         """
-        image_index = int(image_index)
+        if np.isscalar(image_index):
+            image_index = int(image_index)
+        else:
+            image_index = np.asarray(image_index, dtype=np.int64)
         image_number = image_index // self.images_per_crystal
 
         comp_serial = image_number // (self.num_holes_x * self.num_holes_y)
@@ -819,60 +925,71 @@ class GridViewOverlayItem(GridViewGraphicsItem):
         timepoint_x = timepoint_serial % 2 + 1
         timepoint_y = timepoint_serial // 2 + 1
 
-        if not hole_y & 1:
-            hole_x = self.num_holes_x - hole_x + 1
+        # serpentine scan: even hole rows are collected backwards
+        hole_x = np.where(hole_y & 1, hole_x, self.num_holes_x - hole_x + 1)
+        if np.isscalar(image_index):
+            hole_x = int(hole_x)
 
         return (comp_x, comp_y, hole_x, hole_y, timepoint_x, timepoint_y)
 
-    def paint(self, painter, option, widget):
+    def draw_cached_image(self):
+        """
+        Draws all hits in the cached image
+        :return: None
         """
-        Main pain method
-        :param painter:
-        :param option:
-        :param widget:
+        self.drawn_hits = None
+        self.update_hits()
+
+    def set_results(self, params_dict, results):
+        """
+        Updates results and redraws hits
+        :param params_dict:
+        :param results:
         :return:
         """
-        self.custom_brush.setColor(qt_import.Qt.blue)
-        painter.setBrush(self.custom_brush)
+        GridViewGraphicsItem.set_results(self, params_dict, results)
+        if self.size_hole:
+            self.init_cached_image()
+            self.draw_cached_image()
+            self.update()
 
-        def draw_hole_timeseries(
-            comp_x, comp_y, hole_x, hole_y, subpixel_x, subpixel_y
-        ):
-            """
-            Draws holes
-            :param comp_x:
-            :param comp_y:
-            :param hole_x:
-            :param hole_y:
-            :param subpixel_x:
-            :param subpixel_y:
-            :return:
-            """
-            # comp_y = self.num_comp_y - comp_y +1
-            # hole_y        = self.num_holes_y - hole_y +1
-            # subpixel_y    = self.no_subpixels_y - subpixel_y +1
-
-            corner_x = (
-                comp_x * (self.size_comp_x + self.offset_comp)
-                + (hole_x * (self.size_hole + self.offset_hole))
-                + ((subpixel_x - 1) * self.size_hole)
-            )
+    def update_hits(self):
+        """
+        Draws hits which are not drawn yet in the cached image
+        :return: None
+        """
+        if self.results is None or self.cached_image is None:
+            return
 
-            corner_y = (
+        hits = self.results["score"] > 0
+        if self.drawn_hits is None or self.drawn_hits.size != hits.size:
+            self.drawn_hits = np.zeros(hits.size, dtype=bool)
+        new_hits = np.flatnonzero(hits & ~self.drawn_hits)
+        if not new_hits.size:
+            return
+        self.drawn_hits[new_hits] = True
+
+        (
+            comp_x,
+            comp_y,
+            hole_x,
+            hole_y,
+            timepoint_x,
+            timepoint_y,
+        ) = self.calc_hole_coordinates(new_hits)
+        visible = timepoint_y <= 1
+
+        self.draw_holes(
+            (
+                comp_x * (self.size_comp_x + self.offset_comp)
+                + hole_x * (self.size_hole + self.offset_hole)
+                + (timepoint_x - 1) * self.size_hole
+            )[visible],
+            (
                 comp_y * (self.size_comp_y + self.offset_comp)
-                + (hole_y * (self.size_hole + self.offset_hole))
-                + ((subpixel_y - 1) * self.size_hole)
-            )
-
-            painter.drawRect(corner_x, corner_y, self.size_hole, self.size_hole)
-
-        if self.results is not None:
-            hitlist = np.where(self.results["score"] > 0)[0]
-            for hit in hitlist:
-                comp_x, comp_y, hole_x, hole_y, timepoint_x, timepoint_y = self.calc_hole_coordinates(
-                    hit
-                )
-                if timepoint_y <= 1:
-                    draw_hole_timeseries(
-                        comp_x, comp_y, hole_x, hole_y, timepoint_x, timepoint_y
-                    )
+                + hole_y * (self.size_hole + self.offset_hole)
+                + (timepoint_y - 1) * self.size_hole
+            )[visible],
+            qt_import.Qt.blue,
+        )
+        self.update()
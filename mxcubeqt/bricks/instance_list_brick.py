@@ -21,6 +21,9 @@
 
 import os
 import sys
+import time
+import zlib
+import pickle
 import smtplib
 import gevent
 import logging
@@ -106,6 +109,35 @@ class UserInfoDialogEvent(qt_import.QEvent):
         self.font_size = font_size
 
 
+def encode_widget_updates(widget_updates, compress_threshold):
+    """
+    Encodes a list of widget updates
+    :param widget_updates: list of (timestamp, brick name, widget name,
+                           method name, method args, master sync)
+    :param compress_threshold: payloads larger than this (bytes) are
+                               compressed
+    :return: (payload, compressed)
+    """
+    payload = pickle.dumps(widget_updates, protocol=2)
+    if len(payload) > compress_threshold:
+        compressed_payload = zlib.compress(payload)
+        if len(compressed_payload) < len(payload):
+            return compressed_payload, True
+    return payload, False
+
+
+def decode_widget_updates(payload, compressed):
+    """
+    Decodes a list of widget updates encoded with encode_widget_updates
+    :param payload: bytes
+    :param compressed: bool
+    :return: list of widget updates
+    """
+    if compressed:
+        payload = zlib.decompress(payload)
+    return pickle.loads(payload)
+
+
 class InstanceListBrick(BaseWidget):
 
     LOCATIONS = ("UNKNOWN", "LOCAL", "INHOUSE", "INSITE", "EXTERNAL")
@@ -127,6 +159,20 @@ class InstanceListBrick(BaseWidget):
         self.add_property("giveControlTimeout", "integer", 30)
         self.add_property("initializeServer", "boolean", False)
         self.add_property("controlEmails", "string", "")
+        self.add_property(
+            "widgetUpdateInterval",
+            "integer",
+            100,
+            comment="Widget updates sent to remote instances are collected "
+            + "during this time (ms). Only the last update of a widget is sent. "
+            + "0 sends every update immediately",
+        )
+        self.add_property(
+            "widgetUpdateCompressSize",
+            "integer",
+            1024,
+            comment="Widget update batches larger than this (bytes) are compressed",
+        )
 
         # Properties to link hwobj --------------------------------------------
         self.add_property("hwobj_instance_connection", "string", "/instanceconnection")
@@ -151,6 +197,18 @@ class InstanceListBrick(BaseWidget):
         self.connections = {}
         self.server_icon = icons.load_icon("Home2")
         self.client_icon = icons.load_icon("User2")
+        self.pending_widget_updates = collections.OrderedDict()
+        self.traffic_stats = {
+            "sent_messages": 0,
+            "sent_bytes": 0,
+            "received_messages": 0,
+            "received_bytes": 0,
+            "merged_updates": 0,
+        }
+        self.traffic_stats_last = dict(self.traffic_stats)
+        self.traffic_stats_time = time.time()
+        # brick name -> brick, see get_brick
+        self.brick_index = None
 
         # Graphic elements ----------------------------------------------------
         _main_widget = qt_import.QWidget(self)
@@ -192,6 +250,7 @@ class InstanceListBrick(BaseWidget):
         _my_name_widget = qt_import.QWidget(_main_gbox)
         _my_name_label = qt_import.QLabel("My name:", _my_name_widget)
         self.nickname_ledit = NickEditInput(_my_name_widget)
+        self.traffic_label = qt_import.QLabel(_main_gbox)
 
         reg_exp = qt_import.QRegExp(".+")
         nick_validator = qt_import.QRegExpValidator(reg_exp, self.nickname_ledit)
@@ -214,6 +273,7 @@ class InstanceListBrick(BaseWidget):
         _main_widget_vlayout.addWidget(self.take_control_button)
         _main_widget_vlayout.addWidget(self.ask_control_button)
         _main_widget_vlayout.addWidget(_my_name_widget)
+        _main_widget_vlayout.addWidget(self.traffic_label)
         _main_widget_vlayout.setSpacing(2)
         _main_widget_vlayout.setContentsMargins(2, 2, 2, 2)
 
@@ -242,6 +302,12 @@ class InstanceListBrick(BaseWidget):
         # Other ---------------------------------------------------------------
         self.timeout_timer = qt_import.QTimer(self)
         self.timeout_timer.timeout.connect(self.timeout_approaching)
+        self.widget_update_timer = qt_import.QTimer(self)
+        self.widget_update_timer.setSingleShot(True)
+        self.widget_update_timer.timeout.connect(self.send_widget_updates)
+        # started by start_traffic_measurement
+        self.traffic_timer = qt_import.QTimer(self)
+        self.traffic_timer.timeout.connect(self.update_traffic_info)
         _main_gbox.setChecked(False)
 
     def property_changed(self, property_name, old_value, new_value):
@@ -289,6 +355,8 @@ class InstanceListBrick(BaseWidget):
                 self.disconnect(
                     self.instance_server_hwobj, "widgetCall", self.widget_call
                 )
+                # removes the counting parseReceivedMessage
+                self.instance_server_hwobj.__dict__.pop("parseReceivedMessage", None)
 
             self.instance_server_hwobj = self.get_hardware_object(new_value)
 
@@ -331,6 +399,7 @@ class InstanceListBrick(BaseWidget):
                     self.instance_server_hwobj, "clientClosed", self.client_closed
                 )
                 self.connect(self.instance_server_hwobj, "widgetCall", self.widget_call)
+                self.count_received_messages(self.instance_server_hwobj)
         elif property_name == "hwobj_xmlrpc_server":
             self.xmlrpc_server = self.get_hardware_object(new_value)
         elif property_name == "hwobj_hutch_trigger":
@@ -541,6 +610,14 @@ class InstanceListBrick(BaseWidget):
         )
 
     def widget_update(self, timestamp, method, method_args, master_sync=True):
+        if method == self.apply_widget_updates:
+            # batch of updates, each update is cached individually
+            method(*method_args)
+            return
+
+        self.apply_widget_update(timestamp, method, method_args, master_sync)
+
+    def apply_widget_update(self, timestamp, method, method_args, master_sync=True):
         if self.instance_server_hwobj.isServer():
             BaseWidget.add_event_to_cache(timestamp, method, *method_args)
             if not master_sync or BaseWidget.should_run_event():
@@ -561,6 +638,7 @@ class InstanceListBrick(BaseWidget):
                     except AttributeError:
                         pass
         else:
+            BaseWidget.discard_cached_event(method)
             method.__self__.blockSignals(True)
             method(*method_args)
 
@@ -612,10 +690,256 @@ class InstanceListBrick(BaseWidget):
         self, brick_name, widget_name, method_name, method_args, master_sync
     ):
         if not master_sync or self.instance_server_hwobj is not None:
-            brick_event = AppBrickEvent(
+            if self["widgetUpdateInterval"] <= 0:
+                brick_event = AppBrickEvent(
+                    brick_name, widget_name, method_name, method_args, master_sync
+                )
+                qt_import.QApplication.postEvent(self, brick_event)
+                return
+
+            # only the last state of a widget is sent
+            key = (brick_name, widget_name, method_name)
+            if self.pending_widget_updates.pop(key, None) is not None:
+                self.traffic_stats["merged_updates"] += 1
+            self.pending_widget_updates[key] = (time.time(), method_args, master_sync)
+            if not self.widget_update_timer.isActive():
+                self.widget_update_timer.start(self["widgetUpdateInterval"])
+
+    def send_widget_updates(self):
+        """
+        Sends collected widget updates. A single update is sent as a brick
+        update message, several updates are sent as one compressed batch
+        applied by the remote InstanceListBrick
+        :return: None
+        """
+        if not self.pending_widget_updates or self.instance_server_hwobj is None:
+            self.pending_widget_updates.clear()
+            return
+
+        widget_updates = [
+            (timestamp, brick_name, widget_name, method_name, method_args, master_sync)
+            for (brick_name, widget_name, method_name), (
+                timestamp,
+                method_args,
+                master_sync,
+            ) in self.pending_widget_updates.items()
+        ]
+        self.pending_widget_updates.clear()
+
+        if len(widget_updates) == 1:
+            _, brick_name, widget_name, method_name, method_args, master_sync = (
+                widget_updates[0]
+            )
+            self.send_brick_update(
                 brick_name, widget_name, method_name, method_args, master_sync
             )
-            qt_import.QApplication.postEvent(self, brick_event)
+        else:
+            if self.instance_server_hwobj.isServer():
+                # new clients are synchronized with the last update of
+                # each widget, not with the last batch only
+                for (
+                    _,
+                    brick_name,
+                    widget_name,
+                    method_name,
+                    method_args,
+                    master_sync,
+                ) in widget_updates:
+                    msg = QtInstanceServer.BrickUpdateInstanceMessage()
+                    msg.setBrickUpdate(
+                        brick_name, widget_name, method_name, method_args, master_sync
+                    )
+                    self.instance_server_hwobj.addEventToCache(
+                        brick_name, widget_name, msg.encode()
+                    )
+            payload, compressed = encode_widget_updates(
+                widget_updates, self["widgetUpdateCompressSize"]
+            )
+            # unlike single updates, the batch is not cached: a new client
+            # replaying it after the per widget updates would get older values
+            self.send_brick_update(
+                str(self.objectName()),
+                "",
+                "apply_widget_updates",
+                (payload, compressed),
+                False,
+                cache=False,
+            )
+
+    def send_brick_update(
+        self, brick_name, widget_name, method_name, method_args, master_sync, cache=True
+    ):
+        """
+        Sends a brick update message, as sendBrickUpdateMessage of the
+        instance server, and counts the message and its size
+        :param cache: on the server, keep the message to synchronize new clients
+        :return: None
+        """
+        msg = QtInstanceServer.BrickUpdateInstanceMessage()
+        msg.setBrickUpdate(
+            brick_name, widget_name, method_name, method_args, master_sync
+        )
+        data = msg.encode()
+        if self.instance_server_hwobj.isServer():
+            if cache:
+                self.instance_server_hwobj.addEventToCache(
+                    brick_name, widget_name, data
+                )
+            QtInstanceServer.broadcast_to_clients(data)
+        elif self.instance_server_hwobj.isClient():
+            QtInstanceServer.send_data_to_server(
+                self.instance_server_hwobj.instanceClient, data
+            )
+        else:
+            logging.getLogger().warning(
+                "InstanceListBrick: brick update while not server nor client"
+            )
+            return
+
+        self.start_traffic_measurement()
+        self.traffic_stats["sent_messages"] += 1
+        self.traffic_stats["sent_bytes"] += len(data)
+
+    def count_received_messages(self, instance_server_hwobj):
+        """
+        Counts the widget update messages received by the instance server
+        and their size: every received message is parsed by
+        parseReceivedMessage, it is wrapped
+        :param instance_server_hwobj: QtInstanceServer
+        :return: None
+        """
+        parse_received_message = instance_server_hwobj.parseReceivedMessage
+
+        def parse_and_count(data):
+            message = parse_received_message(data)
+            if isinstance(
+                message,
+                (
+                    QtInstanceServer.BrickUpdateInstanceMessage,
+                    QtInstanceServer.TabUpdateInstanceMessage,
+                ),
+            ):
+                self.start_traffic_measurement()
+                self.traffic_stats["received_messages"] += 1
+                self.traffic_stats["received_bytes"] += len(data)
+            return message
+
+        instance_server_hwobj.parseReceivedMessage = parse_and_count
+
+    def get_brick(self, brick_name):
+        """
+        Returns the brick named brick_name. The bricks are indexed by name
+        once, the index is rebuilt after a brick is destroyed
+        :param brick_name: str
+        :return: BaseWidget
+        :raises KeyError: no brick with this name
+        """
+        if self.brick_index is None:
+            self.brick_index = {}
+            for widget in qt_import.QApplication.allWidgets():
+                if isinstance(widget, BaseWidget):
+                    self.brick_index[str(widget.objectName())] = widget
+                    widget.destroyed.connect(self.invalidate_brick_index)
+        return self.brick_index[brick_name]
+
+    def invalidate_brick_index(self, *args):
+        """Forgets the brick index, called when an indexed brick is destroyed"""
+        if self.brick_index is not None:
+            for brick in self.brick_index.values():
+                try:
+                    brick.destroyed.disconnect(self.invalidate_brick_index)
+                except (RuntimeError, TypeError):
+                    pass
+        self.brick_index = None
+
+    def apply_widget_updates(self, payload, compressed):
+        """
+        Applies a batch of widget updates received from a remote instance.
+        All methods are resolved first and then called with gui updates
+        disabled, so the batch is applied at once
+        :param payload: bytes
+        :param compressed: bool
+        :return: None
+        """
+        try:
+            widget_updates = decode_widget_updates(payload, compressed)
+        except BaseException:
+            logging.getLogger().exception("Could not decode widget updates")
+            return
+
+        calls = []
+        for (
+            timestamp,
+            brick_name,
+            widget_name,
+            method_name,
+            method_args,
+            master_sync,
+        ) in widget_updates:
+            try:
+                widget = self.get_brick(brick_name)
+                if widget_name:
+                    widget = getattr(widget, widget_name)
+                calls.append(
+                    (timestamp, getattr(widget, method_name), method_args, master_sync)
+                )
+            except (KeyError, AttributeError):
+                logging.getLogger().debug(
+                    "Widget update of %s.%s.%s ignored"
+                    % (brick_name, widget_name, method_name)
+                )
+
+        top_level_widget = self.window()
+        top_level_widget.setUpdatesEnabled(False)
+        try:
+            for timestamp, method, method_args, master_sync in calls:
+                self.apply_widget_update(timestamp, method, method_args, master_sync)
+        finally:
+            top_level_widget.setUpdatesEnabled(True)
+
+    def start_traffic_measurement(self):
+        """
+        Starts the traffic timer if it is stopped, it stops once no
+        message is sent or received during a second
+        :return: None
+        """
+        if not self.traffic_timer.isActive():
+            self.traffic_stats_last = dict(self.traffic_stats)
+            self.traffic_stats_time = time.time()
+            self.traffic_timer.start(1000)
+
+    def update_traffic_info(self):
+        """
+        Displays widget update messages per second and bytes of these
+        messages per second
+        :return: None
+        """
+        now = time.time()
+        elapsed = max(now - self.traffic_stats_time, 1e-3)
+        rates = dict(
+            (key, (self.traffic_stats[key] - self.traffic_stats_last[key]) / elapsed)
+            for key in self.traffic_stats
+        )
+        self.traffic_stats_last = dict(self.traffic_stats)
+        self.traffic_stats_time = now
+        if not any(rates.values()):
+            self.traffic_timer.stop()
+
+        self.traffic_label.setText(
+            "Sent: %.1f msg/s %.1f kB/s  Received: %.1f msg/s %.1f kB/s"
+            % (
+                rates["sent_messages"],
+                rates["sent_bytes"] / 1024.0,
+                rates["received_messages"],
+                rates["received_bytes"] / 1024.0,
+            )
+        )
+        self.traffic_label.setToolTip(
+            "Sent %(sent_messages)d messages (%(sent_bytes)d bytes), "
+            "received %(received_messages)d messages (%(received_bytes)d bytes), "
+            "%(merged_updates)d widget updates merged"
+            % self.traffic_stats
+        )
 
     def init_name(self, new_name):
         self.nickname_ledit.blockSignals(True)
@@ -970,7 +1294,7 @@ class InstanceListBrick(BaseWidget):
                     self.instance_server_hwobj.initializeInstance()
 
             elif event.type() == APP_BRICK_EVENT:
-                self.instance_server_hwobj.sendBrickUpdateMessage(
+                self.send_brick_update(
                     event.brick_name,
                     event.widget_name,
                     event.method_name,
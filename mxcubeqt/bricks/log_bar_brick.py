@@ -82,8 +82,13 @@ class LogBarBrick(BaseWidget):
         self.test_mode = True
 
     def customEvent(self, event):
-        """Event to add a new log record"""
-        self.append_log_record(event.record)
+        """Event to add a batch of new log records"""
+        self.append_log_records(event.records)
+
+    def append_log_records(self, records):
+        """Appends a batch of log lines to the text edit"""
+        for record in records:
+            self.append_log_record(record)
 
     def append_log_record(self, record):
         """Appends a new log line to the text edit
@@ -34,7 +34,7 @@ The LogView brick displays log messages from the application.
 |  enableFeedback | boolean | adds a new tab for mail feedback feature
 |  emailAddresses | string  | list separated by spaces of email addresses for the feedback feature
 |  icons          | string  | <icon for tab 1> <icon for tab 2> ... <icon for tab n> <feedback icon>
-|  maxLogLines    | integer | max. log lines, negative value : infinite log
+|  maxLogLines    | integer | max. log lines, negative value : 1000000 lines
 |  autoSwitchTabs | boolean | automatically switch to appropriate tab when a new message is logged
 ----------------------------------------------------------------
 
@@ -64,13 +64,16 @@ The email feedback feature allows users to report any problem : an email
 is sent to the recipients specified in the emailAddresses property.
 """
 import os
+import time
 import logging
 
 # import email.Utils
 from datetime import datetime
 import smtplib
 
-from mxcubeqt.utils import icons, colors, gui_log_handler, qt_import
+import numpy as np
+
+from mxcubeqt.utils import icons, colors, gui_log_handler, log_buffer, qt_import
 from mxcubeqt.base_components import BaseWidget
 
 
@@ -79,43 +82,201 @@ __license__ = "LGPLv3+"
 __category__ = "Log"
 
 
-class CustomTreeWidget(qt_import.QTreeWidget):
+class LogTableModel(qt_import.QAbstractTableModel):
+    """Table model of log records stored in a LogRecordBuffer.
+       When a filter is set, rows are the sequence numbers of the matching
+       records, computed from the buffer index and extended incrementally.
+    """
+
+    HEADERS = ("Level", "Date", "Time", "Message")
+
+    def __init__(self, parent=None):
+        qt_import.QAbstractTableModel.__init__(self, parent)
+
+        self.records = log_buffer.LogRecordBuffer()
+        self.log_filter = None
+        self.filtered_rows = None
+        self.highlight_brush = qt_import.QBrush(colors.LIGHT_2_GRAY)
+
+    def rowCount(self, parent=qt_import.QModelIndex()):
+        if parent.isValid():
+            return 0
+        if self.filtered_rows is None:
+            return len(self.records)
+        return len(self.filtered_rows)
+
+    def columnCount(self, parent=qt_import.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(LogTableModel.HEADERS)
+
+    def headerData(self, section, orientation, role=qt_import.Qt.DisplayRole):
+        if orientation == qt_import.Qt.Horizontal and role == qt_import.Qt.DisplayRole:
+            return LogTableModel.HEADERS[section]
+        return None
+
+    def get_seq(self, row):
+        if self.filtered_rows is None:
+            return self.records.first_seq + row
+        return int(self.filtered_rows[row])
+
+    def data(self, index, role=qt_import.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        seq = self.get_seq(index.row())
+        if role == qt_import.Qt.DisplayRole:
+            return self.row_text(seq)[index.column()]
+        elif role == qt_import.Qt.BackgroundRole:
+            if (index.row() + 1) % 10 == 0:
+                return self.highlight_brush
+        return None
+
+    def row_text(self, seq):
+        level, level_name, timestamp, name, message = self.records.get(seq)
+        local_time = time.localtime(timestamp)
+        return (
+            level_name,
+            time.strftime("%Y-%m-%d", local_time),
+            time.strftime("%H:%M:%S", local_time),
+            message,
+        )
+
+    def add_records(self, records):
+        """Appends a batch of gui_log_handler.LogRecord"""
+        if not records:
+            return
+        # older records of the batch would be evicted by the newer ones
+        records = records[-self.records.capacity:]
+
+        # rows of the oldest records are removed first, then the new rows
+        # are inserted: views keep their scroll position and selection
+        self.remove_first_records(
+            len(self.records) + len(records) - self.records.capacity
+        )
+
+        new_seq = self.records.next_seq
+        matching_seqs = []
+        if self.filtered_rows is not None:
+            for index, record in enumerate(records):
+                if self.log_filter.match(
+                    record.getLevel(),
+                    record.time,
+                    record.getMessage().replace("\n", " ").strip(),
+                ):
+                    matching_seqs.append(new_seq + index)
+
+        if self.filtered_rows is None:
+            row = len(self.records)
+            self.beginInsertRows(qt_import.QModelIndex(), row, row + len(records) - 1)
+        elif matching_seqs:
+            row = len(self.filtered_rows)
+            self.beginInsertRows(
+                qt_import.QModelIndex(), row, row + len(matching_seqs) - 1
+            )
+
+        for record in records:
+            self.records.append(
+                record.getLevel(),
+                record.getLevelName(),
+                record.time,
+                record.getName(),
+                record.getMessage(),
+            )
+        if matching_seqs:
+            self.filtered_rows = np.concatenate(
+                (self.filtered_rows, np.array(matching_seqs, dtype=np.int64))
+            )
+
+        if self.filtered_rows is None or matching_seqs:
+            self.endInsertRows()
+
+    def remove_first_records(self, count):
+        """Removes the count oldest records and their rows"""
+        count = min(count, len(self.records))
+        if count <= 0:
+            return
+
+        if self.filtered_rows is None:
+            self.beginRemoveRows(qt_import.QModelIndex(), 0, count - 1)
+            self.records.remove_first(count)
+            self.endRemoveRows()
+            return
+
+        num_rows = int(
+            np.searchsorted(self.filtered_rows, self.records.first_seq + count)
+        )
+        if num_rows:
+            self.beginRemoveRows(qt_import.QModelIndex(), 0, num_rows - 1)
+        self.records.remove_first(count)
+        self.filtered_rows = self.filtered_rows[num_rows:]
+        if num_rows:
+            self.endRemoveRows()
+
+    def set_filter(self, log_filter):
+        """Sets a log_buffer.LogFilter, None to show all records"""
+        self.beginResetModel()
+        if log_filter is None or log_filter.is_empty():
+            self.log_filter = None
+            self.filtered_rows = None
+        else:
+            self.log_filter = log_filter
+            self.filtered_rows = self.records.query(log_filter)
+        self.endResetModel()
+
+    def set_capacity(self, capacity):
+        self.remove_first_records(len(self.records) - max(capacity, 1))
+        self.records.set_capacity(capacity)
+
+    def clear(self):
+        self.beginResetModel()
+        self.records.clear()
+        if self.filtered_rows is not None:
+            self.filtered_rows = np.empty(0, dtype=np.int64)
+        self.endResetModel()
+
+
+class CustomTreeWidget(qt_import.QTreeView):
     def __init__(self, parent, tab_label):
-        qt_import.QTreeWidget.__init__(self, parent)
+        qt_import.QTreeView.__init__(self, parent)
 
         self.setSizePolicy(qt_import.QSizePolicy.Minimum, qt_import.QSizePolicy.Expanding)
         self.tab_label = tab_label
         self.unread_messages = 0
         self.max_log_lines = None
 
-        self.setColumnCount(4)
+        self.log_model = LogTableModel(self)
+        self.setModel(self.log_model)
         self.setRootIsDecorated(False)
-        self.setHeaderLabels(["Level", "Date", "Time", "Message"])
+        self.setUniformRowHeights(True)
+        self.setItemsExpandable(False)
 
         self.contextMenuEvent = self.show_context_menu
         self.clipboard = qt_import.QApplication.clipboard()
 
     def add_log_line(self, record):
-        msg = record.getMessage().replace("\n", " ").strip()
-        info_str_list = []
-
-        info_str_list.append(record.getLevelName())
-        info_str_list.append(record.getDate())
-        info_str_list.append(record.getTime())
-        info_str_list.append(msg)
-        new_item = qt_import.QTreeWidgetItem(info_str_list)
-        self.addTopLevelItem(new_item)
-        if self.topLevelItemCount() % 10 == 0:
-            for col in range(4):
-                new_item.setBackground(col, qt_import.QBrush(colors.LIGHT_2_GRAY))
-
-        if self.max_log_lines and self.max_log_lines > 0:
-            if self.topLevelItemCount() > self.max_log_lines:
-                self.takeTopLevelItem(0)
+        self.add_log_lines([record])
+
+    def add_log_lines(self, records):
+        """Adds a batch of log records with a single model update"""
+        self.log_model.add_records(records)
+        self.scrollToBottom()
+
+    def clear(self):
+        self.log_model.clear()
+
+    def set_filter(self, levels=None, text=None, time_range=None):
+        """Shows only records of given levels, containing text and within
+           time range (start, end)
+        """
+        self.log_model.set_filter(log_buffer.LogFilter(levels, text, time_range))
         self.scrollToBottom()
 
     def set_max_log_lines(self, max_log_lines):
         self.max_log_lines = max_log_lines
+        if max_log_lines and max_log_lines > 0:
+            self.log_model.set_capacity(max_log_lines)
+        else:
+            self.log_model.set_capacity(log_buffer.DEFAULT_CAPACITY)
 
     def show_context_menu(self, context_menu_event):
         menu = qt_import.QMenu(self)
@@ -126,12 +287,12 @@ class CustomTreeWidget(qt_import.QTreeWidget):
 
     def copy_log(self):
         self.clipboard.clear(mode=self.clipboard.Clipboard)
-        text = ""
-        for item_index in range(self.topLevelItemCount()):
-            for col in range(4):
-                text += "%s%s" % (self.topLevelItem(item_index).text(col), chr(9))
-            text += "\n"
-        self.clipboard.setText(text, mode=self.clipboard.Clipboard)
+        lines = []
+        for row in range(self.log_model.rowCount()):
+            row_text = self.log_model.row_text(self.log_model.get_seq(row))
+            lines.append("".join("%s%s" % (text, chr(9)) for text in row_text))
+        lines.append("")
+        self.clipboard.setText("\n".join(lines), mode=self.clipboard.Clipboard)
 
     def save_log(self):
         self.copy_log()
@@ -303,6 +464,11 @@ class LogViewBrick(BaseWidget):
         self.define_slot("tabSelected", ())
 
         # Graphic elements ----------------------------------------------------
+        self.filter_ledit = qt_import.QLineEdit(self)
+        self.filter_ledit.setPlaceholderText("Filter messages")
+        self.filter_timer = qt_import.QTimer(self)
+        self.filter_timer.setSingleShot(True)
+
         self.tab_widget = qt_import.QTabWidget(self)
 
         self.details_log = CustomTreeWidget(self.tab_widget, "Errors and warnings")
@@ -323,6 +489,7 @@ class LogViewBrick(BaseWidget):
 
         # Layout --------------------------------------------------------------
         _main_vlayout = qt_import.QVBoxLayout(self)
+        _main_vlayout.addWidget(self.filter_ledit)
         _main_vlayout.addWidget(self.tab_widget)
         _main_vlayout.setSpacing(0)
         _main_vlayout.setContentsMargins(2, 2, 2, 2)
@@ -331,6 +498,8 @@ class LogViewBrick(BaseWidget):
         self.setSizePolicy(qt_import.QSizePolicy.Minimum, qt_import.QSizePolicy.Expanding)
 
         # Qt signal/slot connections ------------------------------------------
+        self.filter_ledit.textChanged.connect(self.filter_text_changed)
+        self.filter_timer.timeout.connect(self.apply_filter)
 
         # Other ---------------------------------------------------------------
         self.tab_levels = {
@@ -359,33 +528,52 @@ class LogViewBrick(BaseWidget):
         self.info_log.unread_messages = 0
         self.debug_log.unread_messages = 0
 
+    def filter_text_changed(self, text):
+        # filter is applied once typing pauses
+        self.filter_timer.start(200)
+
+    def apply_filter(self):
+        text = str(self.filter_ledit.text()).strip()
+        for log in (self.details_log, self.info_log, self.debug_log):
+            log.set_filter(text=text)
+
     def tabSelected(self, tab_name):
         if self["appearance"] == "list":
             if tab_name == self["myTabLabel"]:
                 self.resetUnreadMessagesSignal.emit(True)
 
     def append_log_record(self, record):
-        rec_level = record.getLevel()
+        self.append_log_records([record])
 
-        if rec_level == logging.DEBUG and not self["showDebug"]:
-            return
-        else:
-            if rec_level < self.filter_level:
-                return
-
-        tab = self.tab_levels[rec_level]
-        tab.add_log_line(record)
-
-        if self["appearance"] == "tabs":
-            if self.tab_widget.currentWidget() != tab:
-                if self["autoSwitchTabs"]:
-                    self.tab_widget.setCurrentWidget(tab)
-                else:
-                    tab.unread_messages += 1
-                    tab_label = "%s (%d)" % (tab.tab_label, tab.unread_messages)
-                    self.tab_widget.setTabText(self.tab_widget.indexOf(tab), tab_label)
-        elif self["appearance"] == "list":
-            self.incUnreadMessagesSignal.emit(1, True)
+    def append_log_records(self, records):
+        """Dispatches a batch of records to the tabs, one update per tab"""
+        records_by_tab = {}
+        for record in records:
+            rec_level = record.getLevel()
+
+            if rec_level == logging.DEBUG and not self["showDebug"]:
+                continue
+            elif rec_level < self.filter_level:
+                continue
+
+            tab = self.tab_levels.get(rec_level, self.info_log)
+            records_by_tab.setdefault(tab, []).append(record)
+
+        for tab, tab_records in records_by_tab.items():
+            tab.add_log_lines(tab_records)
+
+            if self["appearance"] == "tabs":
+                if self.tab_widget.currentWidget() != tab:
+                    if self["autoSwitchTabs"]:
+                        self.tab_widget.setCurrentWidget(tab)
+                    else:
+                        tab.unread_messages += len(tab_records)
+                        tab_label = "%s (%d)" % (tab.tab_label, tab.unread_messages)
+                        self.tab_widget.setTabText(
+                            self.tab_widget.indexOf(tab), tab_label
+                        )
+            elif self["appearance"] == "list":
+                self.incUnreadMessagesSignal.emit(len(tab_records), True)
 
     def resetUnreadMessages(self, tab_index):
         selected_tab = self.tab_widget.widget(tab_index)
@@ -394,7 +582,7 @@ class LogViewBrick(BaseWidget):
 
     def customEvent(self, event):
         if self.is_running():
-            self.append_log_record(event.record)
+            self.append_log_records(event.records)
 
     def blockSignals(self, block):
         pass
@@ -69,7 +69,9 @@ class MachineInfoBrick(BaseWidget):
         """Method called when user changes a property in the gui builder"""
         if HWR.beamline.machine_info is not None:
             self.setEnabled(True)
-            self.connect(HWR.beamline.machine_info, "valuesChanged", self.set_value)
+            self.connect(
+                HWR.beamline.machine_info, "valuesChanged", self.set_value, max_rate=2
+            )
         else:
             self.setEnabled(False)
 
@@ -588,6 +588,7 @@ class MotorSpinboxBrick(BaseWidget):
                 "valueChanged",
                 self.position_changed,
                 instance_filter=True,
+                max_rate=10,
             )
             self.connect(
                 self.motor_hwobj,
@@ -16,12 +16,21 @@
 #  You should have received a copy of the GNU Lesser General Public License
 #  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
 
-# import os
+import os
 import logging
 # from collections import namedtuple
 
+import gevent
+
 from mxcubeqt.base_components import BaseWidget
 from mxcubeqt.utils import queue_item, colors, qt_import
+from mxcubeqt.utils.lims_sample_cache import LimsSampleCache, DEFAULT_TTL
+from mxcubeqt.utils.queue_autosave import (
+    QueueAutoSave,
+    RedisQueueBackend,
+    FileQueueBackend,
+    restore_queue,
+)
 from mxcubeqt.utils.sample_changer_helper import SC_STATE_COLOR, SampleChanger
 from mxcubeqt.widgets.dc_tree_widget import DataCollectTree
 
@@ -68,6 +77,7 @@ class TreeBrick(BaseWidget):
     diffractometer_ready = qt_import.pyqtSignal(bool)
     sample_mount_started = qt_import.pyqtSignal()
     sample_mount_finished = qt_import.pyqtSignal()
+    lims_sample_lists_ready = qt_import.pyqtSignal(object)
 
     def __init__(self, *args):
         BaseWidget.__init__(self, *args)
@@ -83,8 +93,11 @@ class TreeBrick(BaseWidget):
         self.is_logged_in = False
         self.lims_samples = None
         self.filtered_lims_samples = None
+        self.lims_sample_cache = LimsSampleCache()
+        self.lims_request_id = 0
         self.compression_state = True
         self.queue_autosave_action = None
+        self.queue_autosave = QueueAutoSave()
         self.queue_undo_action = None
         self.queue_redo_action = None
         self.queue_sync_action = None
@@ -99,6 +112,9 @@ class TreeBrick(BaseWidget):
         self.add_property("useHistoryView", "boolean", True)
         self.add_property("useCentringMethods", "boolean", True)
         self.add_property("enableQueueAutoSave", "boolean", True)
+        self.add_property("queueAutoSaveDelay", "integer", 1000)
+        self.add_property("queueAutoSaveToFile", "boolean", False)
+        self.add_property("limsSampleCacheTTL", "integer", DEFAULT_TTL)
 
         # Properties to initialize hardware objects --------------------------
         self.add_property("hwobj_state_machine", "string", "")
@@ -160,6 +176,9 @@ class TreeBrick(BaseWidget):
         self.dc_tree_widget = DataCollectTree(self)
         self.dc_tree_widget.selection_changed_cb = self.selection_changed_cb
         self.dc_tree_widget.run_cb = self.run
+
+        self.filter_text_timer = qt_import.QTimer(self)
+        self.filter_text_timer.setSingleShot(True)
         # self.dc_tree_widget.clear_centred_positions_cb = \
         #    self.clear_centred_positions
 
@@ -183,7 +202,10 @@ class TreeBrick(BaseWidget):
             self.dc_tree_widget.set_centring_method
         )
         self.sample_changer_widget.synch_ispyb_button.clicked.connect(
-            self.refresh_sample_list
+            self.synch_ispyb_button_clicked
+        )
+        self.lims_sample_lists_ready.connect(
+            self.set_lims_sample_lists, qt_import.Qt.QueuedConnection
         )
         # self.sample_changer_widget.tree_options_button.clicked.connect(\
         #     self.open_tree_options_dialog)
@@ -193,6 +215,7 @@ class TreeBrick(BaseWidget):
         self.sample_changer_widget.filter_ledit.textChanged.connect(
             self.filter_text_changed
         )
+        self.filter_text_timer.timeout.connect(self.apply_text_filter)
         self.sample_changer_widget.sample_combo.activated.connect(
             self.sample_combo_changed
         )
@@ -346,10 +369,16 @@ class TreeBrick(BaseWidget):
             "Sync with ISPyB", self.queue_sync_clicked
         )
         self.queue_sync_action.setEnabled(False)
+        self.tools_menu.addAction(
+            "Reload samples from ISPyB", self.reload_lims_samples_clicked
+        )
 
         if BaseWidget._menubar is not None:
             BaseWidget._menubar.insert_menu(self.tools_menu, 1)
 
+        if self["useHistoryView"] and self.dc_tree_widget.history_store is None:
+            self.dc_tree_widget.load_history_queue_from_file()
+
         self.hide_dc_parameters_tab.emit(True)
         self.hide_dcg_tab.emit(True)
         self.hide_sample_centring_tab.emit(False)
@@ -386,6 +415,10 @@ class TreeBrick(BaseWidget):
                 self.connect(
                     xml_rpc_server_hwobj, "open_dialog", self.open_xmlrpc_dialog
                 )
+        elif property_name == "queueAutoSaveDelay":
+            self.queue_autosave.delay = new_value
+        elif property_name == "limsSampleCacheTTL":
+            self.lims_sample_cache.ttl = new_value
         elif property_name == "hwobj_state_machine":
             self.state_machine_hwobj = self.get_hardware_object(
                 new_value, optional=True
@@ -618,110 +651,204 @@ class TreeBrick(BaseWidget):
 
         return barcode_samples, l_samples
 
-    def refresh_sample_list(self):
-        """
-        Retrives sample information from ISPyB and populates the sample list
-        accordingly.
+    def synch_ispyb_button_clicked(self):
+        """Updates the sample list with the samples from ISPyB, cached
+           samples of the session are used if they did not expire
         """
-        log = logging.getLogger("user_level_log")
+        self.refresh_sample_list()
 
-        self.lims_samples = HWR.beamline.lims.get_samples(
-            HWR.beamline.session.proposal_id, HWR.beamline.session.session_id
-        )
+    def reload_lims_samples_clicked(self):
+        """Reloads the samples from ISPyB, bypassing the LIMS sample cache"""
+        if self.sample_changer_widget.synch_ispyb_button.isEnabled():
+            self.refresh_sample_list(use_cache=False)
 
-        basket_list = []
-        sample_list = []
-        self.filtered_lims_samples = []
-        sample_changer = None
-
-        self.sample_changer_widget.sample_combo.clear()
-        for sample in self.lims_samples:
-            try:
-                if sample.containerSampleChangerLocation:
-                    self.filtered_lims_samples.append(sample)
-                    item_text = "%s-%s" % (sample.proteinAcronym, sample.sampleName)
-                    self.sample_changer_widget.sample_combo.addItem(item_text)
-            except BaseException:
-                pass
-
-        self.sample_changer_widget.sample_label.setEnabled(True)
-        self.sample_changer_widget.sample_combo.setEnabled(True)
-        self.sample_changer_widget.sample_combo.setCurrentIndex(-1)
+    def refresh_sample_list(self, use_cache=True):
+        """
+        Retrives sample information from ISPyB and populates the sample list
+        accordingly. LIMS is queried and samples are matched with the sample
+        changer content in a greenlet, the GUI is updated once the lists
+        are ready (see set_lims_sample_lists).
 
+        :param use_cache: use samples cached for the current session
+        """
+        sample_changer = None
         if self.dc_tree_widget.sample_mount_method == 1:
             sample_changer = HWR.beamline.sample_changer
         elif self.dc_tree_widget.sample_mount_method == 2:
             sample_changer = HWR.beamline.plate_manipulator
 
-        # if len(self.lims_samples) == 0:
-        #    log.warning("No sample available in LIMS")
-        #    self.mount_mode_combo_changed(self.sample_changer_widget.filter_cbox.currentIndex())
-        #    return
-
+        sc_basket_content = None
+        sc_sample_content = None
         if sample_changer is not None:
-            (barcode_samples, location_samples) = self.dc_tree_widget.samples_from_lims(
-                self.lims_samples
-            )
             sc_basket_content, sc_sample_content = self.get_sc_content()
-            sc_basket_list, sc_sample_list = self.dc_tree_widget.samples_from_sc_content(
-                sc_basket_content, sc_sample_content
+
+        # a newer request makes results of the pending one obsolete
+        self.lims_request_id += 1
+        self.sample_changer_widget.synch_ispyb_button.setEnabled(False)
+        gevent.spawn(
+            self.get_lims_sample_lists,
+            self.lims_request_id,
+            HWR.beamline.session.proposal_id,
+            HWR.beamline.session.session_id,
+            sc_basket_content,
+            sc_sample_content,
+            use_cache,
+        )
+
+    def get_lims_sample_lists(
+        self,
+        request_id,
+        proposal_id,
+        session_id,
+        sc_basket_content,
+        sc_sample_content,
+        use_cache,
+    ):
+        """
+        Gets samples from LIMS (or the cache) and matches them with the
+        sample changer content. Runs in a greenlet, results are sent with
+        lims_sample_lists_ready.
+        :param request_id: id of the refresh_sample_list call
+        :param proposal_id: LIMS proposal id
+        :param session_id: LIMS session id
+        :param sc_basket_content: sample changer baskets or None
+        :param sc_sample_content: sample changer samples or None
+        :param use_cache: use samples cached for the session
+        :return: None
+        """
+        try:
+            lims_samples = self.lims_sample_cache.get_samples(
+                HWR.beamline.lims, proposal_id, session_id, refresh=not use_cache
             )
+            basket_list = None
+            sample_list = None
+            if sc_sample_content is not None:
+                basket_list, sample_list = self.match_lims_samples(
+                    lims_samples, sc_basket_content, sc_sample_content
+                )
+        except BaseException:
+            logging.getLogger("user_level_log").exception(
+                "Unable to get samples from ISPyB"
+            )
+            lims_samples, basket_list, sample_list = None, None, None
 
-            basket_list = sc_basket_list
+        self.lims_sample_lists_ready.emit(
+            (request_id, lims_samples, basket_list, sample_list)
+        )
 
-            # self.queue_sync_action.setEnabled(True)
-            for sc_sample in sc_sample_list:
-                # Get the sample in lims with the barcode
-                # sc_sample.code
-                lims_sample = barcode_samples.get(sc_sample.code)
-                # There was a sample with that barcode
+    def match_lims_samples(self, lims_samples, sc_basket_content, sc_sample_content):
+        """
+        Matches LIMS samples with the sample changer samples, by barcode
+        and then by location.
+        :param lims_samples: list of LIMS samples
+        :param sc_basket_content: sample changer baskets
+        :param sc_sample_content: sample changer samples
+        :return: (basket list, sample list)
+        """
+        log = logging.getLogger("user_level_log")
+
+        (barcode_samples, location_samples) = self.dc_tree_widget.samples_from_lims(
+            lims_samples
+        )
+        sc_basket_list, sc_sample_list = self.dc_tree_widget.samples_from_sc_content(
+            sc_basket_content, sc_sample_content
+        )
+
+        basket_list = sc_basket_list
+        sample_list = []
+
+        for sc_sample in sc_sample_list:
+            # Get the sample in lims with the barcode
+            # sc_sample.code
+            lims_sample = barcode_samples.get(sc_sample.code)
+            # There was a sample with that barcode
+            if lims_sample:
+                if lims_sample.lims_location == sc_sample.location:
+                    log.debug(
+                        "Found sample in ISPyB for location %s"
+                        % str(sc_sample.location)
+                    )
+                    sample_list.append(lims_sample)
+                else:
+                    log.warning(
+                        "The sample with the barcode (%s) exists" % sc_sample.code
+                        + " in LIMS but the location does not mat"
+                        + "ch. Sample changer location: %s, LIMS "
+                        % sc_sample.location
+                        + "location %s" % lims_sample.lims_location
+                    )
+                    sample_list.append(sc_sample)
+            else:  # No sample with that barcode, continue with location
+                lims_sample = location_samples.get(sc_sample.location)
                 if lims_sample:
-                    if lims_sample.lims_location == sc_sample.location:
-                        log.debug(
-                            "Found sample in ISPyB for location %s"
+                    if lims_sample.lims_code:
+                        log.warning(
+                            "The sample has a barcode in LIMS, but "
+                            + "the SC has no barcode information for "
+                            + "this sample. For location: %s"
                             % str(sc_sample.location)
                         )
                         sample_list.append(lims_sample)
                     else:
-                        log.warning(
-                            "The sample with the barcode (%s) exists" % sc_sample.code
-                            + " in LIMS but the location does not mat"
-                            + "ch. Sample changer location: %s, LIMS "
-                            % sc_sample.location
-                            + "location %s" % lims_sample.lims_location
+                        log.debug(
+                            "Found sample in ISPyB for location %s"
+                            % str(sc_sample.location)
                         )
-                        sample_list.append(sc_sample)
-                else:  # No sample with that barcode, continue with location
-                    lims_sample = location_samples.get(sc_sample.location)
+                        sample_list.append(lims_sample)
+                else:
                     if lims_sample:
-                        if lims_sample.lims_code:
+                        if lims_sample.lims_location is not None:
                             log.warning(
-                                "The sample has a barcode in LIMS, but "
-                                + "the SC has no barcode information for "
-                                + "this sample. For location: %s"
-                                % str(sc_sample.location)
-                            )
-                            sample_list.append(lims_sample)
-                        else:
-                            log.debug(
-                                "Found sample in ISPyB for location %s"
-                                % str(sc_sample.location)
+                                "No barcode was provided in ISPyB "
+                                + "which makes it impossible to verify if"
+                                + "the locations are correct, assuming "
+                                + "that the positions are correct."
                             )
                             sample_list.append(lims_sample)
                     else:
-                        if lims_sample:
-                            if lims_sample.lims_location is not None:
-                                log.warning(
-                                    "No barcode was provided in ISPyB "
-                                    + "which makes it impossible to verify if"
-                                    + "the locations are correct, assuming "
-                                    + "that the positions are correct."
-                                )
-                                sample_list.append(lims_sample)
-                        else:
-                            # log.warning("No sample in ISPyB for location %s" % \
-                            #            str(sc_sample.location))
-                            sample_list.append(sc_sample)
+                        # log.warning("No sample in ISPyB for location %s" % \
+                        #            str(sc_sample.location))
+                        sample_list.append(sc_sample)
+        return basket_list, sample_list
+
+    def set_lims_sample_lists(self, result):
+        """
+        Updates the sample combo and the sample tree with the result of
+        get_lims_sample_lists
+        :param result: (request id, lims samples, basket list, sample list)
+        :return: None
+        """
+        request_id, lims_samples, basket_list, sample_list = result
+        if request_id != self.lims_request_id:
+            return
+
+        self.sample_changer_widget.synch_ispyb_button.setEnabled(
+            self.dc_tree_widget.sample_mount_method < 2 and self.is_logged_in
+        )
+        if lims_samples is None:
+            return
+
+        self.lims_samples = lims_samples
+        self.filtered_lims_samples = []
+
+        self.sample_changer_widget.sample_combo.clear()
+        item_text_list = []
+        for sample in self.lims_samples:
+            try:
+                if sample.containerSampleChangerLocation:
+                    self.filtered_lims_samples.append(sample)
+                    item_text_list.append(
+                        "%s-%s" % (sample.proteinAcronym, sample.sampleName)
+                    )
+            except BaseException:
+                pass
+        self.sample_changer_widget.sample_combo.addItems(item_text_list)
+
+        self.sample_changer_widget.sample_label.setEnabled(True)
+        self.sample_changer_widget.sample_combo.setEnabled(True)
+        self.sample_changer_widget.sample_combo.setCurrentIndex(-1)
+
+        if sample_list is not None:
             self.dc_tree_widget.populate_tree_widget(
                 basket_list, sample_list, self.dc_tree_widget.sample_mount_method
             )
@@ -736,7 +863,7 @@ class TreeBrick(BaseWidget):
         sample_model = root_model.get_children()[0]
 
         sample_model.init_from_lims_object(self.filtered_lims_samples[index])
-        self.dc_tree_widget.sample_tree_widget.clear()
+        self.dc_tree_widget.clear_tree()
         self.dc_tree_widget.populate_free_pin(sample_model)
 
     def get_sc_content(self):
@@ -1021,97 +1148,34 @@ class TreeBrick(BaseWidget):
            11: XRF spectrum
         """
         self.sample_changer_widget.filter_ledit.setEnabled(filter_index in (2, 3, 4))
-        self.clear_filter()
-        if filter_index > 0:
-            item_iterator = qt_import.QTreeWidgetItemIterator(
-                self.dc_tree_widget.sample_tree_widget
-            )
-            item = item_iterator.value()
-            while item:
-                hide = False
-                item_model = item.get_model()
-                if filter_index == 1:
-                    hide = not item.has_star()
-                elif filter_index == 5:
-                    if isinstance(item, queue_item.DataCollectionQueueItem):
-                        hide = not item_model.is_executed()
-                elif filter_index == 6:
-                    if isinstance(item, queue_item.DataCollectionQueueItem):
-                        hide = item_model.is_executed()
-                elif filter_index == 7:
-                    if isinstance(item, queue_item.DataCollectionQueueItem):
-                        hide = item_model.is_helical()
-                    else:
-                        hide = True
-                elif filter_index == 8:
-                    if isinstance(item, queue_item.DataCollectionQueueItem):
-                        hide = not item_model.is_helical()
-                    else:
-                        hide = True
-                elif filter_index == 9:
-                    hide = not isinstance(item, queue_item.CharacterisationQueueItem)
-                elif filter_index == 10:
-                    hide = not isinstance(item, queue_item.EnergyScanQueueItem)
-                elif filter_index == 11:
-                    hide = not isinstance(item, queue_item.XRFSpectrumQueueItem)
-                # elif filter_index == 11:
-                #    hide = not isinstance(item, queue_item.AdvancedQueueItem)
-                if type(item) not in (
-                    queue_item.TaskQueueItem,
-                    queue_item.SampleQueueItem,
-                    queue_item.BasketQueueItem,
-                    queue_item.DataCollectionGroupQueueItem,
-                ):
-                    item.set_hidden(hide)
-                item_iterator += 1
-                item = item_iterator.value()
-
-        self.dc_tree_widget.hide_empty_baskets()
+        self.filter_text_timer.stop()
+
+        # star and executed states may have changed since the last filter
+        tree_filter = self.dc_tree_widget.tree_filter
+        tree_filter.invalidate()
+        hidden = tree_filter.get_criteria_hidden(filter_index)
+        tree_filter.apply(tree_filter.add_empty_groups(hidden))
 
     def filter_text_changed(self, new_text):
-        item_iterator = qt_import.QTreeWidgetItemIterator(
-            self.dc_tree_widget.sample_tree_widget
-        )
-        item = item_iterator.value()
-        filter_index = self.sample_changer_widget.filter_combo.currentIndex()
+        # filter is applied once typing pauses
+        self.filter_text_timer.start(200)
 
-        while item:
-            hide = False
-            new_text = str(new_text)
-            if filter_index == 2:
-                if isinstance(item, queue_item.SampleQueueItem):
-                    hide = not new_text in item.text(0)
-            elif filter_index == 3:
-                if isinstance(item, queue_item.SampleQueueItem):
-                    hide = not new_text in item.get_model().crystals[0].protein_acronym
-            elif filter_index == 4:
-                if isinstance(item, queue_item.BasketQueueItem):
-                    if new_text.isdigit():
-                        # Display one basket
-                        hide = int(new_text) != item.get_model().location[0]
-                    else:
-                        # Display several baskets. Separated with ","
-                        enable_baskat_list = new_text.split(",")
-                        if len(enable_baskat_list) > 1:
-                            hide = (
-                                item.get_model().location[0] not in enable_baskat_list
-                            )
-            item.set_hidden(hide)
-            item_iterator += 1
-            item = item_iterator.value()
+    def apply_text_filter(self):
+        """Filters sample treewidget based on the text of the filter line
+           edit and the selected filter criteria (see filter_combo_changed)
+        """
+        new_text = str(self.sample_changer_widget.filter_ledit.text())
+        filter_index = self.sample_changer_widget.filter_combo.currentIndex()
 
+        tree_filter = self.dc_tree_widget.tree_filter
+        hidden = tree_filter.get_text_hidden(filter_index, new_text)
         if filter_index != 3:
-            self.dc_tree_widget.hide_empty_baskets()
+            hidden = tree_filter.add_empty_groups(hidden)
+        tree_filter.apply(hidden)
 
     def clear_filter(self):
-        item_iterator = qt_import.QTreeWidgetItemIterator(
-            self.dc_tree_widget.sample_tree_widget
-        )
-        item = item_iterator.value()
-        while item:
-            item.set_hidden(False)
-            item_iterator += 1
-            item = item_iterator.value()
+        self.filter_text_timer.stop()
+        self.dc_tree_widget.tree_filter.apply(set())
 
     def diffractometer_phase_changed(self, phase):
         if self.enable_collect_conditions.get("diffractometer") != (
@@ -1196,39 +1260,83 @@ class TreeBrick(BaseWidget):
 
     def save_queue(self):
         """Saves queue in the file"""
-        if self.redis_client_hwobj is not None:
+        if self.queue_autosave.backend is not None:
+            self.queue_autosave.flush()
+        elif self.redis_client_hwobj is not None:
             self.redis_client_hwobj.save_queue()
         # else:
         #    self.dc_tree_widget.save_queue()
 
-    def auto_save_queue(self):
-        """Saves queue in the file"""
+    def auto_save_queue(self, *nodes):
+        """Requests a queue save. Requests are coalesced and only changed
+           task groups are saved (see QueueAutoSave)
+
+        :param nodes: changed queue model nodes
+        """
         if self.queue_autosave_action is not None:
             if (
                 self.queue_autosave_action.isChecked()
                 and self.dc_tree_widget.samples_initialized
             ):
-                if self.redis_client_hwobj is not None:
-                    self.redis_client_hwobj.save_queue()
-                # else:
-                #    self.dc_tree_widget.save_queue()
+                for node in nodes:
+                    self.queue_autosave.mark_dirty(node)
+                self.queue_autosave.schedule()
+
+    def get_queue_autosave_backend(self):
+        """Returns the queue autosave backend: redis if a redis client is
+           configured and active, files in the user directory if
+           queueAutoSaveToFile is set, otherwise None (no autosave)
+        """
+        redis_client_hwobj = self.redis_client_hwobj
+        if redis_client_hwobj is not None and redis_client_hwobj.active:
+            return RedisQueueBackend(
+                redis_client_hwobj.redis_client,
+                "mxcube:%s:%s:autosave"
+                % (redis_client_hwobj.proposal_id, redis_client_hwobj.beamline_name),
+            )
+        if self["queueAutoSaveToFile"]:
+            return FileQueueBackend(
+                os.path.join(
+                    self.user_file_directory,
+                    "queue_autosave",
+                    str(HWR.beamline.session.proposal_id),
+                )
+            )
+        return None
 
     def load_queue(self):
         """Loads queue from file"""
 
         loaded_model = None
-        if self.redis_client_hwobj is not None:
+        restored = None
+        self.queue_autosave.set_backend(self.get_queue_autosave_backend())
+        saved_queue = self.queue_autosave.load()
+
+        if saved_queue is not None:
+            loaded_model, records = saved_queue
+            if loaded_model:
+                HWR.beamline.queue_model.select_model(loaded_model)
+                restored = restore_queue(
+                    records, HWR.beamline.sample_view.get_scene_snapshot()
+                )
+            else:
+                loaded_model = None
+        elif self.redis_client_hwobj is not None:
             loaded_model = self.redis_client_hwobj.load_queue()
 
-            if loaded_model is not None:
-                self.dc_tree_widget.sample_tree_widget.clear()
-                model_map = {"free-pin": 0, "ispyb": 1, "plate": 2}
-                self.sample_changer_widget.filter_cbox.setCurrentIndex(
-                    model_map[loaded_model]
-                )
-                self.mount_mode_combo_changed(model_map[loaded_model])
-                self.select_last_added_item()
-                self.dc_tree_widget.scroll_to_item(self.dc_tree_widget.last_added_item)
+        if loaded_model is not None:
+            self.dc_tree_widget.clear_tree()
+            model_map = {"free-pin": 0, "ispyb": 1, "plate": 2}
+            self.sample_changer_widget.filter_cbox.setCurrentIndex(
+                model_map[loaded_model]
+            )
+            self.mount_mode_combo_changed(model_map[loaded_model])
+            self.select_last_added_item()
+            self.dc_tree_widget.scroll_to_item(self.dc_tree_widget.last_added_item)
+        if restored is not None:
+            # restored task groups have new node ids, they are saved under
+            # their previous keys
+            self.queue_autosave.remap(restored, [key for key, _ in records])
 
         return loaded_model
 
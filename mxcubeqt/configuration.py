@@ -20,12 +20,17 @@
 """Configuration
 """
 
-import imp
+import os
+import sys
+import json
+import time
 import logging
 import pprint
 import pickle
-
-import json
+import functools
+import importlib.util
+import importlib.machinery
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 try:
     import ruamel.yaml as yaml
@@ -34,23 +39,215 @@ except ImportError:
 
 
 from mxcubeqt import base_layout_items
+from mxcubeqt.utils import startup_profiler
 from mxcubeqt.utils.property_bag import PropertyBag
-from mxcubeqt.base_components import NullBrick
+from mxcubeqt.base_components import NullBrick, LazyBrick
 
 
 __credits__ = ["MXCuBE collaboration"]
 __license__ = "LGPLv3+"
 
 
+BRICK_MODULES_CACHE_FILENAME = "brick_modules_cache.json"
+BRICK_LOADER_MAX_WORKERS = 8
+
+_preloaded_modules = {}
+
+
+def find_module_spec(module_name, path_cache=None):
+    """Returns the module spec of a module found on sys.path
+
+    :param module_name: name of the module
+    :type module_name: str
+    :param path_cache: {module_name: (file path, mtime)}, the cached path is
+                       used when the file has not been modified since
+    :type path_cache: dict
+    """
+    if path_cache and module_name in path_cache:
+        file_path, mtime = path_cache[module_name]
+        try:
+            if os.path.getmtime(file_path) == mtime:
+                return importlib.util.spec_from_file_location(module_name, file_path)
+        except OSError:
+            pass
+    return importlib.machinery.PathFinder.find_spec(module_name)
+
+
+def exec_module_spec(spec):
+    """Creates and executes module from spec and registers it in sys.modules"""
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        sys.modules.pop(spec.name, None)
+        raise
+    return module
+
+
+def read_modules_path_cache(cache_dir):
+    """Reads the brick modules path cache from the user file directory.
+       Cache is discarded if sys.path has changed since it was written.
+    """
+    if not cache_dir:
+        return {}
+    try:
+        with open(os.path.join(cache_dir, BRICK_MODULES_CACHE_FILENAME)) as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+    if cache.get("sys_path") != sys.path:
+        return {}
+    return cache.get("modules", {})
+
+
+def write_modules_path_cache(cache_dir, path_cache):
+    """Writes the brick modules path cache to the user file directory"""
+    if not cache_dir:
+        return
+    try:
+        with open(
+            os.path.join(cache_dir, BRICK_MODULES_CACHE_FILENAME), "w"
+        ) as cache_file:
+            json.dump({"sys_path": sys.path, "modules": path_cache}, cache_file)
+    except OSError:
+        logging.getLogger().warning(
+            "Unable to write brick modules cache in %s" % cache_dir
+        )
+
+
+def get_brick_types(items_list, exclude=()):
+    """Returns the list of brick types used in a raw gui configuration
+
+    :param exclude: names of the bricks to ignore
+    """
+    brick_types = []
+    for item in items_list:
+        if "brick" in item:
+            if item["name"] not in exclude:
+                brick_types.append(item["type"])
+        else:
+            brick_types += get_brick_types(item["children"], exclude)
+    return brick_types
+
+
+def get_raw_property_value(item, property_name, default=None):
+    """Returns a property value of a raw gui configuration item"""
+    properties = item["properties"]
+    try:
+        if isinstance(properties, bytes):
+            properties = pickle.loads(properties)
+        for prop in properties:
+            if hasattr(prop, "get_name"):
+                if prop.get_name() == property_name:
+                    return prop.get_value()
+            elif prop["name"] == property_name:
+                return prop["value"]
+    except BaseException:
+        logging.getLogger().exception(
+            "Could not read property %s of %s" % (property_name, item["name"])
+        )
+    return default
+
+
+def get_lazy_brick_names(items_list):
+    """Returns the names of the bricks that are not visible at startup:
+       bricks of the tab pages other than the first one and bricks of the
+       windows (other than the main window) not shown at startup.
+    """
+    lazy_bricks = set()
+
+    def add_bricks(items_list):
+        for item in items_list:
+            if "brick" in item:
+                lazy_bricks.add(item["name"])
+            else:
+                add_bricks(item["children"])
+
+    def find_hidden_items(items_list, parent_type):
+        for index, item in enumerate(items_list):
+            if index > 0 and (
+                parent_type == "tab"
+                or (
+                    item["type"] == "window"
+                    and not get_raw_property_value(item, "show", True)
+                )
+            ):
+                add_bricks([item])
+            elif "brick" not in item:
+                find_hidden_items(item["children"], item["type"])
+
+    find_hidden_items(items_list, None)
+    return lazy_bricks
+
+
+def preload_modules(module_names, cache_dir=None, max_workers=None):
+    """Finds and imports brick modules with a pool of threads.
+       Imported modules are used by load_module during the next
+       Configuration.load, so only the widget construction is serial.
+       Module paths are cached in cache_dir, keyed by file mtime.
+
+    :returns: list of module names that could not be preloaded
+    """
+    path_cache = read_modules_path_cache(cache_dir)
+    new_path_cache = {}
+    failed_modules = []
+
+    def _import(module_name):
+        spec = find_module_spec(module_name, path_cache)
+        if spec is None:
+            raise ImportError("No module named %s" % module_name)
+        return spec, exec_module_spec(spec)
+
+    module_names = [
+        name for name in set(module_names) if name not in _preloaded_modules
+    ]
+    with ThreadPoolExecutor(
+        max_workers=max_workers or BRICK_LOADER_MAX_WORKERS
+    ) as executor:
+        futures = dict(
+            (executor.submit(_import, name), name) for name in module_names
+        )
+        for future in as_completed(futures):
+            module_name = futures[future]
+            try:
+                spec, module = future.result()
+            except BaseException:
+                # import is retried serially by load_module, that logs the error
+                failed_modules.append(module_name)
+                continue
+            _preloaded_modules[module_name] = module
+            if spec.has_location and spec.submodule_search_locations is None:
+                try:
+                    new_path_cache[module_name] = (
+                        spec.origin,
+                        os.path.getmtime(spec.origin),
+                    )
+                except OSError:
+                    pass
+
+    path_cache.update(new_path_cache)
+    write_modules_path_cache(cache_dir, path_cache)
+
+    return failed_modules
+
+
+def clear_preloaded_modules():
+    """Forgets preloaded modules, next load_module reloads from source"""
+    _preloaded_modules.clear()
+
+
 def load_module(brick_name):
     """Loads module"""
-    fp = None
+    if brick_name in _preloaded_modules:
+        return _preloaded_modules[brick_name]
+
     try:
-        fp, path_name, description = imp.find_module(brick_name)
-        mod = imp.load_module(brick_name, fp, path_name, description)
+        spec = find_module_spec(brick_name)
+        if spec is None:
+            raise ImportError("No module named %s" % brick_name)
+        mod = exec_module_spec(spec)
     except BaseException:
-        if fp:
-            fp.close()
         logging.getLogger().exception("Cannot import module %s", brick_name)
         return None
     else:
@@ -79,7 +276,11 @@ def load_brick(brick_type, brick_name):
             return NullBrick(None, brick_name)
         else:
             try:
+                start_time = time.time()
                 new_instance = class_obj(None, brick_name)
+                startup_profiler.add_brick_time(
+                    brick_name, "init", time.time() - start_time, brick_type
+                )
             except BaseException:
                 logging.getLogger("HWR").exception(
                     "Cannot load brick %s : initialization failed", brick_name
@@ -112,8 +313,11 @@ class Configuration:
         "vsplitter": base_layout_items.SplitterCfg,
     }
 
-    def __init__(self, config=None):
-        """__init__ method"""
+    def __init__(self, config=None, lazy_bricks=()):
+        """__init__ method
+
+        :param lazy_bricks: names of the bricks to create when first shown
+        """
         self.has_changed = False
 
         if config is None:
@@ -122,7 +326,7 @@ class Configuration:
             self.bricks = {}
             self.items = {}
         else:
-            self.load(config)
+            self.load(config, lazy_bricks)
 
     def find_container(self, container_name):
         """Returns container
@@ -554,8 +758,12 @@ class Configuration:
 
                 return True
 
-    def load(self, config):
-        """Loads config"""
+    def load(self, config, lazy_bricks=()):
+        """Loads config
+
+        :param lazy_bricks: names of the bricks to replace by a LazyBrick
+                            placeholder, created when first shown
+        """
         self.windows_list = []
         self.windows = {}
         self.bricks = {}
@@ -570,7 +778,14 @@ class Configuration:
                 new_item = None
 
                 if "brick" in child:
-                    brick = load_brick(child["type"], child["name"])
+                    if child["name"] in lazy_bricks:
+                        brick = LazyBrick(
+                            None,
+                            child["name"],
+                            functools.partial(load_brick, child["type"], child["name"]),
+                        )
+                    else:
+                        brick = load_brick(child["type"], child["name"])
                     child["brick"] = brick
 
                     new_item = base_layout_items.BrickCfg(child["name"], child["type"])
@@ -619,6 +834,8 @@ class Configuration:
                 index += 1
 
         load_children(self.windows_list)
+        # later loads (add or reload brick) must use the current sources
+        clear_preloaded_modules()
 
     def is_container(self, item):
         """
@@ -20,6 +20,7 @@
 """GUISupervisor"""
 
 import os
+import time
 import stat
 import json
 import pickle
@@ -29,8 +30,15 @@ import collections
 from ruamel.yaml import YAML
 
 from mxcubeqt import configuration, gui_builder
-from mxcubeqt.utils import gui_display, icons, colors, qt_import
-from mxcubeqt.base_components import BaseWidget, NullBrick
+from mxcubeqt.utils import gui_display, icons, colors, qt_import, startup_profiler
+from mxcubeqt.utils import gui_config_cache
+from mxcubeqt.utils.hardware_object_prefetch import HardwareObjectPrefetch
+from mxcubeqt.base_components import (
+    BaseWidget,
+    NullBrick,
+    LazyBrick,
+    log_signal_statistics,
+)
 
 from mxcubecore import HardwareRepository as HWR
 
@@ -63,6 +71,7 @@ class SplashScreen(qt_import.QSplashScreen):
         qt_import.QSplashScreen.__init__(self, pixmap)
 
         self._message = ""
+        self._timing_message = ""
         self.gui_name = None
 
         self.top_x = 10
@@ -94,6 +103,11 @@ class SplashScreen(qt_import.QSplashScreen):
         self._message = message
         self.repaint()
 
+    def set_timing_message(self, message):
+        """Sets the line displaying the duration of the last startup phase"""
+        self._timing_message = message
+        self.repaint()
+
     def set_progress_value(self, value):
         """Sets the progress bar value"""
         self.progress_bar.setValue(value)
@@ -129,6 +143,17 @@ class SplashScreen(qt_import.QSplashScreen):
             qt_import.Qt.AlignLeft | qt_import.Qt.AlignBottom,
             self._message,
         )
+
+        top_y = bot_y
+        bot_y += 2 + painter.fontMetrics().height()
+        painter.drawText(
+            qt_import.QRect(
+                qt_import.QPoint(self.top_x, top_y),
+                qt_import.QPoint(self.right_x, bot_y)
+            ),
+            qt_import.Qt.AlignLeft | qt_import.Qt.AlignBottom,
+            self._timing_message,
+        )
         self.progress_bar.setGeometry(10, self.top_y + 50, self.right_x, 20)
 
 class GUISupervisor(qt_import.QWidget):
@@ -137,8 +162,14 @@ class GUISupervisor(qt_import.QWidget):
     brickChangedSignal = qt_import.pyqtSignal(str, str, str, tuple, bool)
     tabChangedSignal = qt_import.pyqtSignal(str, int)
 
-    def __init__(self, design_mode=False, show_maximized=False, no_border=False):
-        """Main mxcube gui widget"""
+    def __init__(
+        self, design_mode=False, show_maximized=False, no_border=False, lazy_bricks=False
+    ):
+        """Main mxcube gui widget
+
+        :param lazy_bricks: create the bricks of hidden tab pages and
+                            windows when they are first shown
+        """
 
         qt_import.QWidget.__init__(self)
 
@@ -152,6 +183,8 @@ class GUISupervisor(qt_import.QWidget):
         self.hardware_repository = HWR.get_hardware_repository()
         self.show_maximized = show_maximized
         self.no_border = no_border
+        self.lazy_bricks = lazy_bricks
+        self.hardware_object_prefetch = None
         self.windows = []
 
         self.splash_screen = SplashScreen(icons.load_pixmap("splash"))
@@ -160,6 +193,30 @@ class GUISupervisor(qt_import.QWidget):
         self.splash_screen.show()
 
         self.time_stamp = 0
+        self.startup_start_time = time.time()
+        self.startup_phase_times = []
+
+    def startup_phase_done(self, phase_name, start_time):
+        """Reports duration of a startup phase in the log and splash screen
+
+        :param phase_name: name of the phase
+        :type phase_name: str
+        :param start_time: time.time() when the phase started
+        :type start_time: float
+        :returns: current time, to be used as start of the next phase
+        """
+        end_time = time.time()
+        duration = end_time - start_time
+        self.startup_phase_times.append((phase_name, duration))
+        startup_profiler.add_phase(phase_name, duration)
+        logging.getLogger("HWR").info(
+            "Startup phase '%s' done in %.2f s" % (phase_name, duration)
+        )
+        if getattr(self, "splash_screen", None) is not None:
+            self.splash_screen.set_timing_message(
+                "%s: %.2f s" % (phase_name, duration)
+            )
+        return end_time
 
     def set_user_file_directory(self, user_file_directory):
         """Sets user file directory"""
@@ -204,7 +261,7 @@ class GUISupervisor(qt_import.QWidget):
                     # (using the 'require' feature from Hardware Repository)
 
                     def __get_mnemonics(items_list):
-                        """Gets mnemonics"""
+                        """Gets mnemonics as a list of (brick name, mnemonic)"""
 
                         mne_list = []
 
@@ -231,7 +288,9 @@ class GUISupervisor(qt_import.QWidget):
                                             if isinstance(
                                                     prop_value, type("")
                                             ) and prop_value.startswith("/"):
-                                                mne_list.append(prop_value)
+                                                mne_list.append(
+                                                    (item["name"], prop_value)
+                                                )
                                     except BaseException:
                                         logging.exception(
                                             "Could not "
@@ -250,28 +309,96 @@ class GUISupervisor(qt_import.QWidget):
                     )
                     failed_msg += "Starting in designer mode with clean GUI."
 
-                    raw_config = None
-                    try:
-                        if gui_config_file.endswith(".json"):
-                            raw_config = json.load(gui_file)
-                        elif gui_config_file.endswith(".yml"):
-                            yaml = YAML(typ='safe', pure=True)
-                            raw_config = yaml.load(gui_file)
+                    phase_start = time.time()
+                    cached_config = gui_config_cache.read(
+                        self.user_file_dir, gui_config_file
+                    )
+                    if cached_config is not None:
+                        raw_config, brick_mnemonics = cached_config
+                        phase_start = self.startup_phase_done(
+                            "Reading GUI file (cached)", phase_start
+                        )
+                    else:
+                        raw_config = None
+                        brick_mnemonics = []
+                        try:
+                            if gui_config_file.endswith(".json"):
+                                raw_config = json.load(gui_file)
+                            elif gui_config_file.endswith(".yml"):
+                                yaml = YAML(typ='safe', pure=True)
+                                raw_config = yaml.load(gui_file)
+                            else:
+                                raw_config = eval(gui_file.read())
+                        except BaseException:
+                            logging.getLogger().exception(failed_msg)
                         else:
-                            raw_config = eval(gui_file.read())
-                    except BaseException:
-                        logging.getLogger().exception(failed_msg)
+                            # also deserializes the brick properties
+                            brick_mnemonics = __get_mnemonics(raw_config)
+                            gui_config_cache.write(
+                                self.user_file_dir,
+                                gui_config_file,
+                                raw_config,
+                                brick_mnemonics,
+                            )
+
+                        phase_start = self.startup_phase_done(
+                            "Reading GUI file", phase_start
+                        )
+
+                    lazy_bricks = set()
+                    if self.lazy_bricks and not self.launch_in_design_mode:
+                        try:
+                            lazy_bricks = configuration.get_lazy_brick_names(
+                                raw_config
+                            )
+                        except BaseException:
+                            logging.getLogger("GUI").exception(
+                                "Could not find the bricks to load lazily"
+                            )
+                        else:
+                            logging.getLogger("HWR").info(
+                                "%d bricks will be created when first shown"
+                                % len(lazy_bricks)
+                            )
 
                     self.splash_screen.set_message("Gathering H/O info...")
                     self.splash_screen.set_progress_value(10)
-                    mnemonics = __get_mnemonics(raw_config)
+                    mnemonics = [
+                        mnemonic
+                        for brick_name, mnemonic in brick_mnemonics
+                        # lazy bricks require their mnemonics when shown
+                        if brick_name not in lazy_bricks
+                    ]
                     self.hardware_repository.require(mnemonics)
+                    # loads the hardware objects while the bricks are built
+                    self.hardware_object_prefetch = HardwareObjectPrefetch(
+                        self.hardware_repository
+                    )
+                    self.hardware_object_prefetch.start(mnemonics)
                     gui_file.close()
+                    phase_start = self.startup_phase_done(
+                        "Starting hardware object prefetch", phase_start
+                    )
+
+                    self.splash_screen.set_message("Loading brick modules...")
+                    self.splash_screen.set_progress_value(15)
+                    try:
+                        brick_types = configuration.get_brick_types(
+                            raw_config, lazy_bricks
+                        )
+                        configuration.preload_modules(brick_types, self.user_file_dir)
+                    except BaseException:
+                        logging.getLogger("GUI").exception(
+                            "Could not preload brick modules"
+                        )
+                    phase_start = self.startup_phase_done(
+                        "Loading brick modules", phase_start
+                    )
 
                     try:
                         self.splash_screen.set_message("Building GUI configuration...")
                         self.splash_screen.set_progress_value(20)
-                        config = configuration.Configuration(raw_config)
+                        config = configuration.Configuration(raw_config, lazy_bricks)
                     except BaseException:
                         logging.getLogger("GUI").exception(failed_msg)
                         qt_import.QMessageBox.warning(
@@ -279,6 +406,13 @@ class GUISupervisor(qt_import.QWidget):
                         )
                     else:
                         self.configuration = config
+                    phase_start = self.startup_phase_done(
+                        "Building bricks", phase_start
+                    )
+                    self.hardware_object_prefetch.finish()
+                    phase_start = self.startup_phase_done(
+                        "Waiting for prefetched hardware objects", phase_start
+                    )
 
                     try:
                         user_settings_filename = os.path.join(
@@ -365,9 +499,11 @@ class GUISupervisor(qt_import.QWidget):
 
     def execute(self, config):
         """Start in execution mode"""
+        phase_start = time.time()
         self.splash_screen.set_message("Executing configuration...")
         self.splash_screen.set_progress_value(90)
         self.display()
+        phase_start = self.startup_phase_done("Creating windows", phase_start)
 
         main_window = None
 
@@ -417,7 +553,11 @@ class GUISupervisor(qt_import.QWidget):
                                 )
                             else:
                                 try:
-                                    slot = getattr(receiver, connection["slot"])
+                                    if isinstance(receiver, LazyBrick):
+                                        # calls are queued until the brick is shown
+                                        slot = receiver.get_slot(connection["slot"])
+                                    else:
+                                        slot = getattr(receiver, connection["slot"])
                                     # etattr(sender, connection["signal"]).connect(slot)
                                 except AttributeError:
                                     logging.getLogger().error(
@@ -425,7 +565,9 @@ class GUISupervisor(qt_import.QWidget):
                                         + "in receiver %s" % _receiver
                                     )
                                 else:
-                                    if not isinstance(sender, NullBrick):
+                                    if isinstance(sender, LazyBrick):
+                                        sender.add_connection(connection["signal"], slot)
+                                    elif not isinstance(sender, NullBrick):
                                         getattr(sender, connection["signal"]).connect(slot)
                                     # sender.connect(sender,
                                     #    QtCore.SIGNAL(connection["signal"]),
@@ -435,11 +577,13 @@ class GUISupervisor(qt_import.QWidget):
             self.splash_screen.set_progress_value(95)
             self.splash_screen.set_message("Connecting bricks...")
             make_connections(config.windows_list)
+            phase_start = self.startup_phase_done("Connecting bricks", phase_start)
 
             # set run mode for every brick
             self.splash_screen.set_progress_value(100)
             self.splash_screen.set_message("Setting run mode...")
             BaseWidget.set_run_mode(True)
+            phase_start = self.startup_phase_done("Setting run mode", phase_start)
 
             if self.show_maximized:
                 main_window.showMaximized()
@@ -454,6 +598,11 @@ class GUISupervisor(qt_import.QWidget):
             BaseWidget._menubar.set_exp_mode(False)
 
         HWR.beamline.force_emit_signals()
+        self.startup_phase_done("Emitting initial signals", phase_start)
+        logging.getLogger("HWR").info(
+            "MXCuBE started in %.2f s" % (time.time() - self.startup_start_time)
+        )
+        startup_profiler.write_report(self.user_file_dir)
 
         return main_window
 
@@ -461,6 +610,7 @@ class GUISupervisor(qt_import.QWidget):
         """Finalize gui load"""
 
         BaseWidget.set_run_mode(False)  # call .stop() for each brick
+        log_signal_statistics()
 
         self.hardware_repository.close()
 
@@ -0,0 +1,153 @@
+#
+#  Project: MXCuBE
+#  https://github.com/mxcube
+#
+#  This file is part of MXCuBE software.
+#
+#  MXCuBE is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MXCuBE is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Min/max decimation of long curves, used by the plotting widgets.
+
+A curve is drawn with about two points per pixel: the points of the
+visible x range are split in bins and the minimum and maximum of every
+bin are kept (in their original order), so that peaks and spikes are
+never dropped.
+
+Bins have a power of two size (the zoom level). The indexes of the
+minima and maxima of all bins of a level are computed once per data
+update and cached, panning and zooming only slice the bins of the
+visible range. The first and last points and the extrema of the curve
+outside the visible range are always kept, so that the data bounds
+(used for autoscaling) are the ones of the full curve.
+"""
+
+import numpy as np
+
+__credits__ = ["MXCuBE collaboration"]
+__license__ = "LGPLv3+"
+
+
+DEFAULT_NUM_PIXELS = 1000
+# curves with less points per pixel are not decimated
+POINTS_PER_PIXEL = 2
+
+
+def get_minmax_indexes(y_array, bin_size):
+    """Returns the indexes of the minimum and maximum of every bin
+
+    :param y_array: 1D array
+    :param bin_size: number of points per bin (last bin may be shorter)
+    :returns: (min indexes, max indexes) arrays, one item per bin
+    """
+    num_full = y_array.size // bin_size * bin_size
+    bins = y_array[:num_full].reshape(-1, bin_size)
+    offsets = np.arange(0, num_full, bin_size)
+    min_indexes = bins.argmin(axis=1) + offsets
+    max_indexes = bins.argmax(axis=1) + offsets
+    if num_full < y_array.size:
+        tail = y_array[num_full:]
+        min_indexes = np.append(min_indexes, num_full + tail.argmin())
+        max_indexes = np.append(max_indexes, num_full + tail.argmax())
+    return min_indexes, max_indexes
+
+
+class CurveDecimator(object):
+    """Min/max decimated views of a curve, cached per zoom level"""
+
+    def __init__(self, y_array=None, x_array=None):
+        """
+        :param y_array: y values
+        :param x_array: x values, point index if None
+        """
+        self.x_array = None
+        self.y_array = None
+        self._sorted = True
+        # bin size -> (min indexes, max indexes)
+        self._levels = {}
+        if y_array is not None:
+            self.set_data(y_array, x_array)
+
+    def set_data(self, y_array, x_array=None):
+        """Sets the curve data, cached levels are discarded"""
+        self.y_array = np.asarray(y_array).ravel()
+        if x_array is None:
+            self.x_array = np.arange(self.y_array.size)
+            self._sorted = True
+        else:
+            self.x_array = np.asarray(x_array).ravel()
+            self._sorted = bool(np.all(self.x_array[1:] >= self.x_array[:-1]))
+        self._levels = {}
+
+    def get_level(self, bin_size):
+        if bin_size not in self._levels:
+            self._levels[bin_size] = get_minmax_indexes(self.y_array, bin_size)
+        return self._levels[bin_size]
+
+    def get_visible_range(self, x_range):
+        """Returns the (first, last + 1) indexes of the points in x_range"""
+        size = self.y_array.size
+        if x_range is None or not self._sorted:
+            return 0, size
+        first = int(np.searchsorted(self.x_array, min(x_range), "left"))
+        last = int(np.searchsorted(self.x_array, max(x_range), "right"))
+        # neighbours, the curve goes to the edges of the view
+        return max(first - 1, 0), min(last + 1, size)
+
+    def get_indexes(self, x_range=None, num_pixels=DEFAULT_NUM_PIXELS):
+        """Returns the sorted indexes of the points to draw
+
+        :param x_range: visible (x min, x max), None for the whole curve
+        :param num_pixels: width of the plot in pixels
+        """
+        size = 0 if self.y_array is None else self.y_array.size
+        if size <= POINTS_PER_PIXEL * num_pixels:
+            return np.arange(size)
+
+        first, last = self.get_visible_range(x_range)
+        num_visible = last - first
+        if num_visible <= POINTS_PER_PIXEL * num_pixels:
+            indexes = np.arange(first, last)
+        else:
+            bin_size = 1 << int(np.log2(num_visible / float(num_pixels)))
+            min_indexes, max_indexes = self.get_level(bin_size)
+            first_bin = first // bin_size
+            last_bin = (last - 1) // bin_size + 1
+            indexes = np.concatenate(
+                (min_indexes[first_bin:last_bin], max_indexes[first_bin:last_bin])
+            )
+
+        outside = [indexes, [0, size - 1]]
+        if first > 0:
+            outside.append(
+                [self.y_array[:first].argmin(), self.y_array[:first].argmax()]
+            )
+        if last < size:
+            outside.append(
+                [last + self.y_array[last:].argmin(), last + self.y_array[last:].argmax()]
+            )
+        return np.unique(np.concatenate(outside).astype(int))
+
+    def get_data(self, x_range=None, num_pixels=DEFAULT_NUM_PIXELS):
+        """Returns the decimated x and y arrays
+
+        :param x_range: visible (x min, x max), None for the whole curve
+        :param num_pixels: width of the plot in pixels
+        """
+        if self.y_array is None:
+            return np.empty(0), np.empty(0)
+        indexes = self.get_indexes(x_range, num_pixels)
+        if indexes.size == self.y_array.size:
+            return self.x_array, self.y_array
+        return self.x_array[indexes], self.y_array[indexes]
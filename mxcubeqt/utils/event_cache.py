@@ -0,0 +1,168 @@
+#
+#  Project: MXCuBE
+#  https://github.com/mxcube
+#
+#  This file is part of MXCuBE software.
+#
+#  MXCuBE is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MXCuBE is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Cache of gui events received while the instance does not mirror them
+(slave mode with mirroring prevented).
+
+Only the last event of a slot is kept. Events are kept ordered by
+timestamp as they are added, so that replay consumes them from the
+front without sorting the whole cache. The cache is bounded: the oldest
+events are evicted when max_size is reached.
+"""
+
+import time
+import weakref
+import logging
+import collections
+
+__credits__ = ["MXCuBE collaboration"]
+__license__ = "LGPLv3+"
+
+
+DEFAULT_MAX_SIZE = 5000
+
+
+def get_slot_key(slot):
+    """Returns a key identifying a slot. Bound methods of the same object
+       give the same key, even if they are different method objects. The
+       object is weakly referenced, so the key of a freed object is never
+       matched by a new object.
+    """
+    try:
+        obj, func = slot.__self__, slot.__func__
+    except AttributeError:
+        return slot
+    try:
+        key = (weakref.ref(obj), func)
+        hash(key)
+        return key
+    except TypeError:
+        # object not weakly referenceable or not hashable: bound methods
+        # are compared by object identity, the object is kept alive
+        # while its event is cached
+        return slot
+
+
+class EventCache(object):
+    """Bounded, ordered cache of events keyed by slot"""
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        """
+        :param max_size: maximal number of cached events
+        """
+        self.max_size = max_size
+        self._events = collections.OrderedDict()
+        self._last_timestamp = None
+        self._ordered = True
+        self.reset_statistics()
+
+    def __len__(self):
+        return len(self._events)
+
+    def reset_statistics(self):
+        """Clears counters"""
+        self.stats = {
+            "added": 0,
+            "replaced": 0,
+            "evicted": 0,
+            "replayed": 0,
+            "failed": 0,
+            "max_length": 0,
+        }
+
+    def get_statistics(self):
+        """Returns counters and current length of the cache"""
+        statistics = dict(self.stats)
+        statistics["length"] = len(self._events)
+        return statistics
+
+    def add(self, key, timestamp, method_ref, args):
+        """Adds an event. A previous event of the same slot is replaced.
+
+        :param key: slot key (see get_slot_key)
+        :param timestamp: event time in seconds
+        :param method_ref: callable returning the slot or None
+        :param args: slot arguments
+        """
+        self.stats["added"] += 1
+        if self._events.pop(key, None) is not None:
+            self.stats["replaced"] += 1
+
+        if self._last_timestamp is not None and timestamp < self._last_timestamp:
+            # events of remote instances may arrive slightly out of order,
+            # they are sorted once before the next replay
+            self._ordered = False
+        else:
+            self._last_timestamp = timestamp
+        self._events[key] = (timestamp, method_ref, args)
+
+        while len(self._events) > self.max_size:
+            self._events.popitem(last=False)
+            self.stats["evicted"] += 1
+        self.stats["max_length"] = max(self.stats["max_length"], len(self._events))
+
+    def discard(self, key):
+        """Removes the event of a slot, e.g. once a newer event has been
+           delivered to it
+        """
+        if self._events:
+            self._events.pop(key, None)
+
+    def clear(self):
+        """Removes all events"""
+        self._events.clear()
+        self._last_timestamp = None
+        self._ordered = True
+
+    def _sort(self):
+        self._events = collections.OrderedDict(
+            sorted(self._events.items(), key=lambda item: item[1][0])
+        )
+        self._ordered = True
+
+    def replay(self, time_budget=None):
+        """Calls the cached slots in timestamp order. Replayed events are
+           removed from the cache.
+
+        :param time_budget: maximal replay time (s), None: replay all events
+        :returns: number of events left in the cache
+        """
+        if not self._ordered:
+            self._sort()
+
+        start_time = time.time()
+        while self._events:
+            if time_budget is not None and time.time() - start_time > time_budget:
+                break
+            _, (timestamp, method_ref, args) = self._events.popitem(last=False)
+            try:
+                method = method_ref()
+                if method is not None:
+                    method(*args)
+                    self.stats["replayed"] += 1
+            except BaseException:
+                self.stats["failed"] += 1
+                logging.getLogger("HWR").debug(
+                    "Could not replay cached event %s", str(method_ref)
+                )
+
+        if not self._events:
+            self._last_timestamp = None
+        return len(self._events)
@@ -0,0 +1,104 @@
+#
+#  Project: MXCuBE
+#  https://github.com/mxcube
+#
+#  This file is part of MXCuBE software.
+#
+#  MXCuBE is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MXCuBE is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+gevent loop telling when gevent has to run next.
+
+When the Qt event loop waits for events, the gevent loop never blocks
+and libev cannot wake it up for expired timers and callbacks. The
+TimerTrackingLoop is the libev loop of gevent keeping:
+
+ - its active timers (gevent.sleep, timeouts...), next_timer_delay()
+   returns the time until the first one expires,
+ - the number of callbacks scheduled (spawned or woken up greenlets),
+ - a function called when another thread schedules a callback.
+
+It has to be the loop of the hub, install() must be called before the
+hub is created (before gevent.monkey.patch_all). This module is imported
+before the monkey patching, it only depends on gevent.
+"""
+
+import os
+import time
+
+import gevent
+
+try:
+    from gevent.libev.corecext import loop as libev_loop
+except ImportError:
+    libev_loop = None
+
+__credits__ = ["MXCuBE collaboration"]
+__license__ = "LGPLv3+"
+
+
+def install():
+    """Makes TimerTrackingLoop the loop of the gevent hubs
+
+    :returns: True if installed, False if the libev loop is not available
+              or another loop was requested (GEVENT_LOOP)
+    """
+    if TimerTrackingLoop is None or "GEVENT_LOOP" in os.environ:
+        return False
+    gevent.config.loop = TimerTrackingLoop
+    return True
+
+
+if libev_loop is None:
+    TimerTrackingLoop = None
+else:
+
+    class TimerTrackingLoop(libev_loop):
+        """libev loop keeping its active timers and counting its callbacks"""
+
+        def __init__(self, *args, **kwargs):
+            libev_loop.__init__(self, *args, **kwargs)
+            # timers are only kept when track_timers is set
+            self.track_timers = False
+            self.timers = set()
+            self.callback_count = 0
+            # called (in the calling thread) by run_callback_threadsafe
+            self.threadsafe_callback_hook = None
+
+        def timer(self, *args, **kwargs):
+            watcher = libev_loop.timer(self, *args, **kwargs)
+            if self.track_timers:
+                self.timers.add(watcher)
+            return watcher
+
+        def run_callback(self, *args, **kwargs):
+            self.callback_count += 1
+            return libev_loop.run_callback(self, *args, **kwargs)
+
+        def run_callback_threadsafe(self, *args, **kwargs):
+            result = libev_loop.run_callback_threadsafe(self, *args, **kwargs)
+            if self.threadsafe_callback_hook is not None:
+                self.threadsafe_callback_hook()
+            return result
+
+        def next_timer_delay(self):
+            """Returns the time (s) until the first active timer expires,
+               None if there is no active timer. Expired and stopped
+               timers are forgotten.
+            """
+            self.timers = set(watcher for watcher in self.timers if watcher.active)
+            if not self.timers:
+                return None
+            # libev timers are in monotonic time
+            return min(watcher.at for watcher in self.timers) - time.monotonic()
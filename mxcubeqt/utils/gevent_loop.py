@@ -0,0 +1,299 @@
+#
+#  Project: MXCuBE
+#  https://github.com/mxcube
+#
+#  This file is part of MXCuBE software.
+#
+#  MXCuBE is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MXCuBE is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Integration of the gevent hub in the Qt event loop.
+
+Two modes are available:
+
+ - "poll" : gevent is pumped by a zero-interval QTimer (historical
+            behaviour, default)
+ - "event": gevent runs when its backend file descriptor becomes
+            readable (I/O ready), when Qt goes idle with greenlets
+            scheduled by the Qt slots, when another thread schedules a
+            callback, and when the first gevent timer (sleep, timeout)
+            expires. Needs the TimerTrackingLoop (see gevent_hub_loop).
+            A fallback timer runs gevent at least every max_interval for
+            the events gevent cannot signal (e.g. async watchers).
+"""
+
+import os
+import math
+import time
+import logging
+
+import gevent
+
+from mxcubeqt.utils import qt_import
+from mxcubeqt.utils.gevent_hub_loop import TimerTrackingLoop
+
+__credits__ = ["MXCuBE collaboration"]
+__license__ = "LGPLv3+"
+
+
+LOOP_MODE_POLL = "poll"
+LOOP_MODE_EVENT = "event"
+LOOP_MODES = (LOOP_MODE_EVENT, LOOP_MODE_POLL)
+
+
+def run_gevent(timeout=0.01):
+    """Can't call gevent.run inside inner event loops (message boxes...)"""
+    if qt_import.QEventLoop():
+        try:
+            gevent.wait(timeout=timeout)
+        except AssertionError:
+            pass
+
+
+def get_hub_fileno():
+    """Returns the file descriptor of the gevent loop backend or None"""
+    try:
+        fileno = gevent.get_hub().loop.fileno()
+    except (AttributeError, NotImplementedError, TypeError, ValueError):
+        return None
+    if fileno is None or fileno < 0:
+        return None
+    return fileno
+
+
+class GeventLoopIntegration(qt_import.QObject):
+    """Runs the gevent hub from the Qt event loop"""
+
+    # emitted by the threads scheduling gevent callbacks
+    wakeupRequested = qt_import.pyqtSignal()
+
+    def __init__(
+        self,
+        mode=LOOP_MODE_POLL,
+        max_interval=1000,
+        report_stats=False,
+        stats_interval=60,
+    ):
+        """
+        :param mode: "event" or "poll"
+        :param max_interval: longest interval between two gevent runs (ms)
+        :param report_stats: log idle cpu usage and dispatch latency
+        :param stats_interval: statistics reporting period (s)
+        """
+        qt_import.QObject.__init__(self)
+
+        self.mode = mode
+        self.max_interval = max_interval
+        self.report_stats = report_stats
+        self.stats_interval = stats_interval
+
+        self._loop = None
+        self._callback_count = 0
+        self._timer = None
+        self._hub_notifier = None
+        self._dispatcher = None
+        self._stats_timer = None
+
+        self.reset_statistics()
+
+    def start(self):
+        """Starts to run gevent from the Qt event loop"""
+        hub_fileno = None
+        if self.mode == LOOP_MODE_EVENT:
+            hub_fileno = get_hub_fileno()
+            if hub_fileno is None or not isinstance(
+                gevent.get_hub().loop, TimerTrackingLoop
+            ):
+                logging.getLogger("HWR").warning(
+                    "gevent loop does not expose a file descriptor and its "
+                    + "timers, falling back to the polling loop integration"
+                )
+                self.mode = LOOP_MODE_POLL
+
+        self._timer = qt_import.QTimer(self)
+        if self.mode == LOOP_MODE_POLL:
+            self._timer.timeout.connect(self._poll)
+            self._timer.start(0)
+        else:
+            self._timer.setSingleShot(True)
+            self._timer.setTimerType(qt_import.Qt.PreciseTimer)
+            self._timer.timeout.connect(self._timer_expired)
+
+            self._loop = gevent.get_hub().loop
+            self._loop.track_timers = True
+            self._loop.threadsafe_callback_hook = self.wakeupRequested.emit
+            self.wakeupRequested.connect(
+                self._wakeup_requested, qt_import.Qt.QueuedConnection
+            )
+
+            self._hub_notifier = qt_import.QSocketNotifier(
+                hub_fileno, qt_import.QSocketNotifier.Read, self
+            )
+            self._hub_notifier.activated.connect(self._hub_ready)
+
+            self._dispatcher = qt_import.QAbstractEventDispatcher.instance()
+            self._dispatcher.aboutToBlock.connect(self._qt_idle)
+            self._run()
+
+        if self.report_stats:
+            self._stats_timer = qt_import.QTimer(self)
+            self._stats_timer.timeout.connect(self._probe_latency)
+            self._stats_timer.start(1000)
+
+        logging.getLogger("HWR").debug(
+            "gevent loop integration started in %s mode" % self.mode
+        )
+
+    def stop(self):
+        """Stops running gevent from the Qt event loop"""
+        for timer in (self._timer, self._stats_timer):
+            if timer is not None:
+                timer.stop()
+        if self._hub_notifier is not None:
+            self._hub_notifier.setEnabled(False)
+        if self._dispatcher is not None:
+            self._dispatcher.aboutToBlock.disconnect(self._qt_idle)
+            self._dispatcher = None
+        if self._loop is not None:
+            self._loop.track_timers = False
+            self._loop.timers.clear()
+            self._loop.threadsafe_callback_hook = None
+            self._loop = None
+
+    def _poll(self):
+        self._run(0.01)
+
+    def _hub_ready(self, *args):
+        self.stats["hub_wakeups"] += 1
+        self._run()
+
+    def _qt_idle(self):
+        # greenlets spawned by the Qt slots run before Qt waits for events
+        if self._loop is not None and (
+            self._loop.callback_count != self._callback_count
+        ):
+            self.stats["qt_wakeups"] += 1
+            self._run()
+
+    def _wakeup_requested(self):
+        self.stats["thread_wakeups"] += 1
+        self._run()
+
+    def _timer_expired(self):
+        self.stats["timer_wakeups"] += 1
+        self._run()
+
+    def _run(self, timeout=0):
+        start_time = time.time()
+        if self._loop is not None:
+            self._callback_count = self._loop.callback_count
+        run_gevent(timeout)
+        if self._loop is not None:
+            # the greenlets woken up by the watchers that fired (timers,
+            # I/O) run in the next loop iteration
+            run_gevent(0)
+        self.stats["runs"] += 1
+        self.stats["run_time"] += time.time() - start_time
+
+        if self._loop is not None:
+            # next run when the first gevent timer expires
+            interval = self.max_interval
+            delay = self._loop.next_timer_delay()
+            if delay is not None:
+                interval = min(max(int(math.ceil(delay * 1000)), 0), interval)
+            self._timer.start(interval)
+
+    def reset_statistics(self):
+        """Clears collected statistics"""
+        self.stats = {
+            "runs": 0,
+            "run_time": 0.0,
+            "hub_wakeups": 0,
+            "qt_wakeups": 0,
+            "thread_wakeups": 0,
+            "timer_wakeups": 0,
+            "qt_latency": [],
+            "gevent_latency": [],
+        }
+        self._stats_start_time = time.time()
+        self._stats_start_cpu = os.times()
+
+    def get_statistics(self):
+        """Returns a summary of the loop activity since last reset
+
+        :returns: dict with cpu usage (fraction of one core), number of
+                  gevent runs and wakeups, and dispatch latencies (s)
+        """
+        wall_time = max(time.time() - self._stats_start_time, 1e-6)
+        cpu_now = os.times()
+        cpu_time = (cpu_now.user - self._stats_start_cpu.user) + (
+            cpu_now.system - self._stats_start_cpu.system
+        )
+
+        summary = {
+            "mode": self.mode,
+            "cpu_usage": cpu_time / wall_time,
+            "runs_per_second": self.stats["runs"] / wall_time,
+            "gevent_run_time": self.stats["run_time"],
+            "hub_wakeups": self.stats["hub_wakeups"],
+            "qt_wakeups": self.stats["qt_wakeups"],
+            "thread_wakeups": self.stats["thread_wakeups"],
+            "timer_wakeups": self.stats["timer_wakeups"],
+        }
+        for key in ("qt_latency", "gevent_latency"):
+            values = self.stats[key]
+            if values:
+                summary[key + "_mean"] = sum(values) / len(values)
+                summary[key + "_max"] = max(values)
+        return summary
+
+    def _probe_latency(self):
+        """Measures Qt and gevent dispatch latencies and periodically logs
+           the loop statistics
+        """
+        if time.time() - self._stats_start_time >= self.stats_interval:
+            self.log_statistics()
+            self.reset_statistics()
+
+        probe_time = time.time()
+        qt_import.QTimer.singleShot(
+            0, lambda: self.stats["qt_latency"].append(time.time() - probe_time)
+        )
+        gevent.spawn(
+            lambda: self.stats["gevent_latency"].append(time.time() - probe_time)
+        )
+
+    def log_statistics(self):
+        """Logs the loop statistics"""
+        summary = self.get_statistics()
+        msg = (
+            "gevent loop (%s): cpu %.1f %%, %.1f runs/s, "
+            + "wakeups hub/qt/thread/timer %d/%d/%d/%d"
+        ) % (
+            summary["mode"],
+            summary["cpu_usage"] * 100,
+            summary["runs_per_second"],
+            summary["hub_wakeups"],
+            summary["qt_wakeups"],
+            summary["thread_wakeups"],
+            summary["timer_wakeups"],
+        )
+        for key in ("qt_latency", "gevent_latency"):
+            if key + "_mean" in summary:
+                msg += ", %s mean %.2f ms max %.2f ms" % (
+                    key.replace("_", " "),
+                    summary[key + "_mean"] * 1000,
+                    summary[key + "_max"] * 1000,
+                )
+        logging.getLogger("HWR").info(msg)
@@ -0,0 +1,124 @@
+#
+#  Project: MXCuBE
+#  https://github.com/mxcube
+#
+#  This file is part of MXCuBE software.
+#
+#  MXCuBE is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MXCuBE is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compiled cache of the GUI configuration files.
+
+Parsing a GUI file (pure python YAML, JSON or eval + pickled property
+bags) and gathering the hardware object mnemonics of the bricks is done
+once. The result (parsed tree with deserialized properties and the brick
+mnemonics) is pickled in the user file directory, one file per GUI file:
+
+    gui_config_cache_<hash of the GUI file path>.pickle
+
+The cache is used when the GUI file path, size, mtime, the mxcubeqt
+version and the cache format are the ones it was written for, otherwise
+it is rebuilt by the caller.
+"""
+
+import os
+import pickle
+import hashlib
+import logging
+
+__credits__ = ["MXCuBE collaboration"]
+__license__ = "LGPLv3+"
+
+
+CACHE_FORMAT = 1
+CACHE_BASENAME = "gui_config_cache"
+
+
+def get_cache_filename(cache_dir, gui_config_file):
+    """Returns the cache file of a GUI file"""
+    path_hash = hashlib.sha1(
+        os.path.abspath(gui_config_file).encode("utf-8")
+    ).hexdigest()[:16]
+    return os.path.join(cache_dir, "%s_%s.pickle" % (CACHE_BASENAME, path_hash))
+
+
+def get_cache_key(gui_config_file):
+    """Returns the key identifying the current version of a GUI file"""
+    try:
+        from mxcubeqt import __version__ as version
+    except ImportError:
+        version = None
+
+    filestat = os.stat(gui_config_file)
+    return {
+        "format": CACHE_FORMAT,
+        "version": version,
+        "path": os.path.abspath(gui_config_file),
+        "size": filestat.st_size,
+        "mtime": filestat.st_mtime_ns,
+    }
+
+
+def read(cache_dir, gui_config_file):
+    """Returns the cached configuration of a GUI file
+
+    :returns: (raw config, brick mnemonics) or None if there is no valid
+              cache for the current GUI file
+    """
+    if not cache_dir:
+        return None
+    try:
+        with open(get_cache_filename(cache_dir, gui_config_file), "rb") as cache_file:
+            key = pickle.load(cache_file)
+            if key != get_cache_key(gui_config_file):
+                return None
+            return pickle.load(cache_file)
+    except (IOError, OSError):
+        return None
+    except BaseException:
+        # cache written by another version of the code
+        logging.getLogger("HWR").warning(
+            "Unable to read GUI configuration cache for %s" % gui_config_file
+        )
+        return None
+
+
+def write(cache_dir, gui_config_file, raw_config, brick_mnemonics):
+    """Writes the cache of a GUI file
+
+    :param raw_config: parsed GUI file, with deserialized properties
+    :param brick_mnemonics: list of (brick name, mnemonic)
+    """
+    if not cache_dir:
+        return
+    cache_filename = get_cache_filename(cache_dir, gui_config_file)
+    tmp_filename = cache_filename + ".tmp"
+    try:
+        # the key is read first, the config only if it is valid
+        with open(tmp_filename, "wb") as cache_file:
+            pickle.dump(
+                get_cache_key(gui_config_file), cache_file, pickle.HIGHEST_PROTOCOL
+            )
+            pickle.dump(
+                (raw_config, brick_mnemonics), cache_file, pickle.HIGHEST_PROTOCOL
+            )
+        os.replace(tmp_filename, cache_filename)
+    except BaseException:
+        logging.getLogger("HWR").exception(
+            "Unable to write GUI configuration cache %s" % cache_filename
+        )
+        try:
+            os.remove(tmp_filename)
+        except OSError:
+            pass
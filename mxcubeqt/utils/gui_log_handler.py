@@ -20,6 +20,7 @@
 import logging
 import time
 import weakref
+import collections
 import gevent
 
 from mxcubeqt.utils import qt_import
@@ -30,29 +31,32 @@ __license__ = "LGPLv3+"
 
 GUI_LOG_HANDLER = None
 TIMER = None
+MAX_BUFFERED_RECORDS = 10000
 
 
 class LogEvent(qt_import.QEvent):
+    """Delivers a batch of log records to a viewer"""
 
-    def __init__(self, record):
+    def __init__(self, records):
 
         qt_import.QEvent.__init__(self, qt_import.QEvent.User)
-        self.record = record
-
-def process_log_messages():
-    i = 0
-    while i < 10:
-        if len(GUI_LOG_HANDLER.buffer) <= i:
-            break
+        self.records = records
 
-        record = GUI_LOG_HANDLER.buffer[i]
+    @property
+    def record(self):
+        """Last record of the batch (single record viewers)"""
+        return self.records[-1]
 
-        for viewer in GUI_LOG_HANDLER.registeredViewers:
-            qt_import.QApplication.postEvent(viewer, LogEvent(record))
 
-        i += 1
+def process_log_messages():
+    """Drains the whole buffer and posts one event per viewer"""
+    records = GUI_LOG_HANDLER.take_records()
+    if not records:
+        return
 
-    del GUI_LOG_HANDLER.buffer[0:i]
+    for viewer in list(GUI_LOG_HANDLER.registeredViewers.keys()):
+        qt_import.QApplication.postEvent(viewer, LogEvent(records))
+    GUI_LOG_HANDLER.delivered_count += len(records)
 
 
 def do_process_log_messages(sleep_time):
@@ -85,6 +89,7 @@ class LogRecord:
         self.levelname = record.levelname
         self.time = record.created
         self.message = record.getMessage()
+        self.count = 1
 
     def getName(self):
         return self.name
@@ -102,22 +107,99 @@ class LogRecord:
         return time.strftime("%H:%M:%S", time.localtime(self.time))
 
     def getMessage(self):
+        if self.count > 1:
+            return "%s (repeated %d times)" % (self.message, self.count)
         return self.message
 
+    def is_repeat_of(self, other):
+        return (
+            self.levelno == other.levelno
+            and self.name == other.name
+            and self.message == other.message
+        )
 
-class __GUILogHandler(logging.Handler):
 
+class __GUILogHandler(logging.Handler):
+    """Buffers log records until they are delivered to the viewers.
+       The buffer is bounded: when full the oldest records are dropped.
+       Consecutive identical records are coalesced into one record.
+    """
 
-    def __init__(self):
+    def __init__(self, max_buffered_records=MAX_BUFFERED_RECORDS):
         logging.Handler.__init__(self)
 
-        self.buffer = []
+        self.buffer = collections.deque(maxlen=max_buffered_records)
         self.registeredViewers = weakref.WeakKeyDictionary()
 
+        self.received_count = 0
+        self.delivered_count = 0
+        self.dropped_count = 0
+        self.coalesced_count = 0
+        self._dropped_since_last_take = 0
+
     def register(self, viewer):
         self.registeredViewers[viewer] = ""
-        for rec in self.buffer:
-            viewer.append_log_record(rec)
+        records = list(self.buffer)
+        if records:
+            if hasattr(viewer, "append_log_records"):
+                viewer.append_log_records(records)
+            else:
+                for rec in records:
+                    viewer.append_log_record(rec)
 
     def emit(self, record):
-        self.buffer.append(LogRecord(record))
+        # called with the handler lock acquired
+        new_record = LogRecord(record)
+        self.received_count += 1
+
+        if self.buffer and new_record.is_repeat_of(self.buffer[-1]):
+            self.buffer[-1].count += 1
+            self.coalesced_count += 1
+            return
+
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped_count += 1
+            self._dropped_since_last_take += 1
+        self.buffer.append(new_record)
+
+    def take_records(self):
+        """Removes and returns all buffered records. If records were dropped
+           since the last call, a warning record is put in front.
+        """
+        self.acquire()
+        try:
+            records = list(self.buffer)
+            self.buffer.clear()
+            dropped = self._dropped_since_last_take
+            self._dropped_since_last_take = 0
+        finally:
+            self.release()
+
+        if dropped:
+            records.insert(
+                0,
+                LogRecord(
+                    logging.makeLogRecord(
+                        {
+                            "name": "GUI",
+                            "levelno": logging.WARNING,
+                            "levelname": "WARNING",
+                            "msg": "%d log messages were dropped "
+                            "(log view could not keep up)" % dropped,
+                        }
+                    )
+                ),
+            )
+        return records
+
+    def get_statistics(self):
+        """Returns the number of received, delivered, dropped and coalesced
+           log records
+        """
+        return {
+            "received": self.received_count,
+            "delivered": self.delivered_count,
+            "dropped": self.dropped_count,
+            "coalesced": self.coalesced_count,
+            "buffered": len(self.buffer),
+        }
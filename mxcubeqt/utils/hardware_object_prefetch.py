@@ -0,0 +1,194 @@
+#
+#  Project: MXCuBE
+#  https://github.com/mxcube
+#
+#  This file is part of MXCuBE software.
+#
+#  MXCuBE is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MXCuBE is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Prefetch of the hardware objects used by the GUI bricks.
+
+The hardware objects of the GUI mnemonic list are loaded by greenlets
+(at most concurrency loads at a time) while the bricks are built.
+Loads overlap when they wait for I/O (control system connections,
+timeouts...).
+
+While the prefetch is active, get_hardware_object of the hardware
+repository goes through the prefetch, also for the hardware objects
+loaded by other hardware objects, so that an object is never loaded
+twice:
+
+ - an object loaded by another greenlet is waited for,
+ - an object still waiting for a prefetch greenlet is loaded at once
+   by the caller, bricks only wait for the objects they use,
+ - other objects are loaded by the caller.
+
+The load time of every object is recorded (inclusive of the objects it
+loads) and reported in the log and in the startup profile.
+"""
+
+import time
+import logging
+
+import gevent
+import gevent.event
+import gevent.lock
+
+from mxcubeqt.utils import startup_profiler
+
+__credits__ = ["MXCuBE collaboration"]
+__license__ = "LGPLv3+"
+
+
+DEFAULT_CONCURRENCY = 8
+SLOWEST_REPORTED = 10
+
+
+class HardwareObjectPrefetch(object):
+    """Loads hardware objects in greenlets while the GUI is built"""
+
+    def __init__(self, hardware_repository, concurrency=DEFAULT_CONCURRENCY):
+        """
+        :param hardware_repository: HardwareRepository instance
+        :param concurrency: maximum number of concurrent loads
+        """
+        self.hardware_repository = hardware_repository
+        self.concurrency = concurrency
+        # name -> (load time, loaded by a prefetch greenlet)
+        self.load_times = {}
+        # name -> time callers waited for another greenlet
+        self.wait_times = {}
+
+        self._get_hardware_object = None
+        self._overridden = False
+        self._semaphore = gevent.lock.BoundedSemaphore(concurrency)
+        self._events = {}
+        self._owners = {}
+        self._results = {}
+        self._greenlets = []
+
+    def is_active(self):
+        return self._get_hardware_object is not None
+
+    def start(self, mnemonics):
+        """Starts loading the hardware objects of mnemonics"""
+        if self.is_active():
+            return
+        self._get_hardware_object = self.hardware_repository.get_hardware_object
+        self._overridden = "get_hardware_object" in vars(self.hardware_repository)
+        self.hardware_repository.get_hardware_object = self.get_hardware_object
+
+        loaded = getattr(self.hardware_repository, "hardware_objects", {})
+        for name in mnemonics:
+            name = self.get_name(name)
+            if name and name not in self._events and name not in loaded:
+                self._events[name] = gevent.event.Event()
+                self._greenlets.append(gevent.spawn(self._prefetch, name))
+
+    def get_name(self, name):
+        if name and not name.startswith("/"):
+            name = "/" + name
+        return name
+
+    def _prefetch(self, name):
+        with self._semaphore:
+            # the object may have been taken by a brick in the meantime
+            if name not in self._owners:
+                self._load(name, True)
+
+    def _load(self, name, prefetched=False):
+        event = self._events.setdefault(name, gevent.event.Event())
+        self._owners[name] = gevent.getcurrent()
+        hwobj = None
+        start_time = time.time()
+        try:
+            hwobj = self._get_hardware_object(name)
+        except BaseException:
+            logging.getLogger("HWR").exception(
+                "Could not load hardware object %s" % name
+            )
+        finally:
+            self.load_times[name] = (time.time() - start_time, prefetched)
+            self._results[name] = hwobj
+            event.set()
+        return hwobj
+
+    def get_hardware_object(self, name):
+        """Replaces HardwareRepository.get_hardware_object during the
+           prefetch
+        """
+        name = self.get_name(name)
+        if not name:
+            return self._get_hardware_object(name)
+        # lets the prefetch greenlets progress while the bricks are built
+        gevent.sleep(0)
+
+        event = self._events.get(name)
+        if event is None and name in getattr(
+            self.hardware_repository, "hardware_objects", {}
+        ):
+            # loaded before the prefetch
+            return self._get_hardware_object(name)
+        if event is None or name not in self._owners:
+            # not requested yet or still waiting for a prefetch greenlet
+            return self._load(name)
+
+        if not event.is_set():
+            if self._owners[name] is gevent.getcurrent():
+                # requested again while loading it, as without prefetch
+                return self._get_hardware_object(name)
+            start_time = time.time()
+            event.wait()
+            self.wait_times[name] = (
+                self.wait_times.get(name, 0.0) + time.time() - start_time
+            )
+        return self._results[name]
+
+    def finish(self):
+        """Waits for the pending loads and restores the hardware
+           repository get_hardware_object
+        """
+        if not self.is_active():
+            return
+        gevent.joinall(self._greenlets)
+        self._greenlets = []
+        if self._overridden:
+            self.hardware_repository.get_hardware_object = self._get_hardware_object
+        else:
+            # back to the class method
+            del self.hardware_repository.get_hardware_object
+        self._get_hardware_object = None
+        self._results.clear()
+        self.report()
+
+    def report(self):
+        """Logs the slowest hardware objects and adds the load times to
+           the startup profile
+        """
+        for name, (duration, prefetched) in self.load_times.items():
+            startup_profiler.add_hardware_object_load_time(
+                name, duration, prefetched, self.wait_times.get(name, 0.0)
+            )
+        slowest = sorted(
+            self.load_times.items(), key=lambda item: item[1][0], reverse=True
+        )[:SLOWEST_REPORTED]
+        if slowest:
+            logging.getLogger("HWR").info(
+                "Slowest hardware objects: %s"
+                % ", ".join(
+                    "%s %.2f s" % (name, duration)
+                    for name, (duration, prefetched) in slowest
+                )
+            )
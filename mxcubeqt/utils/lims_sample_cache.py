@@ -0,0 +1,88 @@
+#
+#  Project: MXCuBE
+#  https://github.com/mxcube
+#
+#  This file is part of MXCuBE software.
+#
+#  MXCuBE is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MXCuBE is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Cache of the samples returned by LIMS, per (proposal, session).
+
+The raw LIMS sample objects are cached, queue model samples are built
+from them each time, so cached entries are never modified by the queue.
+Entries expire after ttl seconds, refresh=True bypasses the cache.
+"""
+
+import time
+
+__credits__ = ["MXCuBE collaboration"]
+__license__ = "LGPLv3+"
+
+
+DEFAULT_TTL = 300
+
+
+class LimsSampleCache(object):
+    """Time limited cache of LIMS samples keyed by (proposal, session)"""
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        """
+        :param ttl: time to live of an entry (s), 0 disables the cache
+        """
+        self.ttl = ttl
+        self._entries = {}
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, proposal_id, session_id):
+        """Returns the cached samples or None if missing or expired"""
+        entry = self._entries.get((proposal_id, session_id))
+        if entry is not None:
+            timestamp, samples = entry
+            if time.time() - timestamp < self.ttl:
+                self.stats["hits"] += 1
+                return samples
+            del self._entries[(proposal_id, session_id)]
+        self.stats["misses"] += 1
+        return None
+
+    def set(self, proposal_id, session_id, samples):
+        """Stores samples of a proposal and session"""
+        if self.ttl > 0:
+            self._entries[(proposal_id, session_id)] = (time.time(), samples)
+
+    def invalidate(self, proposal_id=None, session_id=None):
+        """Removes the entry of a proposal and session, all entries if
+           proposal_id is None
+        """
+        if proposal_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop((proposal_id, session_id), None)
+
+    def get_samples(self, lims, proposal_id, session_id, refresh=False):
+        """Returns the samples of a proposal and session, from the cache
+           if possible, otherwise from lims.
+
+        :param lims: LIMS hardware object
+        :param refresh: bypass (and update) the cache
+        :returns: list of LIMS samples
+        """
+        samples = None
+        if not refresh:
+            samples = self.get(proposal_id, session_id)
+        if samples is None:
+            samples = lims.get_samples(proposal_id, session_id)
+            self.set(proposal_id, session_id, samples)
+        return samples
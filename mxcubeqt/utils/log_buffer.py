@@ -0,0 +1,339 @@
+#
+#  Project: MXCuBE
+#  https://github.com/mxcube
+#
+#  This file is part of MXCuBE software.
+#
+#  MXCuBE is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MXCuBE is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compact ring buffer of log records used by the log view.
+
+Records are stored in chunks of CHUNK_SIZE records. The chunk being
+filled keeps plain python lists; once full it is frozen into columnar
+numpy arrays (level, time, logger name id) and a single utf-8 message
+blob with an offsets array.
+
+Every record has a global sequence number, rows of the buffer are
+sequence numbers starting at first_seq. The buffer holds at most
+capacity records: when it is full every appended record evicts the
+oldest one (first_seq is incremented), the oldest chunk is dropped once
+none of its records is left. Frozen chunks keep an index (record
+positions per level, time bounds) so that filters do not need to rescan
+every record.
+"""
+
+import collections
+
+import numpy as np
+
+__credits__ = ["MXCuBE collaboration"]
+__license__ = "LGPLv3+"
+
+
+CHUNK_SIZE = 4096
+DEFAULT_CAPACITY = 1000000
+
+
+class LogFilter(object):
+    """Filter on log records: set of levels, text and time range"""
+
+    def __init__(self, levels=None, text=None, time_range=None):
+        """
+        :param levels: accepted levels (None: all)
+        :param text: case insensitive substring of the message (None: all)
+        :param time_range: (start, end) in seconds since epoch, None bounds
+                           are open
+        """
+        self.levels = None if levels is None else frozenset(levels)
+        self.text = text or None
+        self.time_range = time_range
+
+        self._text = self.text.lower() if self.text else None
+        self._needle = self._text.encode("utf-8") if self.text else None
+
+    def is_empty(self):
+        return self.levels is None and self.text is None and self.time_range is None
+
+    def match(self, level, timestamp, message):
+        """Returns True if a single record passes the filter"""
+        if self.levels is not None and level not in self.levels:
+            return False
+        if self.time_range is not None:
+            start, end = self.time_range
+            if start is not None and timestamp < start:
+                return False
+            if end is not None and timestamp > end:
+                return False
+        if self._text is not None:
+            if self._text not in message.lower():
+                return False
+        return True
+
+    def match_chunk(self, chunk):
+        """Returns the sorted positions of the chunk records that pass the
+           filter, using the chunk index
+        """
+        positions = None
+
+        if self.levels is not None:
+            level_positions = [
+                chunk.level_positions[level]
+                for level in self.levels
+                if level in chunk.level_positions
+            ]
+            if not level_positions:
+                return np.empty(0, dtype=np.int64)
+            positions = np.sort(np.concatenate(level_positions))
+
+        if self.time_range is not None:
+            start, end = self.time_range
+            if (start is not None and chunk.max_time < start) or (
+                end is not None and chunk.min_time > end
+            ):
+                return np.empty(0, dtype=np.int64)
+            first = 0
+            last = chunk.size
+            if start is not None:
+                first = np.searchsorted(chunk.time_key, start, "left")
+            if end is not None:
+                last = np.searchsorted(chunk.time_key, end, "right")
+            time_positions = np.arange(first, last, dtype=np.int64)
+            if positions is None:
+                positions = time_positions
+            else:
+                positions = positions[(positions >= first) & (positions < last)]
+
+        if self._needle is not None:
+            text_positions = chunk.find(self._text, self._needle)
+            if positions is None:
+                positions = text_positions
+            else:
+                positions = np.intersect1d(
+                    positions, text_positions, assume_unique=True
+                )
+
+        if positions is None:
+            positions = np.arange(chunk.size, dtype=np.int64)
+        return positions
+
+
+class _FrozenChunk(object):
+    """Full chunk of records stored as columnar arrays"""
+
+    __slots__ = (
+        "size",
+        "levels",
+        "times",
+        "names",
+        "blob",
+        "offsets",
+        "level_positions",
+        "time_key",
+        "min_time",
+        "max_time",
+    )
+
+    def __init__(self, levels, times, names, messages):
+        self.size = len(levels)
+        self.levels = np.array(levels, dtype=np.int16)
+        self.times = np.array(times, dtype=np.float64)
+        self.names = np.array(names, dtype=np.int32)
+
+        encoded = [message.encode("utf-8", "replace") for message in messages]
+        # messages are separated by a new line, they do not contain any
+        self.blob = b"\n".join(encoded)
+        self.offsets = np.zeros(self.size + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum([len(msg) + 1 for msg in encoded])
+
+        self.level_positions = dict(
+            (level, np.flatnonzero(self.levels == level))
+            for level in np.unique(self.levels).tolist()
+        )
+        # records of different threads may be slightly out of order,
+        # a running maximum gives a sorted key for time range lookups
+        self.time_key = np.maximum.accumulate(self.times)
+        self.min_time = float(self.times.min())
+        self.max_time = float(self.time_key[-1])
+
+    def message(self, position):
+        start = self.offsets[position]
+        end = self.offsets[position + 1] - 1
+        return self.blob[start:end].decode("utf-8", "replace")
+
+    def find(self, text, needle):
+        """Returns the positions of the records containing text
+
+        :param text: lower case text
+        :param needle: text encoded in utf-8
+        """
+        if not self.blob.isascii():
+            # bytes.lower() only changes ascii letters
+            return np.array(
+                [
+                    position
+                    for position in range(self.size)
+                    if text in self.message(position).lower()
+                ],
+                dtype=np.int64,
+            )
+
+        blob = self.blob.lower()
+        positions = []
+        start = blob.find(needle)
+        while start != -1:
+            position = int(np.searchsorted(self.offsets, start, "right")) - 1
+            positions.append(position)
+            # continue the search at the next record
+            start = blob.find(needle, int(self.offsets[position + 1]))
+        return np.array(positions, dtype=np.int64)
+
+
+class _PendingChunk(object):
+    """Chunk being filled"""
+
+    __slots__ = ("levels", "times", "names", "messages")
+
+    def __init__(self):
+        self.levels = []
+        self.times = []
+        self.names = []
+        self.messages = []
+
+    @property
+    def size(self):
+        return len(self.levels)
+
+    def message(self, position):
+        return self.messages[position]
+
+    def freeze(self):
+        return _FrozenChunk(self.levels, self.times, self.names, self.messages)
+
+
+class LogRecordBuffer(object):
+    """Bounded ring buffer of log records addressed by sequence number"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = max(capacity, 1)
+        self.level_names = {}
+        self._names = []
+        self._name_ids = {}
+        self._chunks = collections.deque()
+        self._pending = _PendingChunk()
+        # sequence number of the first record of the first chunk
+        self._chunk_seq = 0
+        self.first_seq = 0
+        self.next_seq = 0
+
+    def __len__(self):
+        return self.next_seq - self.first_seq
+
+    def set_capacity(self, capacity):
+        """Sets the capacity, returns the number of evicted records"""
+        self.capacity = max(capacity, 1)
+        return self.remove_first(len(self) - self.capacity)
+
+    def clear(self):
+        """Removes all records"""
+        self._chunks.clear()
+        self._pending = _PendingChunk()
+        # keep chunks aligned on CHUNK_SIZE sequence numbers
+        self.next_seq = -(-self.next_seq // CHUNK_SIZE) * CHUNK_SIZE
+        self.first_seq = self.next_seq
+        self._chunk_seq = self.next_seq
+
+    def remove_first(self, count):
+        """Removes the count oldest records, returns the number of removed
+           records
+        """
+        count = min(max(count, 0), len(self))
+        self.first_seq += count
+        while len(self._chunks) and self._chunk_seq + CHUNK_SIZE <= self.first_seq:
+            self._chunks.popleft()
+            self._chunk_seq += CHUNK_SIZE
+        return count
+
+    def append(self, level, level_name, timestamp, name, message):
+        """Appends a record
+
+        :returns: number of records evicted from the front of the buffer
+        """
+        self.level_names[level] = level_name
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = len(self._names)
+            self._names.append(name)
+            self._name_ids[name] = name_id
+
+        pending = self._pending
+        pending.levels.append(level)
+        pending.times.append(timestamp)
+        pending.names.append(name_id)
+        pending.messages.append(message.replace("\n", " ").strip())
+        self.next_seq += 1
+
+        if pending.size == CHUNK_SIZE:
+            self._chunks.append(pending.freeze())
+            self._pending = _PendingChunk()
+        return self.remove_first(len(self) - self.capacity)
+
+    def _locate(self, seq):
+        chunk_index = (seq - self._chunk_seq) // CHUNK_SIZE
+        if chunk_index == len(self._chunks):
+            return self._pending, seq % CHUNK_SIZE
+        return self._chunks[chunk_index], seq % CHUNK_SIZE
+
+    def get(self, seq):
+        """Returns (level, level name, timestamp, logger name, message)"""
+        chunk, position = self._locate(seq)
+        level = int(chunk.levels[position])
+        return (
+            level,
+            self.level_names.get(level, str(level)),
+            float(chunk.times[position]),
+            self._names[chunk.names[position]],
+            chunk.message(position),
+        )
+
+    def query(self, log_filter):
+        """Returns the sorted sequence numbers of the records passing the
+           filter
+        """
+        if log_filter is None or log_filter.is_empty():
+            return np.arange(self.first_seq, self.next_seq, dtype=np.int64)
+
+        result = []
+        chunk_seq = self._chunk_seq
+        for chunk in self._chunks:
+            result.append(log_filter.match_chunk(chunk) + chunk_seq)
+            chunk_seq += CHUNK_SIZE
+
+        pending = self._pending
+        result.append(
+            np.array(
+                [
+                    chunk_seq + position
+                    for position in range(pending.size)
+                    if log_filter.match(
+                        pending.levels[position],
+                        pending.times[position],
+                        pending.messages[position],
+                    )
+                ],
+                dtype=np.int64,
+            )
+        )
+        seqs = np.concatenate(result)
+        return seqs[seqs >= self.first_seq]
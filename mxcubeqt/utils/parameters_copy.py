@@ -0,0 +1,121 @@
+#
+#  Project: MXCuBE
+#  https://github.com/mxcube
+#
+#  This file is part of MXCuBE software.
+#
+#  MXCuBE is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MXCuBE is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Copy of the queue model parameter objects with structural sharing.
+
+PathTemplate, AcquisitionParameters, ProcessingParameters,
+CentredPosition... are plain objects holding numbers and strings. The
+task creation widgets copy them on every selection change and for every
+created task. copy.deepcopy walks every value through the copy
+protocol and pickles Qt objects (e.g. the snapshot QImage).
+
+copy_parameters creates a new object with a copy of the attribute dict:
+
+ - immutable values (numbers, strings, None, tuples of them) are shared,
+ - lists, dicts and sets are new containers,
+ - nested parameter objects (e.g. the centred position of the
+   acquisition parameters) are copied the same way,
+ - QImages are shared, Qt copies them on write,
+ - other values are deep copied.
+
+The copies are independent: changing an attribute of a copy never
+changes the original.
+"""
+
+from copy import deepcopy
+
+from mxcubeqt.utils import qt_import
+
+__credits__ = ["MXCuBE collaboration"]
+__license__ = "LGPLv3+"
+
+
+IMMUTABLE_TYPES = (type(None), bool, int, float, complex, str, bytes, frozenset)
+IMMUTABLE_TYPE_SET = frozenset(IMMUTABLE_TYPES)
+CONTAINER_TYPES = (list, dict, set)
+# values shared by the copies
+SHARED_TYPES = (qt_import.QImage,)
+
+# class -> result of is_parameter_object
+_parameter_classes = {}
+
+
+def is_parameter_object(value):
+    """Returns True if value is a plain python object (attribute dict,
+       no custom copy)
+    """
+    cls = type(value)
+    if cls not in _parameter_classes:
+        _parameter_classes[cls] = (
+            hasattr(value, "__dict__")
+            and not hasattr(cls, "__slots__")
+            and not hasattr(cls, "__deepcopy__")
+            and not hasattr(cls, "__setstate__")
+            and cls.__reduce_ex__ is object.__reduce_ex__
+            and getattr(cls, "__module__", "").startswith("mxcubecore.model")
+        )
+    return _parameter_classes[cls]
+
+
+def copy_parameters(value, memo=None):
+    """Returns an independent copy of a parameter object, sharing the
+       immutable values with the original
+
+    :param value: parameter object (PathTemplate, AcquisitionParameters...)
+    :param memo: dict of the objects already copied (id -> copy)
+    :returns: copy of value
+    """
+    if isinstance(value, IMMUTABLE_TYPES) or isinstance(value, SHARED_TYPES):
+        return value
+
+    if memo is None:
+        memo = {}
+    value_id = id(value)
+    if value_id in memo:
+        return memo[value_id]
+
+    if type(value) is tuple:
+        result = tuple(copy_parameters(item, memo) for item in value)
+        if all(item is copied for item, copied in zip(value, result)):
+            result = value
+    elif type(value) in CONTAINER_TYPES:
+        if isinstance(value, dict):
+            result = dict(
+                (key, copy_parameters(item, memo)) for key, item in value.items()
+            )
+        else:
+            result = type(value)(copy_parameters(item, memo) for item in value)
+    elif is_parameter_object(value):
+        result = type(value).__new__(type(value))
+        memo[value_id] = result
+        result.__dict__.update(
+            {
+                name: item
+                if type(item) in IMMUTABLE_TYPE_SET
+                else copy_parameters(item, memo)
+                for name, item in value.__dict__.items()
+            }
+        )
+        return result
+    else:
+        result = deepcopy(value, memo)
+
+    memo[value_id] = result
+    return result
@@ -0,0 +1,204 @@
+#
+#  Project: MXCuBE
+#  https://github.com/mxcube
+#
+#  This file is part of MXCuBE software.
+#
+#  MXCuBE is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MXCuBE is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Index of the path templates of the queue, used to find path collisions.
+
+Two path templates collide when they have the same directory, prefix
+and run number and overlapping image number ranges (see
+PathTemplate.intersection). Path templates are grouped by
+(directory, prefix, run number) and the image ranges of a group are
+sorted, so that all conflicts are found in one pass instead of
+comparing every path template with the rest of the queue.
+
+Path templates are identified by id (they are not hashable). refresh()
+re-reads the path templates and only regroups the ones that changed,
+the index is rebuilt after invalidate() (queue structure changed).
+"""
+
+import os
+
+from mxcubecore import HardwareRepository as HWR
+
+__credits__ = ["MXCuBE collaboration"]
+__license__ = "LGPLv3+"
+
+
+def get_path_key(path_template):
+    """Returns (directory, prefix, run number) of a path template"""
+    return (
+        os.path.normpath(path_template.directory),
+        path_template.get_prefix(),
+        path_template.run_number,
+    )
+
+
+def get_conflicts(ranges):
+    """Returns the ids of the overlapping image ranges
+
+    Ranges are half open, a zero length range (no image) overlaps the
+    ranges strictly containing its start, like PathTemplate.intersection.
+
+    :param ranges: list of (start, end, id) with end >= start
+    :returns: set of ids
+    """
+    ranges = sorted(ranges)
+    conflicts = set()
+    max_end = None
+    for index, (start, end, pt_id) in enumerate(ranges):
+        # overlaps a range starting before ...
+        if max_end is not None and start < max_end:
+            conflicts.add(pt_id)
+        # ... or the next one
+        elif index + 1 < len(ranges) and ranges[index + 1][0] < end:
+            conflicts.add(pt_id)
+        if max_end is None or end > max_end:
+            max_end = end
+    return conflicts
+
+
+class PathCollisionIndex(object):
+    """Path templates of the queue grouped by directory, prefix and run"""
+
+    def __init__(self):
+        self._root = None
+        self._valid = False
+        # path template id -> (path template, key, start, end)
+        self._entries = {}
+        # key -> set of path template ids
+        self._groups = {}
+        # key -> set of conflicting path template ids
+        self._conflicts = {}
+        self._dirty_keys = set()
+
+    def invalidate(self):
+        """Marks the index as outdated, it is rebuilt when used"""
+        self._valid = False
+
+    def _build_index(self):
+        self._root = HWR.beamline.queue_model.get_model_root()
+        self._entries = {}
+        self._groups = {}
+        self._conflicts = {}
+        self._dirty_keys = set()
+
+        nodes = list(self._root.get_children())
+        while nodes:
+            node = nodes.pop()
+            path_template = node.get_path_template()
+            if path_template:
+                self._add(path_template)
+            nodes.extend(node.get_children())
+        self._valid = True
+
+    def _check_index(self):
+        if not self._valid or (
+            self._root is not HWR.beamline.queue_model.get_model_root()
+        ):
+            self._build_index()
+
+    def _add(self, path_template):
+        key = get_path_key(path_template)
+        start = path_template.start_num
+        self._entries[id(path_template)] = (
+            path_template,
+            key,
+            start,
+            start + path_template.num_files,
+        )
+        self._groups.setdefault(key, set()).add(id(path_template))
+        self._dirty_keys.add(key)
+
+    def _remove(self, pt_id):
+        path_template, key, start, end = self._entries.pop(pt_id)
+        group = self._groups[key]
+        group.discard(pt_id)
+        if not group:
+            del self._groups[key]
+            self._conflicts.pop(key, None)
+            self._dirty_keys.discard(key)
+        else:
+            self._dirty_keys.add(key)
+
+    def update(self, path_template):
+        """Updates the index after a change of path_template
+
+        :returns: True if the key or image range changed
+        """
+        self._check_index()
+        pt_id = id(path_template)
+        entry = self._entries.get(pt_id)
+        if entry is None or entry[0] is not path_template:
+            return False
+        start = path_template.start_num
+        if entry[1:] == (
+            get_path_key(path_template),
+            start,
+            start + path_template.num_files,
+        ):
+            return False
+        self._remove(pt_id)
+        self._add(path_template)
+        return True
+
+    def refresh(self):
+        """Updates the index with the changes of all path templates
+
+        :returns: number of changed path templates
+        """
+        self._check_index()
+        changed = 0
+        for path_template, key, start, end in list(self._entries.values()):
+            if self.update(path_template):
+                changed += 1
+        return changed
+
+    def get_conflicts(self):
+        """Returns the ids of the path templates colliding with another
+           path template of the queue
+        """
+        self._check_index()
+        for key in self._dirty_keys:
+            self._conflicts[key] = get_conflicts(
+                [self._entries[pt_id][2:] + (pt_id,) for pt_id in self._groups[key]]
+            )
+        self._dirty_keys.clear()
+
+        conflicts = set()
+        for key_conflicts in self._conflicts.values():
+            conflicts.update(key_conflicts)
+        return conflicts
+
+    def check_path_template(self, path_template):
+        """Returns True if path_template collides with a path template of
+           the queue (other than itself), like
+           QueueModel.check_for_path_collisions
+        """
+        self._check_index()
+        self.update(path_template)
+        key = get_path_key(path_template)
+        start = path_template.start_num
+        end = start + path_template.num_files
+        for pt_id in self._groups.get(key, ()):
+            other_pt, other_key, other_start, other_end = self._entries[pt_id]
+            if other_pt is not path_template and (
+                start < other_end and other_start < end
+            ):
+                return True
+        return False
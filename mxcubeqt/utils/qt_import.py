@@ -121,10 +121,13 @@ if (qt_variant == "PyQt5") or (qt_variant is None and not qt_imported):
             pyqtSlot,
             PYQT_VERSION_STR,
             Qt,
+            QAbstractEventDispatcher,
+            QAbstractTableModel,
             QCoreApplication,
             QDir,
             QEvent,
             QEventLoop,
+            QModelIndex,
             QObject,
             QPoint,
             QPointF,
@@ -132,6 +135,7 @@ if (qt_variant == "PyQt5") or (qt_variant is None and not qt_imported):
             QRectF,
             QRegExp,
             QSize,
+            QSocketNotifier,
             QT_VERSION_STR,
             QTimer,
             QUrl,
@@ -276,9 +280,12 @@ if (qt_variant == "PyQt4") or (qt_variant is None and not qt_imported):
             pyqtSlot,
             PYQT_VERSION_STR,
             Qt,
+            QAbstractEventDispatcher,
+            QAbstractTableModel,
             QDir,
             QEvent,
             QEventLoop,
+            QModelIndex,
             QUrl,
             QObject,
             QPoint,
@@ -287,6 +294,7 @@ if (qt_variant == "PyQt4") or (qt_variant is None and not qt_imported):
             QRectF,
             QRegExp,
             QSize,
+            QSocketNotifier,
             QStringList,
             QT_VERSION_STR,
             QTimer,
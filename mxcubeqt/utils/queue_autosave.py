@@ -0,0 +1,463 @@
+#
+#  Project: MXCuBE
+#  https://github.com/mxcube
+#
+#  This file is part of MXCuBE software.
+#
+#  MXCuBE is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MXCuBE is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Debounced, incremental queue autosave.
+
+The queue is saved per task group (the children of the samples, as in
+QueueModel.save_queue), keyed by node id. Save requests are coalesced
+by a timer: the save happens once no request came for delay ms, and at
+most max_delay ms after the first request. The edit paths mark the
+changed task groups (mark_dirty or schedule with the changed node): a
+save only encodes the marked and the new task groups, removes the
+deleted ones and writes a small manifest (selected model and group
+order). Backend writes run in a greenlet.
+
+Each task group is stored under a key, the node id it had when it was
+first saved. Node ids change when a queue is restored: remap gives the
+restored task groups their previous keys, so nothing is written again.
+The first save after set_backend or invalidate replaces the whole
+content of the backend.
+
+Backends implement write(changed, removed, manifest, replace), read()
+and clear(). read returns the selected model and a list of (key,
+record). RedisQueueBackend stores the groups in a redis hash,
+FileQueueBackend one file per group in a directory.
+"""
+
+import os
+import json
+import time
+import logging
+
+import gevent
+import jsonpickle
+
+from mxcubeqt.utils import qt_import
+
+from mxcubecore.model import queue_model_objects
+
+from mxcubecore import HardwareRepository as HWR
+
+__credits__ = ["MXCuBE collaboration"]
+__license__ = "LGPLv3+"
+
+
+DEFAULT_DELAY = 1000
+DEFAULT_MAX_DELAY = 5000
+
+
+def get_selected_model_name():
+    """Returns the name of the selected queue model ("ispyb", "plate"...)"""
+    queue_model = HWR.beamline.queue_model
+    for name, model in queue_model._models.items():
+        if model is queue_model.get_model_root():
+            return name
+    return ""
+
+
+def get_task_group(node):
+    """Returns the task group (child of a sample) containing node"""
+    while node is not None and not isinstance(
+        node.get_parent(), queue_model_objects.Sample
+    ):
+        node = node.get_parent()
+    return node
+
+
+def has_parameters(node, parameters, depth=3):
+    """Returns True if parameters (acquisition parameters, path
+       template...) belong to the queue model node
+
+    :param depth: number of attribute levels searched
+    """
+    values = [
+        value
+        for name, value in vars(node).items()
+        if name not in ("_parent", "_children")
+    ]
+    while values:
+        value = values.pop()
+        if value is parameters:
+            return True
+        if isinstance(value, (list, tuple)):
+            values.extend(value)
+        elif depth > 1 and hasattr(value, "__dict__"):
+            if has_parameters(value, parameters, depth - 1):
+                return True
+    return False
+
+
+def get_task_groups(root):
+    """Returns the task groups of the queue model as a list of
+       (node id, sample location, task group), in queue order
+    """
+    task_groups = []
+    nodes = list(root.get_children())
+    nodes.reverse()
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, queue_model_objects.Sample):
+            for task_group in node.get_children():
+                task_groups.append((task_group._node_id, node.location, task_group))
+        else:
+            nodes.extend(reversed(node.get_children()))
+    return task_groups
+
+
+def encode_task_group(task_group):
+    """Serializes a task group without its parents"""
+    parent = task_group._parent
+    task_group._parent = None
+    try:
+        return jsonpickle.encode(task_group)
+    finally:
+        task_group._parent = parent
+
+
+def restore_queue(records, snapshot=None):
+    """Adds saved task groups to the samples of the selected model
+
+    :param records: list of (key, {"sample_location", "task_group_entry"})
+    :param snapshot: snapshot given to the restored tasks
+    :returns: dict key -> restored task group
+    """
+    sample_dict = {}
+    nodes = list(HWR.beamline.queue_model.get_model_root().get_children())
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, queue_model_objects.Sample):
+            sample_dict[tuple(node.location)] = node
+        else:
+            nodes.extend(node.get_children())
+
+    restored = {}
+    for key, record in records:
+        sample = sample_dict.get(tuple(record["sample_location"]))
+        if sample is None:
+            continue
+        try:
+            task_group = jsonpickle.decode(record["task_group_entry"])
+            HWR.beamline.queue_model.add_child(sample, task_group)
+            for child in task_group.get_children():
+                child.set_snapshot(snapshot)
+            restored[key] = task_group
+        except BaseException:
+            logging.getLogger("HWR").exception("Unable to restore queue item")
+    return restored
+
+
+class RedisQueueBackend(object):
+    """Stores task groups in a redis hash"""
+
+    def __init__(self, redis_client, key_prefix):
+        """
+        :param redis_client: redis.StrictRedis like client
+        :param key_prefix: prefix of the redis keys
+        """
+        self.redis_client = redis_client
+        self.nodes_key = key_prefix + ":queue_nodes"
+        self.manifest_key = key_prefix + ":queue_manifest"
+
+    def write(self, changed, removed, manifest, replace=False):
+        pipeline = self.redis_client.pipeline()
+        if replace:
+            pipeline.delete(self.nodes_key)
+        for key, record in changed.items():
+            pipeline.hset(self.nodes_key, str(key), json.dumps(record))
+        if removed:
+            pipeline.hdel(self.nodes_key, *[str(key) for key in removed])
+        pipeline.set(self.manifest_key, json.dumps(manifest))
+        pipeline.execute()
+
+    def read(self):
+        manifest = self.redis_client.get(self.manifest_key)
+        if manifest is None:
+            return None
+        manifest = json.loads(manifest)
+        nodes = self.redis_client.hgetall(self.nodes_key)
+        nodes = dict(
+            (
+                key.decode() if isinstance(key, bytes) else key,
+                json.loads(value),
+            )
+            for key, value in nodes.items()
+        )
+        return manifest["selected_model"], [
+            (str(key), nodes[str(key)]) for key in manifest["order"]
+            if str(key) in nodes
+        ]
+
+    def clear(self):
+        self.redis_client.delete(self.nodes_key, self.manifest_key)
+
+
+class FileQueueBackend(object):
+    """Stores task groups as files of a directory"""
+
+    def __init__(self, directory):
+        """
+        :param directory: autosave directory, created if needed
+        """
+        self.directory = directory
+        self.manifest_filename = os.path.join(directory, "queue_manifest.json")
+
+    def get_node_filename(self, key):
+        return os.path.join(self.directory, "node_%s.json" % key)
+
+    def write_file(self, filename, data):
+        tmp_filename = filename + ".tmp"
+        with open(tmp_filename, "w") as save_file:
+            json.dump(data, save_file)
+        os.replace(tmp_filename, filename)
+
+    def write(self, changed, removed, manifest, replace=False):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        for key, record in changed.items():
+            self.write_file(self.get_node_filename(key), record)
+        if replace:
+            kept = set(
+                os.path.basename(self.get_node_filename(key)) for key in changed
+            )
+            removed = [
+                filename[5:-5]
+                for filename in os.listdir(self.directory)
+                if filename.startswith("node_")
+                and filename.endswith(".json")
+                and filename not in kept
+            ]
+        for key in removed:
+            try:
+                os.remove(self.get_node_filename(key))
+            except OSError:
+                pass
+        self.write_file(self.manifest_filename, manifest)
+
+    def read(self):
+        try:
+            with open(self.manifest_filename, "r") as manifest_file:
+                manifest = json.load(manifest_file)
+        except (IOError, OSError, ValueError):
+            return None
+
+        records = []
+        for key in manifest["order"]:
+            try:
+                with open(self.get_node_filename(key), "r") as node_file:
+                    records.append((str(key), json.load(node_file)))
+            except (IOError, OSError, ValueError):
+                logging.getLogger("HWR").warning(
+                    "Queue autosave: missing task group %s" % key
+                )
+        return manifest["selected_model"], records
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for filename in os.listdir(self.directory):
+                if filename.endswith(".json"):
+                    os.remove(os.path.join(self.directory, filename))
+
+
+class QueueAutoSave(qt_import.QObject):
+    """Coalesces queue save requests and saves changed task groups"""
+
+    def __init__(self, backend=None, delay=DEFAULT_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        """
+        :param backend: RedisQueueBackend, FileQueueBackend or None
+        :param delay: save after delay ms without request
+        :param max_delay: save at most max_delay ms after the first request
+        """
+        qt_import.QObject.__init__(self)
+
+        self.backend = backend
+        self.delay = delay
+        self.max_delay = max_delay
+
+        # node id -> key of the task group saved in the backend
+        self._keys = {}
+        # node ids of the task groups changed since the last save
+        self._dirty = set()
+        # keys to remove from the backend at the next save
+        self._removed = set()
+        self._manifest = None
+        # next write replaces the content of the backend
+        self._replace = True
+        self._first_request_time = None
+        self._write_task = None
+        self.stats = {"requests": 0, "saves": 0, "encoded": 0, "removed": 0}
+
+        self._timer = qt_import.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+
+    def set_backend(self, backend):
+        """Sets the backend, nothing is considered saved in it"""
+        self._timer.stop()
+        self.backend = backend
+        self._first_request_time = None
+        self.invalidate()
+
+    def invalidate(self):
+        """Forgets what was saved: the next save writes all task groups
+           and removes the other records of the backend
+        """
+        self._keys = {}
+        self._dirty = set()
+        self._removed = set()
+        self._manifest = None
+        self._replace = True
+
+    def remap(self, restored, keys):
+        """Considers the restored task groups as saved under their key
+
+        :param restored: dict key -> task group, as returned by restore_queue
+        :param keys: keys read from the backend, the ones not restored are
+                     removed at the next save
+        """
+        self._keys = dict(
+            (task_group._node_id, key) for key, task_group in restored.items()
+        )
+        self._dirty = set()
+        self._removed = set(keys) - set(restored)
+        self._manifest = None
+        self._replace = False
+
+    def mark_dirty(self, node):
+        """Marks the task group containing node as changed
+
+        :param node: changed queue model node
+        """
+        task_group = get_task_group(node)
+        if task_group is not None:
+            self._dirty.add(task_group._node_id)
+
+    def schedule(self, node=None):
+        """Requests a save
+
+        :param node: changed queue model node (None: only added and
+                     removed task groups are saved)
+        """
+        self.stats["requests"] += 1
+        if node is not None:
+            self.mark_dirty(node)
+
+        now = time.time()
+        if self._first_request_time is None:
+            self._first_request_time = now
+        remaining = self.max_delay - (now - self._first_request_time) * 1000
+        self._timer.start(int(max(0, min(self.delay, remaining))))
+
+    def get_manifest(self, order):
+        return {"selected_model": get_selected_model_name(), "order": order}
+
+    def flush(self):
+        """Saves changed task groups now"""
+        self._timer.stop()
+        self._first_request_time = None
+        if self.backend is None:
+            return
+
+        task_groups = get_task_groups(HWR.beamline.queue_model.get_model_root())
+        used_keys = set(self._keys.values()) | self._removed
+        keys = {}
+        order = []
+        changed = {}
+        for node_id, location, task_group in task_groups:
+            key = self._keys.get(node_id)
+            if key is None:
+                # new task group
+                key = str(node_id)
+                index = 0
+                while key in used_keys:
+                    index += 1
+                    key = "%s_%d" % (node_id, index)
+            elif node_id not in self._dirty:
+                keys[node_id] = key
+                order.append(key)
+                continue
+            try:
+                changed[key] = {
+                    "sample_location": list(location),
+                    "task_group_entry": encode_task_group(task_group),
+                }
+            except BaseException:
+                logging.getLogger("HWR").exception(
+                    "Queue autosave: unable to serialize task group"
+                )
+                if node_id not in self._keys:
+                    continue
+            used_keys.add(key)
+            keys[node_id] = key
+            order.append(key)
+
+        removed = self._removed | (set(self._keys.values()) - set(keys.values()))
+        manifest = self.get_manifest(order)
+        replace = self._replace
+
+        self._keys = keys
+        self._dirty = set()
+        self._removed = set()
+        self._replace = False
+        if not replace and not changed and not removed and manifest == self._manifest:
+            return
+        self._manifest = manifest
+
+        self.stats["saves"] += 1
+        self.stats["encoded"] += len(changed)
+        self.stats["removed"] += len(removed)
+        self._write_task = gevent.spawn(
+            self._write,
+            self._write_task,
+            self.backend,
+            changed,
+            sorted(removed),
+            manifest,
+            replace,
+        )
+
+    def _write(self, previous_task, backend, changed, removed, manifest, replace):
+        # keeps the writes in order
+        if previous_task is not None:
+            previous_task.join()
+        try:
+            backend.write(changed, removed, manifest, replace)
+            logging.getLogger("HWR").debug(
+                "Queue autosave: %d task group(s) saved, %d removed"
+                % (len(changed), len(removed))
+            )
+        except BaseException:
+            logging.getLogger("HWR").exception("Queue autosave failed")
+            # save everything again next time
+            self.invalidate()
+
+    def wait(self, timeout=None):
+        """Waits for the pending backend write"""
+        if self._write_task is not None:
+            self._write_task.join(timeout)
+
+    def load(self):
+        """Returns (selected model, [(key, record)]) from the backend or None"""
+        if self.backend is None:
+            return None
+        try:
+            return self.backend.read()
+        except BaseException:
+            logging.getLogger("HWR").exception("Unable to read saved queue")
+            return None
@@ -0,0 +1,219 @@
+#
+#  Project: MXCuBE
+#  https://github.com/mxcube
+#
+#  This file is part of MXCuBE software.
+#
+#  MXCuBE is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MXCuBE is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Append-only store of the executed queue entries (queue history).
+
+Entries are appended as JSON lines to queue_history.jsonl in the user
+file directory:
+
+    [sample name, date, time, entry type, status, details]
+
+A date index (queue_history.idx) keeps, for every date, the byte ranges
+of its entries and the size of the data file it covers. Opening the
+store only reads the index (and the entries appended after it was last
+written), so the history view can list the dates without parsing the
+history, and the entries of a date are read when needed.
+
+The legacy jsonpickle history (queue_history.dat) is imported once.
+"""
+
+import os
+import json
+import logging
+
+import jsonpickle
+
+__credits__ = ["MXCuBE collaboration"]
+__license__ = "LGPLv3+"
+
+
+HISTORY_FILENAME = "queue_history.jsonl"
+INDEX_FILENAME = "queue_history.idx"
+LEGACY_FILENAME = "queue_history.dat"
+INDEX_VERSION = 1
+
+
+class QueueHistoryStore(object):
+    """Append-only queue history file with a date index"""
+
+    def __init__(self, directory):
+        """
+        :param directory: directory of the history files
+        """
+        self.filename = os.path.join(directory, HISTORY_FILENAME)
+        self.index_filename = os.path.join(directory, INDEX_FILENAME)
+        self.legacy_filename = os.path.join(directory, LEGACY_FILENAME)
+        # date -> list of [start, end] byte ranges
+        self.date_ranges = {}
+        self.size = 0
+
+        if not os.path.exists(self.filename) and os.path.exists(self.legacy_filename):
+            self.import_legacy_history()
+        self.load_index()
+
+    def load_index(self):
+        """Reads the date index and indexes entries appended after it"""
+        self.date_ranges = {}
+        self.size = 0
+        try:
+            with open(self.index_filename, "r") as index_file:
+                index = json.load(index_file)
+            if index.get("version") == INDEX_VERSION:
+                self.date_ranges = index["dates"]
+                self.size = index["size"]
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            pass
+
+        try:
+            file_size = os.path.getsize(self.filename)
+        except OSError:
+            file_size = 0
+
+        if self.size > file_size:
+            # history file replaced or truncated
+            self.date_ranges = {}
+            self.size = 0
+        if self.size < file_size:
+            self.index_from(self.size)
+            self.save_index()
+
+    def index_from(self, offset):
+        """Indexes the entries stored after offset"""
+        with open(self.filename, "rb") as history_file:
+            history_file.seek(offset)
+            for line in history_file:
+                end = offset + len(line)
+                try:
+                    date = json.loads(line.decode("utf-8"))[1]
+                except (ValueError, IndexError, TypeError):
+                    # incomplete last line after a crash
+                    logging.getLogger("HWR").debug(
+                        "Skipping invalid queue history entry at %d", offset
+                    )
+                else:
+                    self.add_range(date, offset, end)
+                offset = end
+        self.size = offset
+
+    def add_range(self, date, start, end):
+        ranges = self.date_ranges.setdefault(date, [])
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+
+    def save_index(self):
+        """Writes the date index"""
+        tmp_filename = self.index_filename + ".tmp"
+        try:
+            with open(tmp_filename, "w") as index_file:
+                json.dump(
+                    {
+                        "version": INDEX_VERSION,
+                        "size": self.size,
+                        "dates": self.date_ranges,
+                    },
+                    index_file,
+                )
+            os.replace(tmp_filename, self.index_filename)
+        except (IOError, OSError):
+            logging.getLogger("HWR").exception(
+                "Cannot save queue history index %s", self.index_filename
+            )
+
+    def append(self, sample_name, date, time, entry_type, status, entry_details):
+        """Appends an entry to the history. Values that are not JSON
+           serializable are saved as strings.
+        """
+        try:
+            line = (
+                json.dumps(
+                    [sample_name, date, time, entry_type, status, entry_details],
+                    default=str,
+                )
+                + "\n"
+            ).encode("utf-8")
+        except (TypeError, ValueError):
+            # e.g. circular reference in entry_details
+            logging.getLogger("HWR").exception(
+                "Cannot save queue history entry of %s", sample_name
+            )
+            return
+        try:
+            with open(self.filename, "a+b") as history_file:
+                history_file.seek(0, os.SEEK_END)
+                start = history_file.tell()
+                if start > 0:
+                    history_file.seek(start - 1)
+                    if history_file.read(1) != b"\n":
+                        # incomplete last line after a crash
+                        line = b"\n" + line
+                history_file.write(line)
+        except (IOError, OSError):
+            logging.getLogger("HWR").exception(
+                "Cannot save queue history in %s", self.filename
+            )
+            return
+
+        if start != self.size:
+            # file modified by someone else: index what is missing
+            self.index_from(self.size)
+        else:
+            self.add_range(date, start, start + len(line))
+            self.size = start + len(line)
+        self.save_index()
+
+    def get_dates(self):
+        """Returns the dates with entries, newest first"""
+        return sorted(self.date_ranges, reverse=True)
+
+    def get_entries(self, date):
+        """Returns the entries of a date in the order they were added
+
+        :returns: list of (sample name, date, time, type, status, details)
+        """
+        entries = []
+        try:
+            with open(self.filename, "rb") as history_file:
+                for start, end in self.date_ranges.get(date, ()):
+                    history_file.seek(start)
+                    for line in history_file.read(end - start).splitlines():
+                        try:
+                            entries.append(tuple(json.loads(line.decode("utf-8"))))
+                        except ValueError:
+                            pass
+        except (IOError, OSError):
+            logging.getLogger("HWR").exception(
+                "Cannot read queue history %s", self.filename
+            )
+        return entries
+
+    def import_legacy_history(self):
+        """Imports the jsonpickle history file written by previous versions"""
+        try:
+            with open(self.legacy_filename, "r") as legacy_file:
+                entries = jsonpickle.decode(legacy_file.read())
+            with open(self.filename, "w") as history_file:
+                for entry in entries:
+                    history_file.write(json.dumps(list(entry)) + "\n")
+        except BaseException:
+            logging.getLogger("HWR").exception(
+                "Cannot import queue history %s", self.legacy_filename
+            )
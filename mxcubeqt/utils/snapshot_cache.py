@@ -0,0 +1,180 @@
+#
+#  Project: MXCuBE
+#  https://github.com/mxcube
+#
+#  This file is part of MXCuBE software.
+#
+#  MXCuBE is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MXCuBE is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Short lived cache of the sample view snapshots.
+
+Creating tasks for many samples or shapes takes a snapshot of the
+sample view for every task. Snapshots are cached by shape (and its
+geometry: position, corners, number of grid cells), diffractometer
+motion counter (number of motor state and position signals of the
+diffractometer) and camera frame counter (number of imageReceived
+signals of the sample view camera): as long as the shape and the motors
+did not move and no new frame was displayed, the same snapshot (QImage,
+implicitly shared) is given to all the tasks. Cached snapshots expire
+after max_age seconds, also when the camera does not count frames.
+
+Snapshots stay QImages, they are encoded by the queue entries when the
+collection is done, not when tasks are created.
+"""
+
+import time
+import logging
+
+from mxcubecore import HardwareRepository as HWR
+
+__credits__ = ["MXCuBE collaboration"]
+__license__ = "LGPLv3+"
+
+
+DEFAULT_MAX_AGE = 2.0
+# diffractometer signals of a motor move
+MOTION_SIGNALS = (
+    "minidiffStateChanged",
+    "diffractometerMoved",
+    "zoomMotorPredefinedPositionChanged",
+)
+
+
+def get_point_key(point):
+    """Returns (x, y) of a QPoint(F) or of a coordinate list"""
+    if hasattr(point, "x"):
+        return (point.x(), point.y())
+    return tuple(point)
+
+
+def get_shape_key(shape):
+    """Returns the id and the geometry of a shape (graphics item)"""
+    if shape is None:
+        return None
+    key = [id(shape), get_point_key(shape.pos())]
+    for name in ("start_coord", "end_coord"):
+        key.append(get_point_key(getattr(shape, name, ())))
+    if hasattr(shape, "get_corner_coord"):
+        key.extend(get_point_key(point) for point in shape.get_corner_coord())
+    if hasattr(shape, "get_col_row_num"):
+        key.append(tuple(shape.get_col_row_num()))
+    return tuple(key)
+
+
+class SnapshotCache(object):
+    """Snapshots of the sample view keyed by shape, diffractometer motion
+       and camera frame
+    """
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE):
+        """
+        :param max_age: lifetime of a cached snapshot in seconds
+        """
+        self.max_age = max_age
+        self.frame_count = 0
+        self.motion_count = 0
+        self.stats = {"requests": 0, "snapshots": 0}
+
+        self._camera = None
+        self._diffractometer = None
+        # key -> (time, snapshot, shape)
+        self._snapshots = {}
+
+    def connect_camera(self):
+        """Counts the frames of the sample view camera"""
+        sample_view = HWR.beamline.sample_view
+        camera = getattr(sample_view, "camera", None) or getattr(
+            sample_view, "camera_hwobj", None
+        )
+        if camera is None or camera is self._camera:
+            return
+        if self._camera is not None:
+            self._camera.disconnect("imageReceived", self.frame_received)
+        try:
+            camera.connect("imageReceived", self.frame_received)
+            self._camera = camera
+        except BaseException:
+            logging.getLogger("HWR").exception(
+                "Snapshot cache: unable to connect to the camera"
+            )
+
+    def frame_received(self, *args):
+        self.frame_count += 1
+
+    def connect_diffractometer(self):
+        """Counts the motor moves of the diffractometer"""
+        diffractometer = HWR.beamline.diffractometer
+        if diffractometer is None or diffractometer is self._diffractometer:
+            return
+        if self._diffractometer is not None:
+            for signal in MOTION_SIGNALS:
+                self._diffractometer.disconnect(signal, self.motion_received)
+        try:
+            for signal in MOTION_SIGNALS:
+                diffractometer.connect(signal, self.motion_received)
+            self._diffractometer = diffractometer
+        except BaseException:
+            logging.getLogger("HWR").exception(
+                "Snapshot cache: unable to connect to the diffractometer"
+            )
+
+    def motion_received(self, *args):
+        self.motion_count += 1
+
+    def get_snapshot(self, shape=None):
+        """Returns a snapshot of the sample view, shared with the previous
+           requests if nothing has changed
+
+        :param shape: shape shown on the snapshot, all shapes if None
+        """
+        self.stats["requests"] += 1
+        self.connect_camera()
+        self.connect_diffractometer()
+
+        now = time.time()
+        key = (get_shape_key(shape), self.frame_count, self.motion_count)
+        cached = self._snapshots.get(key)
+        if cached is not None and now - cached[0] < self.max_age:
+            return cached[1]
+
+        if shape is None:
+            snapshot = HWR.beamline.sample_view.get_snapshot()
+        else:
+            snapshot = HWR.beamline.sample_view.get_snapshot(shape=shape)
+        self.stats["snapshots"] += 1
+
+        # older frames and positions are not requested anymore
+        self._snapshots = dict(
+            (cached_key, value)
+            for cached_key, value in self._snapshots.items()
+            if cached_key[1:] == key[1:] and now - value[0] < self.max_age
+        )
+        # the shape is kept, its id is not reused while it is cached
+        self._snapshots[key] = (now, snapshot, shape)
+        return snapshot
+
+    def clear(self):
+        self._snapshots = {}
+
+
+snapshot_cache = SnapshotCache()
+
+
+def get_snapshot(shape=None):
+    """Returns a snapshot of the sample view from the snapshot cache
+
+    :param shape: shape shown on the snapshot, all shapes if None
+    """
+    return snapshot_cache.get_snapshot(shape)
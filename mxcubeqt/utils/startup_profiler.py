@@ -0,0 +1,263 @@
+#
+#  Project: MXCuBE
+#  https://github.com/mxcube
+#
+#  This file is part of MXCuBE software.
+#
+#  MXCuBE is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MXCuBE is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Startup profiling (--profileStartup).
+
+Records the duration of the startup phases and, per brick, the time
+spent in the constructor, in setting properties, in run() and in
+acquiring each hardware object, as well as the load time of each
+prefetched hardware object. At the end of the startup a JSON and a
+HTML report sorted by duration are written in the user file directory,
+optionally with a cProfile dump of the whole startup.
+"""
+
+import os
+import time
+import json
+import logging
+import cProfile
+
+__credits__ = ["MXCuBE collaboration"]
+__license__ = "LGPLv3+"
+
+
+REPORT_BASENAME = "startup_profile"
+BRICK_STEPS = ("init", "properties", "run")
+
+_enabled = False
+_start_time = None
+_phases = []
+_bricks = {}
+_hardware_objects = {}
+_profile = None
+
+
+def enable(cprofile=False):
+    """Enables startup profiling
+
+    :param cprofile: also run cProfile during the startup
+    """
+    global _enabled, _start_time, _profile
+    _enabled = True
+    _start_time = time.time()
+    if cprofile:
+        _profile = cProfile.Profile()
+        _profile.enable()
+
+
+def is_enabled():
+    return _enabled
+
+
+def add_phase(phase_name, duration):
+    """Records the duration of a startup phase"""
+    if _enabled:
+        _phases.append((phase_name, duration))
+
+
+def _get_brick_info(brick_name, brick_type=None):
+    brick_info = _bricks.get(brick_name)
+    if brick_info is None:
+        brick_info = {
+            "type": brick_type,
+            "init": 0.0,
+            "properties": 0.0,
+            "run": 0.0,
+            "hardware_objects": {},
+        }
+        _bricks[brick_name] = brick_info
+    elif brick_type is not None:
+        brick_info["type"] = brick_type
+    return brick_info
+
+
+def add_brick_time(brick_name, step, duration, brick_type=None):
+    """Records time spent by a brick in one of BRICK_STEPS"""
+    if _enabled:
+        _get_brick_info(brick_name, brick_type)[step] += duration
+
+
+def add_hardware_object_time(brick_name, hardware_object_name, duration):
+    """Records time spent by a brick to get a hardware object"""
+    if _enabled:
+        hardware_objects = _get_brick_info(brick_name)["hardware_objects"]
+        hardware_objects[hardware_object_name] = (
+            hardware_objects.get(hardware_object_name, 0.0) + duration
+        )
+
+
+def add_hardware_object_load_time(
+    hardware_object_name, duration, prefetched=False, wait_time=0.0
+):
+    """Records the load time of a hardware object
+
+    :param prefetched: loaded by a prefetch greenlet
+    :param wait_time: time bricks waited for the object
+    """
+    if _enabled:
+        _hardware_objects[hardware_object_name] = {
+            "time": duration,
+            "prefetched": prefetched,
+            "wait_time": wait_time,
+        }
+
+
+def get_report():
+    """Returns the startup report as a dict, phases and bricks are sorted
+       by decreasing duration
+    """
+    bricks = []
+    for brick_name, brick_info in _bricks.items():
+        hardware_objects = sorted(
+            brick_info["hardware_objects"].items(),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        bricks.append(
+            {
+                "name": brick_name,
+                "type": brick_info["type"],
+                "init": brick_info["init"],
+                "properties": brick_info["properties"],
+                "run": brick_info["run"],
+                "total": sum(brick_info[step] for step in BRICK_STEPS),
+                "hardware_objects": [
+                    {"name": name, "time": duration}
+                    for name, duration in hardware_objects
+                ],
+            }
+        )
+    bricks.sort(key=lambda brick: brick["total"], reverse=True)
+
+    try:
+        from mxcubeqt import __version__ as version
+    except ImportError:
+        version = None
+
+    return {
+        "version": version,
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "total": time.time() - _start_time if _start_time else 0.0,
+        "phases": [
+            {"name": name, "time": duration}
+            for name, duration in sorted(
+                _phases, key=lambda phase: phase[1], reverse=True
+            )
+        ],
+        "bricks": bricks,
+        "hardware_objects": [
+            dict(name=name, **hwobj_info)
+            for name, hwobj_info in sorted(
+                _hardware_objects.items(),
+                key=lambda item: item[1]["time"],
+                reverse=True,
+            )
+        ],
+    }
+
+
+def get_html_report(report):
+    """Returns the startup report as a html page"""
+    html_str = "<html><head><title>MXCuBE startup profile</title></head><body>"
+    html_str += "<h1>MXCuBE startup profile</h1>"
+    html_str += "<p>Version %s, %s, started in %.2f s</p>" % (
+        report["version"],
+        report["date"],
+        report["total"],
+    )
+
+    html_str += "<h2>Startup phases</h2><table border='1'>"
+    html_str += "<tr><th>Phase</th><th>Time (s)</th></tr>"
+    for phase in report["phases"]:
+        html_str += "<tr><td>%s</td><td>%.3f</td></tr>" % (phase["name"], phase["time"])
+    html_str += "</table>"
+
+    html_str += "<h2>Bricks</h2><table border='1'>"
+    html_str += (
+        "<tr><th>Brick</th><th>Type</th><th>Total (s)</th><th>Init (s)</th>"
+        + "<th>Properties (s)</th><th>Run (s)</th><th>Hardware objects (s)</th></tr>"
+    )
+    for brick in report["bricks"]:
+        html_str += (
+            "<tr><td>%s</td><td>%s</td><td>%.3f</td><td>%.3f</td>"
+            + "<td>%.3f</td><td>%.3f</td><td>%s</td></tr>"
+        ) % (
+            brick["name"],
+            brick["type"],
+            brick["total"],
+            brick["init"],
+            brick["properties"],
+            brick["run"],
+            "<br/>".join(
+                "%s: %.3f" % (hwobj["name"], hwobj["time"])
+                for hwobj in brick["hardware_objects"]
+            ),
+        )
+    html_str += "</table>"
+
+    html_str += "<h2>Hardware objects</h2><table border='1'>"
+    html_str += (
+        "<tr><th>Hardware object</th><th>Load time (s)</th>"
+        + "<th>Prefetched</th><th>Waited by bricks (s)</th></tr>"
+    )
+    for hwobj in report.get("hardware_objects", []):
+        html_str += "<tr><td>%s</td><td>%.3f</td><td>%s</td><td>%.3f</td></tr>" % (
+            hwobj["name"],
+            hwobj["time"],
+            "yes" if hwobj["prefetched"] else "no",
+            hwobj["wait_time"],
+        )
+    html_str += "</table></body></html>"
+    return html_str
+
+
+def write_report(directory):
+    """Writes the JSON and HTML reports (and the cProfile dump) in
+       directory. Profiling is disabled afterwards.
+
+    :returns: path of the JSON report or None
+    """
+    global _enabled, _profile
+    if not _enabled:
+        return None
+    _enabled = False
+
+    if _profile is not None:
+        _profile.disable()
+
+    report = get_report()
+    filename = os.path.join(directory, REPORT_BASENAME)
+    try:
+        with open(filename + ".json", "w") as report_file:
+            json.dump(report, report_file, indent=2)
+        with open(filename + ".html", "w") as report_file:
+            report_file.write(get_html_report(report))
+        if _profile is not None:
+            _profile.dump_stats(filename + ".prof")
+    except (IOError, OSError):
+        logging.getLogger("HWR").exception(
+            "Could not write startup profile in %s" % directory
+        )
+        return None
+    finally:
+        _profile = None
+
+    logging.getLogger("HWR").info("Startup profile written to %s.json" % filename)
+    return filename + ".json"
@@ -0,0 +1,265 @@
+#
+#  Project: MXCuBE
+#  https://github.com/mxcube
+#
+#  This file is part of MXCuBE software.
+#
+#  MXCuBE is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MXCuBE is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Filtering of the sample tree.
+
+The tree is walked once to build per attribute indexes (star, executed,
+helical, task type, sample name, protein acronym, basket). Filters are
+then computed from the indexes as sets of hidden items (item ids, tree
+items are not hashable) and only the items whose hidden state changes
+are updated. Text filters narrow the previous result when the new text
+contains the previous one.
+
+The index is rebuilt after invalidate(), which is called when the tree
+structure changes and when the filter criteria is changed (star and
+executed states may have changed in between).
+"""
+
+import heapq
+
+from mxcubeqt.utils import queue_item, qt_import
+
+__credits__ = ["MXCuBE collaboration"]
+__license__ = "LGPLv3+"
+
+
+# Indexes of the filter combo in the sample changer widget
+FILTER_NONE = 0
+FILTER_STAR = 1
+FILTER_SAMPLE_NAME = 2
+FILTER_PROTEIN_NAME = 3
+FILTER_BASKET_INDEX = 4
+FILTER_EXECUTED = 5
+FILTER_NOT_EXECUTED = 6
+FILTER_OSC = 7
+FILTER_HELICAL = 8
+FILTER_CHARACTERISATION = 9
+FILTER_ENERGY_SCAN = 10
+FILTER_XRF_SPECTRUM = 11
+
+# Items that are never hidden by the criteria filters
+CONTAINER_TYPES = (
+    queue_item.TaskQueueItem,
+    queue_item.SampleQueueItem,
+    queue_item.BasketQueueItem,
+    queue_item.DataCollectionGroupQueueItem,
+)
+# Items hidden when all their children are hidden
+GROUP_TYPES = (queue_item.BasketQueueItem, queue_item.DataCollectionGroupQueueItem)
+
+TASK_TYPE_FILTERS = {
+    FILTER_CHARACTERISATION: queue_item.CharacterisationQueueItem,
+    FILTER_ENERGY_SCAN: queue_item.EnergyScanQueueItem,
+    FILTER_XRF_SPECTRUM: queue_item.XRFSpectrumQueueItem,
+}
+
+
+class TreeFilter(object):
+    """Indexed filter of a sample tree widget"""
+
+    def __init__(self, tree_widget):
+        """
+        :param tree_widget: QTreeWidget with QueueItem items
+        """
+        self.tree_widget = tree_widget
+        self._valid = False
+        self._last_text_query = None
+
+    def invalidate(self):
+        """Marks the index as outdated, it is rebuilt on next filtering"""
+        self._valid = False
+        self._last_text_query = None
+
+    def _build_index(self):
+        self.items = []
+        self.positions = {}
+        self.hidden = set()
+        self.groups = []
+        self.filtered = set()
+        self.by_type = {}
+        self.star = set()
+        self.data_collections = set()
+        self.executed = set()
+        self.helical = set()
+        self.sample_names = []
+        self.protein_acronyms = []
+        self.baskets = []
+
+        item_iterator = qt_import.QTreeWidgetItemIterator(self.tree_widget)
+        item = item_iterator.value()
+        while item:
+            item_id = id(item)
+            self.positions[item_id] = len(self.items)
+            self.items.append(item)
+            if item.isHidden():
+                self.hidden.add(item_id)
+            if item.has_star():
+                self.star.add(item_id)
+
+            item_type = type(item)
+            self.by_type.setdefault(item_type, set()).add(item_id)
+            if item_type in GROUP_TYPES:
+                self.groups.append(item)
+            if item_type not in CONTAINER_TYPES:
+                self.filtered.add(item_id)
+
+            if isinstance(item, queue_item.DataCollectionQueueItem):
+                item_model = item.get_model()
+                self.data_collections.add(item_id)
+                if item_model.is_executed():
+                    self.executed.add(item_id)
+                if item_model.is_helical():
+                    self.helical.add(item_id)
+            elif isinstance(item, queue_item.SampleQueueItem):
+                self.sample_names.append((item_id, str(item.text(0))))
+                try:
+                    protein_acronym = item.get_model().crystals[0].protein_acronym
+                except (AttributeError, IndexError):
+                    protein_acronym = ""
+                self.protein_acronyms.append((item_id, str(protein_acronym or "")))
+            elif isinstance(item, queue_item.BasketQueueItem):
+                self.baskets.append((item_id, item.get_model().location[0]))
+
+            item_iterator += 1
+            item = item_iterator.value()
+        self._valid = True
+
+    def _check_index(self):
+        if not self._valid:
+            self._build_index()
+
+    def get_criteria_hidden(self, filter_index):
+        """Returns the ids of the items hidden by a criteria filter (combo)"""
+        self._check_index()
+        if filter_index == FILTER_STAR:
+            hidden = self.filtered - self.star
+        elif filter_index == FILTER_EXECUTED:
+            hidden = self.data_collections - self.executed
+        elif filter_index == FILTER_NOT_EXECUTED:
+            hidden = set(self.executed)
+        elif filter_index in (FILTER_OSC, FILTER_HELICAL):
+            hidden = self.filtered - self.data_collections
+            if filter_index == FILTER_OSC:
+                hidden |= self.helical
+            else:
+                hidden |= self.data_collections - self.helical
+        elif filter_index in TASK_TYPE_FILTERS:
+            hidden = self.filtered - self.by_type.get(
+                TASK_TYPE_FILTERS[filter_index], set()
+            )
+        else:
+            hidden = set()
+        # containers are not hidden by criteria filters
+        return hidden & self.filtered
+
+    def get_text_hidden(self, filter_index, text):
+        """Returns the ids of the items hidden by a text filter"""
+        self._check_index()
+        text = str(text)
+
+        if filter_index == FILTER_BASKET_INDEX:
+            if text.isdigit():
+                # Display one basket
+                return set(
+                    item_id for item_id, basket_index in self.baskets
+                    if basket_index != int(text)
+                )
+            basket_list = [value.strip() for value in text.split(",")]
+            if len(basket_list) > 1:
+                # Display several baskets separated with ","
+                return set(
+                    item_id for item_id, basket_index in self.baskets
+                    if str(basket_index) not in basket_list
+                )
+            return set()
+
+        if filter_index == FILTER_SAMPLE_NAME:
+            values = self.sample_names
+        elif filter_index == FILTER_PROTEIN_NAME:
+            values = self.protein_acronyms
+        else:
+            return set()
+
+        candidates = values
+        if self._last_text_query is not None:
+            last_filter_index, last_text, last_matching = self._last_text_query
+            if last_filter_index == filter_index and last_text in text:
+                # a longer text can only match a subset of the last matches
+                candidates = last_matching
+        matching = [
+            (item_id, value) for item_id, value in candidates if text in value
+        ]
+        self._last_text_query = (filter_index, text, matching)
+
+        return set(item_id for item_id, value in values) - set(
+            item_id for item_id, value in matching
+        )
+
+    def add_empty_groups(self, hidden):
+        """Adds to hidden the baskets and groups with all children hidden"""
+        for item in self.groups:
+            for index in range(item.childCount()):
+                if id(item.child(index)) not in hidden:
+                    break
+            else:
+                hidden.add(id(item))
+        return hidden
+
+    def apply(self, hidden):
+        """Updates the tree so that exactly the items of hidden are hidden.
+           Only items whose state changes are updated.
+
+        :param hidden: set of ids of the items to hide
+        :returns: number of updated items
+        """
+        self._check_index()
+        states = {}
+        changed = [
+            self.positions[item_id]
+            for item_id in hidden.symmetric_difference(self.hidden)
+            if item_id in self.positions
+        ]
+        heapq.heapify(changed)
+
+        updated = 0
+        self.tree_widget.setUpdatesEnabled(False)
+        try:
+            # parents first: set_hidden also changes the direct children
+            while changed:
+                item = self.items[heapq.heappop(changed)]
+                item_id = id(item)
+                item_hidden = item_id in hidden
+                if states.get(item_id, item_id in self.hidden) == item_hidden:
+                    continue
+                item.set_hidden(item_hidden)
+                states[item_id] = item_hidden
+                updated += 1
+                for index in range(item.childCount()):
+                    child_id = id(item.child(index))
+                    states[child_id] = item_hidden
+                    if (child_id in hidden) != item_hidden and (
+                        child_id in self.positions
+                    ):
+                        heapq.heappush(changed, self.positions[child_id])
+        finally:
+            self.tree_widget.setUpdatesEnabled(True)
+
+        self.hidden = set(hidden)
+        return updated
@@ -19,7 +19,7 @@
 
 import logging
 
-from mxcubeqt.utils import queue_item, qt_import
+from mxcubeqt.utils import queue_item, qt_import, snapshot_cache
 from mxcubeqt.widgets.create_task_base import CreateTaskBase
 from mxcubeqt.widgets.data_path_widget import DataPathWidget
 from mxcubeqt.widgets.acquisition_widget import AcquisitionWidget
@@ -309,7 +309,7 @@ class CreateAdvancedWidget(CreateTaskBase):
         mesh_dc = self._create_dc_from_grid(sample, selected_grid)
 
         cpos = queue_model_objects.CentredPosition()
-        cpos.snapshot_image = HWR.beamline.sample_view.get_snapshot()
+        cpos.snapshot_image = snapshot_cache.get_snapshot()
 
         exp_type = str(self._advanced_methods_widget.method_combo.currentText())
         if exp_type == "MeshScan":
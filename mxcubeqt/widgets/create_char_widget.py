@@ -17,10 +17,10 @@
 #  You should have received a copy of the GNU Lesser General Public License
 #  along with MXCuBE. If not, see <http://www.gnu.org/licenses/>.
 
-import copy
 import logging
 
-from mxcubeqt.utils import queue_item, qt_import
+from mxcubeqt.utils import queue_item, qt_import, snapshot_cache
+from mxcubeqt.utils.parameters_copy import copy_parameters
 from mxcubeqt.utils.widget_utils import DataModelInputBinder
 from mxcubeqt.widgets.create_task_base import CreateTaskBase
 from mxcubeqt.widgets.data_path_widget import DataPathWidget
@@ -273,15 +273,15 @@ class CreateCharWidget(CreateTaskBase):
 
         if not shape or not isinstance(shape, GraphicsItemPoint):
             cpos = queue_model_objects.CentredPosition()
-            cpos.snapshot_image = HWR.beamline.sample_view.get_snapshot()
+            cpos.snapshot_image = snapshot_cache.get_snapshot()
         else:
             # Shapes selected and sample is mounted, get the
             # centred positions for the shapes
-            snapshot = HWR.beamline.sample_view.get_snapshot(shape)
-            cpos = copy.deepcopy(shape.get_centred_position())
+            snapshot = snapshot_cache.get_snapshot(shape)
+            cpos = copy_parameters(shape.get_centred_position())
             cpos.snapshot_image = snapshot
 
-        char_params = copy.deepcopy(self._char_params)
+        char_params = copy_parameters(self._char_params)
         acq = self._create_acq(sample)
         dc = queue_model_objects.DataCollection(
             [acq], sample.crystals[0], self._processing_parameters
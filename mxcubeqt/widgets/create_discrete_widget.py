@@ -17,9 +17,9 @@
 #  You should have received a copy of the GNU Lesser General Public License
 #  along with MXCuBE. If not, see <http://www.gnu.org/licenses/>.
 
-import copy
 
-from mxcubeqt.utils import queue_item, qt_import
+from mxcubeqt.utils import queue_item, qt_import, snapshot_cache
+from mxcubeqt.utils.parameters_copy import copy_parameters
 from mxcubeqt.widgets.data_path_widget import DataPathWidget
 from mxcubeqt.widgets.processing_widget import ProcessingWidget
 from mxcubeqt.widgets.acquisition_widget import AcquisitionWidget
@@ -173,12 +173,12 @@ class CreateDiscreteWidget(CreateTaskBase):
         tasks = []
 
         if isinstance(shape, GraphicsItemPoint):
-            snapshot = HWR.beamline.sample_view.get_snapshot(shape)
-            cpos = copy.deepcopy(shape.get_centred_position())
+            snapshot = snapshot_cache.get_snapshot(shape)
+            cpos = copy_parameters(shape.get_centred_position())
             cpos.snapshot_image = snapshot
         else:
             cpos = queue_model_objects.CentredPosition()
-            cpos.snapshot_image = HWR.beamline.sample_view.get_snapshot()
+            cpos.snapshot_image = snapshot_cache.get_snapshot()
 
         tasks.extend(self.create_dc(sample, cpos=cpos, comments=comments))
         self._path_template.run_number += 1
@@ -224,7 +224,7 @@ class CreateDiscreteWidget(CreateTaskBase):
 
         acq.acquisition_parameters.centred_position = cpos
 
-        processing_parameters = copy.deepcopy(self._processing_parameters)
+        processing_parameters = copy_parameters(self._processing_parameters)
         data_collection = queue_model_objects.DataCollection(
             [acq], sample.crystals[0], processing_parameters
         )
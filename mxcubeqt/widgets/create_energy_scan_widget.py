@@ -17,10 +17,10 @@
 #  You should have received a copy of the GNU Lesser General Public License
 #  along with MXCuBE. If not, see <http://www.gnu.org/licenses/>.
 
-import copy
 import logging
 
-from mxcubeqt.utils import queue_item, qt_import
+from mxcubeqt.utils import queue_item, qt_import, snapshot_cache
+from mxcubeqt.utils.parameters_copy import copy_parameters
 from mxcubeqt.widgets.create_task_base import CreateTaskBase
 from mxcubeqt.widgets.data_path_widget import DataPathWidget
 from mxcubeqt.widgets.periodic_table_widget import PeriodicTableWidget
@@ -180,14 +180,14 @@ class CreateEnergyScanWidget(CreateTaskBase):
         if selected_element:
             if not shape:
                 cpos = queue_model_objects.CentredPosition()
-                cpos.snapshot_image = HWR.beamline.sample_view.get_snapshot()
+                cpos.snapshot_image = snapshot_cache.get_snapshot()
             else:
                 # Shapes selected and sample is mounted, get the
                 # centred positions for the shapes
                 if isinstance(shape, GraphicsItemPoint):
-                    snapshot = HWR.beamline.sample_view.get_snapshot(shape=shape)
+                    snapshot = snapshot_cache.get_snapshot(shape)
 
-                    cpos = copy.deepcopy(shape.get_centred_position())
+                    cpos = copy_parameters(shape.get_centred_position())
                     cpos.snapshot_image = snapshot
 
             path_template = self._create_path_template(sample, self._path_template)
@@ -17,10 +17,10 @@
 #  You should have received a copy of the GNU Lesser General Public License
 #  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
 
-import copy
 import logging
 
-from mxcubeqt.utils import queue_item, qt_import
+from mxcubeqt.utils import queue_item, qt_import, snapshot_cache
+from mxcubeqt.utils.parameters_copy import copy_parameters
 from mxcubeqt.widgets.create_task_base import CreateTaskBase
 from mxcubeqt.widgets.data_path_widget import DataPathWidget
 from mxcubeqt.widgets.acquisition_widget import AcquisitionWidget
@@ -277,14 +277,14 @@ class CreateHelicalWidget(CreateTaskBase):
         data_collections = []
 
         for shape in self.get_selected_shapes():
-            snapshot = HWR.beamline.sample_view.get_snapshot(shape=shape)
+            snapshot = snapshot_cache.get_snapshot(shape)
 
             # Acquisition for start position
             start_acq = self._create_acq(sample)
 
             start_graphical_point, end_graphical_point = shape.get_graphical_points()
 
-            start_acq.acquisition_parameters.centred_position = copy.deepcopy(
+            start_acq.acquisition_parameters.centred_position = copy_parameters(
                 start_graphical_point.get_centred_position()
             )
             start_acq.acquisition_parameters.centred_position.snapshot_image = snapshot
@@ -294,13 +294,13 @@ class CreateHelicalWidget(CreateTaskBase):
             # Add another acquisition for the end position
             end_acq = self._create_acq(sample)
 
-            end_acq.acquisition_parameters.centred_position = copy.deepcopy(
+            end_acq.acquisition_parameters.centred_position = copy_parameters(
                 end_graphical_point.get_centred_position()
             )
             end_acq.acquisition_parameters.centred_position.snapshot_image = snapshot
             end_acq.path_template.suffix = HWR.beamline.session.suffix
 
-            processing_parameters = copy.deepcopy(self._processing_parameters)
+            processing_parameters = copy_parameters(self._processing_parameters)
 
             dc = queue_model_objects.DataCollection(
                 [start_acq, end_acq], sample.crystals[0], processing_parameters
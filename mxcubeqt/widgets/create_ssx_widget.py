@@ -19,9 +19,8 @@
 
 """CreateSsxWidget allows to create a ssx acquisition method"""
 
-import copy
-
-from mxcubeqt.utils import queue_item, qt_import
+from mxcubeqt.utils import queue_item, qt_import, snapshot_cache
+from mxcubeqt.utils.parameters_copy import copy_parameters
 from mxcubeqt.widgets.create_task_base import CreateTaskBase
 from mxcubeqt.widgets.acquisition_ssx_widget import AcquisitionSsxWidget
 from mxcubeqt.widgets.data_path_widget import DataPathWidget
@@ -217,7 +216,7 @@ class CreateSsxWidget(CreateTaskBase):
         tasks = []
 
         cpos = queue_model_objects.CentredPosition()
-        cpos.snapshot_image = HWR.beamline.sample_view.get_snapshot()
+        cpos.snapshot_image = snapshot_cache.get_snapshot()
 
         tasks.extend(self.create_dc(sample, cpos=cpos, comments=comments))
         self._path_template.run_number += 1
@@ -274,7 +273,7 @@ class CreateSsxWidget(CreateTaskBase):
         if comments:
             acq.acquisition_parameters.comments = comments
 
-        processing_parameters = copy.deepcopy(self._processing_parameters)
+        processing_parameters = copy_parameters(self._processing_parameters)
         data_collection = queue_model_objects.DataCollection(
             [acq], sample.crystals[0], processing_parameters
         )
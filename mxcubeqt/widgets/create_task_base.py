@@ -20,9 +20,9 @@
 import os
 import abc
 import logging
-from copy import deepcopy
 
-from mxcubeqt.utils import queue_item, qt_import
+from mxcubeqt.utils import queue_item, qt_import, snapshot_cache
+from mxcubeqt.utils.parameters_copy import copy_parameters
 from mxcubecore.model import (
     queue_model_objects,
     queue_model_enumerables,
@@ -209,9 +209,8 @@ class CreateTaskBase(qt_import.QWidget):
         self._data_path_widget.update_file_name()
         if self._tree_brick is not None:
             self._tree_brick.dc_tree_widget.check_for_path_collisions()
-            path_conflict = HWR.beamline.queue_model.check_for_path_collisions(
-                self._path_template
-            )
+            path_conflict = self._tree_brick.dc_tree_widget.\
+                check_path_template_collision(self._path_template)
             self._data_path_widget.indicate_path_conflict(path_conflict)
             self._tree_brick.data_path_changed(path_conflict)
             self.pathTempleConflictSignal.emit(path_conflict)
@@ -409,12 +408,12 @@ class CreateTaskBase(qt_import.QWidget):
 
         if isinstance(tree_item, queue_item.SampleQueueItem):
             sample_data_model = sample_item.get_model()
-            self._path_template = deepcopy(self._path_template)
-
-            self._acquisition_parameters.centred_position.snapshot_image = None
-            self._acquisition_parameters = deepcopy(self._acquisition_parameters)
+            self._path_template = copy_parameters(self._path_template)
+            self._acquisition_parameters = copy_parameters(
+                self._acquisition_parameters
+            )
             self._acquisition_parameters.centred_position.snapshot_image = (
-                HWR.beamline.sample_view.get_snapshot()
+                snapshot_cache.get_snapshot()
             )
 
             # Sample with lims information, use values from lims
@@ -474,8 +473,10 @@ class CreateTaskBase(qt_import.QWidget):
             self.setDisabled(False)
 
         elif isinstance(tree_item, queue_item.BasketQueueItem):
-            self._path_template = deepcopy(self._path_template)
-            self._acquisition_parameters = deepcopy(self._acquisition_parameters)
+            self._path_template = copy_parameters(self._path_template)
+            self._acquisition_parameters = copy_parameters(
+                self._acquisition_parameters
+            )
             # (data_directory, proc_directory) = self.get_default_directory(tree_item)
             # self._path_template.directory = data_directory
             # self._path_template.process_directory = proc_directory
@@ -581,7 +582,7 @@ class CreateTaskBase(qt_import.QWidget):
                     if hasattr(cpos, "kappa_phi"):
                         kappa_phi = cpos.kappa_phi
                     if isinstance(item, queue_item.TaskQueueItem):
-                        snapshot = HWR.beamline.sample_view.get_snapshot(
+                        snapshot = snapshot_cache.get_snapshot(
                             shape=position
                         )
                         cpos.snapshot_image = snapshot
@@ -750,7 +751,7 @@ class CreateTaskBase(qt_import.QWidget):
            %s : sample name
         """
 
-        acq_path_template = deepcopy(path_template)
+        acq_path_template = copy_parameters(path_template)
 
         if "<sample_name>" in acq_path_template.directory:
             name = sample.get_name().replace(":", "-")
@@ -822,10 +823,10 @@ class CreateTaskBase(qt_import.QWidget):
 
         acq = queue_model_objects.Acquisition()
 
-        parameters.centred_position.snapshot_image = None
-        acq.acquisition_parameters = deepcopy(parameters)
+        acq.acquisition_parameters = copy_parameters(parameters)
+        acq.acquisition_parameters.centred_position.snapshot_image = None
         self._acquisition_parameters.centred_position.snapshot_image = (
-            HWR.beamline.sample_view.get_snapshot()
+            snapshot_cache.get_snapshot()
         )
         acq.acquisition_parameters.collect_agent = (
             queue_model_enumerables.COLLECTION_ORIGIN.MXCUBE
@@ -842,7 +843,7 @@ class CreateTaskBase(qt_import.QWidget):
         if grid is None:
             grid = HWR.beamline.sample_view.create_auto_grid()
 
-        grid.set_snapshot(HWR.beamline.sample_view.get_snapshot(grid))
+        grid.set_snapshot(snapshot_cache.get_snapshot(grid))
 
         grid_properties = grid.get_properties()
 
@@ -858,7 +859,7 @@ class CreateTaskBase(qt_import.QWidget):
         )
         grid.set_osc_range(acq.acquisition_parameters.osc_range)
 
-        processing_parameters = deepcopy(self._processing_parameters)
+        processing_parameters = copy_parameters(self._processing_parameters)
 
         dc = queue_model_objects.DataCollection(
             [acq], sample.crystals[0], processing_parameters
@@ -17,9 +17,9 @@
 #  You should have received a copy of the GNU Lesser General Public License
 #  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
 
-import copy
 
-from mxcubeqt.utils import queue_item, qt_import
+from mxcubeqt.utils import queue_item, qt_import, snapshot_cache
+from mxcubeqt.utils.parameters_copy import copy_parameters
 from mxcubeqt.widgets.create_task_base import CreateTaskBase
 from mxcubeqt.widgets.data_path_widget import DataPathWidget
 from mxcubeqt.widgets.acquisition_widget import AcquisitionWidget
@@ -143,7 +143,7 @@ class CreateXrayImagingWidget(CreateTaskBase):
         self.setDisabled(True)
 
         if isinstance(tree_item, queue_item.SampleQueueItem):
-            self._xray_imaging_parameters = copy.deepcopy(self._xray_imaging_parameters)
+            self._xray_imaging_parameters = copy_parameters(self._xray_imaging_parameters)
             self._xray_imaging_parameters_widget.update_data_model(
                 self._xray_imaging_parameters
             )
@@ -180,12 +180,12 @@ class CreateXrayImagingWidget(CreateTaskBase):
     # a collection. When a data collection group is selected.
     def _create_task(self, sample, shape, comments=None):
         if isinstance(shape, GraphicsItemPoint):
-            snapshot = HWR.beamline.sample_view.get_snapshot(shape=shape)
-            cpos = copy.deepcopy(shape.get_centred_position())
+            snapshot = snapshot_cache.get_snapshot(shape)
+            cpos = copy_parameters(shape.get_centred_position())
             cpos.snapshot_image = snapshot
         else:
             cpos = queue_model_objects.CentredPosition()
-            cpos.snapshot_image = HWR.beamline.sample_view.get_snapshot()
+            cpos.snapshot_image = snapshot_cache.get_snapshot()
  
         detector_distance_list = []
         dc_list = []
@@ -200,7 +200,7 @@ class CreateXrayImagingWidget(CreateTaskBase):
         do_it = True
 
         for detector_distance in detector_distance_list:
-            xray_imaging_parameters = copy.deepcopy(self._xray_imaging_parameters)
+            xray_imaging_parameters = copy_parameters(self._xray_imaging_parameters)
             xray_imaging_parameters.detector_distance = detector_distance
 
             acq = self._create_acq(sample)
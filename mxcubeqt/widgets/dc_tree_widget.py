@@ -31,7 +31,11 @@ import webbrowser
 from datetime import datetime
 from collections import namedtuple
 
-from mxcubeqt.utils import colors, icons, queue_item, qt_import
+from mxcubeqt.utils import colors, icons, queue_item, qt_import, snapshot_cache
+from mxcubeqt.utils.path_collision import PathCollisionIndex
+from mxcubeqt.utils.queue_autosave import has_parameters
+from mxcubeqt.utils.queue_history import QueueHistoryStore
+from mxcubeqt.utils.tree_filter import TreeFilter
 from mxcubeqt.widgets.confirm_dialog import ConfirmDialog
 from mxcubeqt.widgets.plate_navigator_widget import PlateNavigatorWidget
 
@@ -40,6 +44,7 @@ from mxcubecore.model import (
     queue_model_enumerables
 )
 from mxcubecore import queue_entry
+from mxcubecore.dispatcher import dispatcher
 
 from mxcubecore import HardwareRepository as HWR
 
@@ -80,13 +85,25 @@ class DataCollectTree(qt_import.QWidget):
         self.user_stopped = False
         self.last_added_item = None
         self.item_copy = None
+        # id(model) -> tree item, maintained by add_to_view, delete_click
+        # and clear_tree
+        self.model_item_index = {}
+        # while > 0 add_to_view does not repaint, resize or autosave,
+        # see begin_bulk_update / end_bulk_update
+        self.bulk_update_level = 0
+        self.bulk_update_autosave_nodes = []
 
         self.selection_changed_cb = None
         self.collect_stop_cb = None
         #self.clear_centred_positions_cb = None
         self.run_cb = None
         self.item_menu = None
-        self.item_history_list = []
+        self.history_store = None
+        # date -> date item, (date, hour) -> hour item of the history view
+        self.history_date_items = {}
+        self.history_hour_items = {}
+        # dates of the store whose entries are not yet in the view
+        self.history_unloaded_dates = set()
         self.close_kappa = False
         self.show_sc_during_mount = True
 
@@ -141,6 +158,8 @@ class DataCollectTree(qt_import.QWidget):
 
         self.tree_splitter = qt_import.QSplitter(qt_import.Qt.Vertical, self)
         self.sample_tree_widget = qt_import.QTreeWidget(self.tree_splitter)
+        self.tree_filter = TreeFilter(self.sample_tree_widget)
+        self.path_collision_index = PathCollisionIndex()
         self.history_tree_widget = qt_import.QTreeWidget(self.tree_splitter)
         self.history_tree_widget.setHidden(True)
         self.history_enable_cbox = qt_import.QCheckBox("Queue history", self)
@@ -197,9 +216,14 @@ class DataCollectTree(qt_import.QWidget):
         #     connect(self.history_table_double_click)
         self.history_enable_cbox.stateChanged.\
             connect(self.history_tree_widget.setVisible)
+        self.history_tree_widget.itemExpanded.connect(
+            self.history_item_expanded)
 
         self.plate_navigator_cbox.stateChanged.\
             connect(self.use_plate_navigator)
+        # parameters edited in the parameter widgets (DataModelInputBinder)
+        dispatcher.connect(self.parameters_model_updated, "model_update",
+                           dispatcher.Any)
 
         # Other ---------------------------------------------------------------
         # TODO number of columns should not be hard coded but come from processing
@@ -383,6 +407,22 @@ class DataCollectTree(qt_import.QWidget):
         items = self.get_selected_items()
         for item in items:
             item.update_display_name()
+        self.tree_filter.invalidate()
+        self.tree_brick.auto_save_queue(*[item.get_model() for item in items])
+
+    def parameters_model_updated(self, field_name, data_binder, sender=None):
+        """Requests a queue autosave when the parameter widgets edit the
+           parameters of a selected item (model_update is sent by
+           DataModelInputBinder, the edited parameters are the sender)
+        """
+        nodes = [
+            item.get_model()
+            for item in self.get_selected_items()
+            if isinstance(item, queue_item.TaskQueueItem)
+            and has_parameters(item.get_model(), sender)
+        ]
+        if nodes:
+            self.tree_brick.auto_save_queue(*nodes)
 
     def context_collect_item(self):
         """Calls collect_items method"""
@@ -700,20 +740,65 @@ class DataCollectTree(qt_import.QWidget):
             self.enable_collect_condition and not self.collecting)
 
     def get_item_by_model(self, parent_node):
-        """Returns tree item by its model
+        """Returns tree item by its model. If the model has no item in the
+           tree then the tree widget is returned
         """
-        it = qt_import.QTreeWidgetItemIterator(self.sample_tree_widget)
-        item = it.value()
-
-        while item:
-            if item.get_model() is parent_node:
+        item = self.model_item_index.get(id(parent_node))
+        if item is not None:
+            if (
+                item.get_model() is parent_node
+                and item.treeWidget() is self.sample_tree_widget
+            ):
                 return item
-
-            it += 1
-            item = it.value()
+            # item removed from the tree without delete_click
+            del self.model_item_index[id(parent_node)]
 
         return self.sample_tree_widget
 
+    def remove_from_index(self, item):
+        """Removes item and its children from the model index"""
+        self.tree_filter.invalidate()
+        self.path_collision_index.invalidate()
+        items = [item]
+        while items:
+            item = items.pop()
+            model = item.get_model()
+            if self.model_item_index.get(id(model)) is item:
+                del self.model_item_index[id(model)]
+            items.extend(item.child(index) for index in range(item.childCount()))
+
+    def clear_tree(self):
+        """Removes all items from the tree"""
+        self.sample_tree_widget.clear()
+        self.model_item_index.clear()
+        self.tree_filter.invalidate()
+        self.path_collision_index.invalidate()
+        self.last_added_item = None
+
+    def begin_bulk_update(self):
+        """Starts adding many items to the tree. Repaint, column resizing,
+           collect button update and queue autosave are suspended until
+           end_bulk_update is called. Calls can be nested.
+        """
+        if self.bulk_update_level == 0:
+            self.bulk_update_autosave_nodes = []
+            self.sample_tree_widget.setUpdatesEnabled(False)
+        self.bulk_update_level += 1
+
+    def end_bulk_update(self):
+        """Ends adding many items and refreshes the tree once"""
+        self.bulk_update_level = max(self.bulk_update_level - 1, 0)
+        if self.bulk_update_level > 0:
+            return
+
+        self.sample_tree_widget.resizeColumnToContents(0)
+        self.sample_tree_widget.setUpdatesEnabled(True)
+        self.toggle_collect_button_enabled()
+        autosave_nodes = self.bulk_update_autosave_nodes
+        self.bulk_update_autosave_nodes = []
+        if autosave_nodes:
+            self.tree_brick.auto_save_queue(*autosave_nodes)
+
     def last_top_level_item(self):
         """Returns the last top level item"""
         last_child_index = self.sample_tree_widget.topLevelItemCount() - 1
@@ -735,6 +820,9 @@ class DataCollectTree(qt_import.QWidget):
 
         cls = queue_item.MODEL_VIEW_MAPPINGS[task.__class__]
         view_item = cls(parent_tree_item, last_item, task.get_display_name())
+        self.model_item_index[id(task)] = view_item
+        self.tree_filter.invalidate()
+        self.path_collision_index.invalidate()
 
         if isinstance(task, queue_model_objects.Basket):
             view_item.setExpanded(task.get_is_present() == True)
@@ -744,16 +832,22 @@ class DataCollectTree(qt_import.QWidget):
 
         HWR.beamline.queue_model.view_created(view_item, task)
         # self.sample_tree_widget_selection()
-        self.toggle_collect_button_enabled()
-
         self.last_added_item = view_item
 
-        if isinstance(view_item, queue_item.TaskQueueItem) and \
-                self.samples_initialized:
-            self.tree_brick.auto_save_queue()
+        if self.bulk_update_level > 0:
+            # refreshed once by end_bulk_update
+            if isinstance(view_item, queue_item.TaskQueueItem) and \
+                    self.samples_initialized:
+                self.bulk_update_autosave_nodes.append(task)
+        else:
+            self.toggle_collect_button_enabled()
+
+            if isinstance(view_item, queue_item.TaskQueueItem) and \
+                    self.samples_initialized:
+                self.tree_brick.auto_save_queue(task)
 
-        #for col in range(2):
-        self.sample_tree_widget.resizeColumnToContents(0)
+            #for col in range(2):
+            self.sample_tree_widget.resizeColumnToContents(0)
 
         if isinstance(task, queue_model_objects.DataCollection):
             view_item.init_tool_tip()
@@ -844,14 +938,23 @@ class DataCollectTree(qt_import.QWidget):
         self.sample_tree_widget.clearSelection()
         self.confirm_dialog.set_plate_mode(False)
         self.sample_mount_method = option
+        self.tree_filter.invalidate()
         if option == SC_FILTER_OPTIONS.SAMPLE_CHANGER:
-            self.sample_tree_widget.clear()
-            HWR.beamline.queue_model.select_model('ispyb')
-            self.set_sample_pin_icon()
+            self.clear_tree()
+            self.begin_bulk_update()
+            try:
+                HWR.beamline.queue_model.select_model('ispyb')
+                self.set_sample_pin_icon()
+            finally:
+                self.end_bulk_update()
         elif option == SC_FILTER_OPTIONS.PLATE:
-            self.sample_tree_widget.clear()
-            HWR.beamline.queue_model.select_model('plate')
-            self.set_sample_pin_icon()
+            self.clear_tree()
+            self.begin_bulk_update()
+            try:
+                HWR.beamline.queue_model.select_model('plate')
+                self.set_sample_pin_icon()
+            finally:
+                self.end_bulk_update()
         elif option == SC_FILTER_OPTIONS.MOUNTED_SAMPLE:
             loaded_sample_loc = None
 
@@ -882,10 +985,11 @@ class DataCollectTree(qt_import.QWidget):
                 it += 1
                 item = it.value()
 
+            # also invalidates the tree filter after the samples were hidden
             self.hide_empty_baskets()
 
         elif option == SC_FILTER_OPTIONS.FREE_PIN:
-            self.sample_tree_widget.clear()
+            self.clear_tree()
             HWR.beamline.queue_model.select_model('free-pin')
             self.set_sample_pin_icon()
         self.sample_tree_widget_selection()
@@ -1119,26 +1223,49 @@ class DataCollectTree(qt_import.QWidget):
 
     def add_history_entry(self, sample_name, date, time, entry_type,
                           status, entry_details, view_item=None):
-        # At the top level insert date
-        date_item = None
-        for item_index in range(self.history_tree_widget.topLevelItemCount()):
-            if self.history_tree_widget.topLevelItem(item_index).text(0) == date:
-                date_item = self.history_tree_widget.topLevelItem(item_index)
-                break
-        if not date_item:
+        """Adds an entry to the history view and to the history store"""
+        if self.history_store is not None:
+            self.history_store.append(sample_name, date, time, entry_type,
+                                      status, entry_details)
+        if date in self.history_unloaded_dates:
+            # the entry is shown with the others when the date is expanded
+            return
+
+        self.add_history_view_entry(sample_name, date, time, entry_type,
+                                    status, entry_details)
+        for col in range(1, 4):
+            self.history_tree_widget.resizeColumnToContents(col)
+
+    def get_history_date_item(self, date):
+        """Returns the history view item of a date, creates it if needed"""
+        date_item = self.history_date_items.get(date)
+        if date_item is None:
             date_item = qt_import.QTreeWidgetItem()
             date_item.setText(0, date)
-            self.history_tree_widget.insertTopLevelItem(0, date_item)
-
-        time_item = None
-        for item_index in range(date_item.childCount()):
-            if date_item.child(item_index).text(0) == time.split(":")[0] + "h":
-                time_item = date_item.child(item_index)
+            # dates are sorted newest first
+            index = self.history_tree_widget.topLevelItemCount()
+            if index > 0 and \
+                    self.history_tree_widget.topLevelItem(index - 1).text(0) < date:
+                index = 0
+                while self.history_tree_widget.topLevelItem(index).text(0) > date:
+                    index += 1
+            self.history_tree_widget.insertTopLevelItem(index, date_item)
+            self.history_date_items[date] = date_item
+        return date_item
+
+    def add_history_view_entry(self, sample_name, date, time, entry_type,
+                               status, entry_details):
+        """Adds an entry to the history view"""
+        # At the top level insert date
+        date_item = self.get_history_date_item(date)
 
-        if not time_item:
+        hour = time.split(":")[0] + "h"
+        time_item = self.history_hour_items.get((date, hour))
+        if time_item is None:
             time_item = qt_import.QTreeWidgetItem()
-            time_item.setText(0, time.split(":")[0] + "h")
+            time_item.setText(0, hour)
             date_item.insertChild(0, time_item)
+            self.history_hour_items[(date, hour)] = time_item
 
         entry_item = qt_import.QTreeWidgetItem()
         entry_item.setText(0, time)
@@ -1154,18 +1281,20 @@ class DataCollectTree(qt_import.QWidget):
 
         time_item.insertChild(0, entry_item)
 
+    def history_item_expanded(self, item):
+        """Loads the entries of a date from the history store"""
+        date = str(item.text(0))
+        if item.parent() is not None or date not in self.history_unloaded_dates:
+            return
+
+        self.history_unloaded_dates.discard(date)
+        item.takeChildren()
+        self.history_tree_widget.setUpdatesEnabled(False)
+        for entry in self.history_store.get_entries(date):
+            self.add_history_view_entry(*entry[:6])
         for col in range(1, 4):
             self.history_tree_widget.resizeColumnToContents(col)
-        """
-        self.history_tree_widget.setItem(0, 4, QTableWidgetItem(entry_details))
-        self.history_tree_widget.resizeRowsToContents()
-        self.history_tree_widget.resizeColumnsToContents()
-        self.history_tree_widget.setRowHeight(0, 17)
-        self.history_tree_widget.setVerticalHeaderItem(\
-             0, QTableWidgetItem(str(self.history_tree_widget.rowCount())))
-        """
-        self.item_history_list.append((sample_name, date, time, entry_type,
-                                       status, entry_details))
+        self.history_tree_widget.setUpdatesEnabled(True)
 
     def queue_execution_completed(self, status):
         """Restores normal cursors, changes collect button
@@ -1235,11 +1364,24 @@ class DataCollectTree(qt_import.QWidget):
                                   queue_item.SampleQueueItem,
                                   queue_item.DataCollectionGroupQueueItem):
                 new_node = HWR.beamline.queue_model.copy_node(item.get_model())
-                new_node.set_snapshot(HWR.beamline.sample_view.get_snapshot())
+                new_node.set_snapshot(snapshot_cache.get_snapshot())
                 HWR.beamline.queue_model.add_child(
                     item.get_model().get_parent(), new_node)
         self.sample_tree_widget_selection()
 
+    def remove_item(self, item):
+        """Removes a tree item, its queue entry and its model node"""
+        parent = item.parent()
+        HWR.beamline.queue_model.del_child(parent.get_model(),
+                                           item.get_model())
+        qe = item.get_queue_entry()
+        parent.get_queue_entry().dequeue(qe)
+        parent.takeChild(parent.indexOfChild(item))
+        self.remove_from_index(item)
+
+        if not parent.child(0):
+            parent.setOn(False)
+
     def delete_click(self, selected_items=None):
         """Deletes selected items"""
         children = []
@@ -1252,15 +1394,10 @@ class DataCollectTree(qt_import.QWidget):
             if item.deletable and parent:
                 if not parent.isSelected() or (not parent.deletable):
                     self.tree_brick.show_sample_centring_tab()
-
-                    HWR.beamline.queue_model.del_child(parent.get_model(),
-                                                     item.get_model())
-                    qe = item.get_queue_entry()
-                    parent.get_queue_entry().dequeue(qe)
-                    parent.takeChild(parent.indexOfChild(item))
-
-                    if not parent.child(0):
-                        parent.setOn(False)
+                    # the task group of the item is saved again, a
+                    # deleted task group is removed from the saved queue
+                    self.tree_brick.auto_save_queue(parent.get_model())
+                    self.remove_item(item)
             else:
                 item.reset_style()
 
@@ -1296,6 +1433,7 @@ class DataCollectTree(qt_import.QWidget):
             if isinstance(item, queue_item.QueueItem):
                 if item.treeWidget().itemBelow(item) is not None:
                     item.move_item(item.treeWidget().itemBelow(item))
+                    self.tree_filter.invalidate()
                     self.sample_tree_widget_selection()
 
     def previous_sibling(self, item):
@@ -1333,6 +1471,7 @@ class DataCollectTree(qt_import.QWidget):
                 older_sibling = self.sample_tree_widget.itemAbove(item)
                 if older_sibling:
                     older_sibling.move_item(item)
+                    self.tree_filter.invalidate()
                     self.sample_tree_widget_selection()
 
     def samples_from_sc_content(self, sc_basket_content, sc_sample_content):
@@ -1411,18 +1550,27 @@ class DataCollectTree(qt_import.QWidget):
 
         HWR.beamline.queue_manager.clear()
         HWR.beamline.queue_model.clear_model(mode_str)
-        self.sample_tree_widget.clear()
+        self.clear_tree()
         HWR.beamline.queue_model.select_model(mode_str)
 
-        for basket_index, basket in enumerate(basket_list):
-            HWR.beamline.queue_model.add_child(HWR.beamline.queue_model.get_model_root(), basket)
-            basket.set_enabled(False)
-            for sample in sample_list:
-                if sample.location[0] == basket_index + 1:
+        # group samples by basket in one pass
+        basket_samples = {}
+        for sample in sample_list:
+            basket_samples.setdefault(sample.location[0], []).append(sample)
+
+        model_root = HWR.beamline.queue_model.get_model_root()
+        self.begin_bulk_update()
+        try:
+            for basket_index, basket in enumerate(basket_list):
+                HWR.beamline.queue_model.add_child(model_root, basket)
+                basket.set_enabled(False)
+                for sample in basket_samples.get(basket_index + 1, ()):
                     basket.add_sample(sample)
                     HWR.beamline.queue_model.add_child(basket, sample)
                     sample.set_enabled(False)
-        self.set_sample_pin_icon()
+            self.set_sample_pin_icon()
+        finally:
+            self.end_bulk_update()
 
     def set_sample_pin_icon(self):
         """Updates sample icon"""
@@ -1480,6 +1628,8 @@ class DataCollectTree(qt_import.QWidget):
     def check_for_path_collisions(self):
         """Checks for path conflicts"""
         conflict = False
+        self.path_collision_index.refresh()
+        conflicting_path_templates = self.path_collision_index.get_conflicts()
         it = qt_import.QTreeWidgetItemIterator(self.sample_tree_widget)
         item = it.value()
 
@@ -1488,8 +1638,7 @@ class DataCollectTree(qt_import.QWidget):
                 pt = item.get_model().get_path_template()
 
                 if pt:
-                    path_conflict = HWR.beamline.queue_model.\
-                        check_for_path_collisions(pt)
+                    path_conflict = id(pt) in conflicting_path_templates
 
                     if path_conflict:
                         conflict = True
@@ -1505,6 +1654,12 @@ class DataCollectTree(qt_import.QWidget):
 
         return conflict
 
+    def check_path_template_collision(self, path_template):
+        """Returns True if path_template collides with a path template
+           of the queue
+        """
+        return self.path_collision_index.check_path_template(path_template)
+
     def select_last_added_item(self):
         """Selects last added item"""
         if self.last_added_item:
@@ -1530,6 +1685,8 @@ class DataCollectTree(qt_import.QWidget):
 
             self.item_iterator += 1
             item = self.item_iterator.value()
+        # items hidden here are unknown to the tree filter
+        self.tree_filter.invalidate()
 
     def delete_empty_finished_items(self):
         """Deletes collected items"""
@@ -1573,7 +1730,7 @@ class DataCollectTree(qt_import.QWidget):
                     HWR.beamline.queue_model.get_next_run_number(
                     new_node.acquisitions[0].path_template)
 
-            new_node.set_snapshot(HWR.beamline.sample_view.get_snapshot())
+            new_node.set_snapshot(snapshot_cache.get_snapshot())
 
             if isinstance(item, queue_item.DataCollectionQueueItem):
                 parent_nodes = [item.get_model().get_parent()]
@@ -1695,7 +1852,7 @@ class DataCollectTree(qt_import.QWidget):
                                                             "Open file", os.environ["HOME"],
                                                             "Item file (*.dat)", "Choose queue file to open"))
         if len(filename) > 0:
-            self.sample_tree_widget.clear()
+            self.clear_tree()
             loaded_model = HWR.beamline.queue_model.load_queue(filename,
                                                              HWR.beamline.sample_view.get_snapshot())
             return loaded_model
@@ -1704,35 +1861,28 @@ class DataCollectTree(qt_import.QWidget):
         pass
 
     def save_history_in_file(self):
-        filename = os.path.join(self.tree_brick.user_file_directory,
-                                "queue_history.dat")
-        save_file = None
-        try:
-            save_file = open(filename, 'w')
-            #items_to_save = []
-            # for item in self.item_history_list:
-            #    items_to_save.append(item.get_model())
-            # save_file.write(jsonpickle.encode(items_to_save))
-            save_file.write(jsonpickle.encode(self.item_history_list))
-        except BaseException:
-            logging.getLogger().exception("Cannot save file %s", filename)
-            if save_file:
-                save_file.close()
+        """History entries are saved in the history store when added"""
+        pass
 
     def load_history_queue_from_file(self):
-        filename = os.path.join(self.tree_brick.user_file_directory,
-                                "queue_history.dat")
-
-        load_file = None
+        """Opens the history store of the user file directory and lists
+           its dates. Entries of a date are loaded when it is expanded.
+        """
         try:
-            load_file = open(filename, 'r')
-            for item in jsonpickle.decode(load_file.read()):
-                self.add_history_entry(*item)
+            self.history_store = QueueHistoryStore(
+                self.tree_brick.user_file_directory)
         except BaseException:
-            pass
-        finally:
-            if load_file:
-                load_file.close()
+            logging.getLogger("HWR").exception("Cannot open queue history")
+            self.history_store = None
+            return
+
+        for date in self.history_store.get_dates():
+            if date in self.history_date_items:
+                continue
+            date_item = self.get_history_date_item(date)
+            # placeholder making the date expandable
+            date_item.addChild(qt_import.QTreeWidgetItem(["..."]))
+            self.history_unloaded_dates.add(date)
 
     def undo_queue(self):
         """Undo last change"""
@@ -1787,7 +1937,7 @@ class DataCollectTree(qt_import.QWidget):
         task_node = self.create_task_group(sample_model, "Diffraction plan")
         prefix = HWR.beamline.session.get_default_prefix(
             sample_model)
-        snapshot = HWR.beamline.sample_view.get_snapshot()
+        snapshot = snapshot_cache.get_snapshot()
 
         if sample_model.diffraction_plan.experimentKind in ("OSC", "Default"):
             acq = queue_model_objects.Acquisition()
@@ -17,6 +17,7 @@
 #  You should have received a copy of the GNU Lesser General Public License
 #  along with MXCuBE. If not, see <http://www.gnu.org/licenses/>.
 
+import time
 import numpy as np
 from copy import deepcopy
 
@@ -61,8 +62,16 @@ class HitMapWidget(qt_import.QWidget):
         self.__enable_continues_image_display = False
         #self.__tooltip_text = None
         self.selected_image_serial = None
+        self.__displayed_scores = None
+        self.__displayed_max = None
+        self.__last_redraw_time = 0
+        self.max_redraw_rate = 10
 
         # Graphic elements ----------------------------------------------------
+        self._redraw_timer = qt_import.QTimer(self)
+        self._redraw_timer.setSingleShot(True)
+        self._redraw_timer.timeout.connect(self.redraw_results)
+
         self._hit_map_gbox = qt_import.QGroupBox("Online processing results", self)
         hit_maps_widget = qt_import.QWidget(self._hit_map_gbox)
         self._osc_hit_map_plot = PlotWidget(hit_maps_widget)
@@ -293,13 +302,14 @@ class HitMapWidget(qt_import.QWidget):
 
         self._osc_hit_map_plot.hide_all_curves()
         self._osc_hit_map_plot.show_curve(self.__score_key)
-        self._osc_hit_map_plot.autoscale_axes()
-        self.adjust_y_labels()
+        if self.__results_raw is None:
+            return
+
+        # only the visible curve is kept up to date during processing
+        self.__displayed_scores = None
+        self.redraw_results()
 
         if self.__grid:
-            self._grid_hit_map_plot.plot_result(
-                self.__results_aligned[self.__score_key]
-            )
             self.__grid.set_score(
                 self.__results_raw[self.__score_key]
             )
@@ -391,6 +401,7 @@ class HitMapWidget(qt_import.QWidget):
         """
         self.__results_raw = results_raw
         self.__results_aligned = results_aligned
+        self.__displayed_scores = None
 
         #self.__is_mesh_scan = list(self.__results_aligned.values())[0].ndim == 2
 
@@ -408,12 +419,73 @@ class HitMapWidget(qt_import.QWidget):
         #self._grid_hit_map_plot.autoscale_axes()
 
     def update_results(self, last_results):
-        self._osc_hit_map_plot.update_curves(self.__results_raw)
-        self._osc_hit_map_plot.autoscale_axes()
-        self.adjust_y_labels()
+        """Updates the hit maps with new processing results.
+           Redraws are throttled to max_redraw_rate per second.
+
+        :param last_results: True if processing is finished
+        :type last_results: bool
+        """
+        if self.__results_raw is None:
+            return
+
+        if last_results:
+            self._redraw_timer.stop()
+            self._osc_hit_map_plot.update_curves(self.__results_raw)
+            self.redraw_results(force=True)
+            return
+
+        remaining_time = 1.0 / self.max_redraw_rate - (
+            time.time() - self.__last_redraw_time
+        )
+        if remaining_time <= 0:
+            self._redraw_timer.stop()
+            self.redraw_results()
+        elif not self._redraw_timer.isActive():
+            self._redraw_timer.start(int(remaining_time * 1000))
+
+    def redraw_results(self, force=False):
+        """Redraws the visible curve and the grid if frames have changed
+           (results are updated in place by the online processing, changes
+           are found by comparing with the displayed data). Axes range and
+           labels are only recomputed if the maximum value has changed.
+
+        :param force: redraw even if no change is detected
+        """
+        self.__last_redraw_time = time.time()
+        if self.__results_raw is None:
+            return
+
+        scores = self.__results_raw[self.__score_key]
+        flat_scores = scores.ravel()
+
+        if self.__displayed_scores is None or (
+            self.__displayed_scores.shape != flat_scores.shape
+        ):
+            self.__displayed_scores = np.zeros_like(flat_scores)
+            self.__displayed_max = None
+            changed = True
+        else:
+            changed = not np.array_equal(flat_scores, self.__displayed_scores)
+
+        if not changed and not force:
+            return
+        self.__displayed_scores[:] = flat_scores
+
+        self._osc_hit_map_plot.update_curve(self.__score_key, scores)
+
+        max_value = flat_scores.max() if flat_scores.size else 0
+        max_changed = max_value != self.__displayed_max
+        if max_changed or force:
+            self.__displayed_max = max_value
+            self._osc_hit_map_plot.autoscale_axes()
+            self.adjust_y_labels()
+
         if self.__grid:
-            self._grid_hit_map_plot.plot_result(self.__results_aligned[self.__score_key])
-        
+            self._grid_hit_map_plot.update_result(
+                self.__results_aligned[self.__score_key],
+                levels=(0, max_value or 1),
+            )
+
     def clean_result(self):
         """
         Method to clean hit map, summary log and table with best positions
@@ -422,6 +494,9 @@ class HitMapWidget(qt_import.QWidget):
         self.__results_aligned = None
         self.__grid = None
         self.__data_collection = None
+        self.__displayed_scores = None
+        self.__displayed_max = None
+        self._redraw_timer.stop()
         self._osc_hit_map_plot.clear()
         self._grid_hit_map_plot.clear()
         self._threshold_slider.setValue(0)
@@ -18,11 +18,14 @@
 #  You should have received a copy of the GNU Lesser General Public License
 #  along with MXCuBE.  If not, see <http://www.gnu.org/licenses/>.
 
+import time
+
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.figure import Figure
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 from mxcubeqt.utils import qt_import
+from mxcubeqt.utils.curve_decimation import CurveDecimator
 
 if qt_import.qt_variant == "PyQt5":
     from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
@@ -34,6 +37,82 @@ __credits__ = ["MXCuBE collaboration"]
 __license__ = "LGPLv3+"
 
 
+# Maximal number of redraws per second of the real time plots
+DEFAULT_MAX_FPS = 10
+# Part of the x range left free on the right of real time plots, the
+# axes are redrawn when the curve reaches the end of the range
+X_RANGE_MARGIN = 0.1
+
+
+class RingBuffer(object):
+    """
+    Descript. : Buffer of (x, y) points with O(1) append.
+                With a capacity the oldest points are dropped when it is
+                full, otherwise the buffer grows. Every point is written
+                twice in a fixed size buffer so that the points are
+                always available as contiguous arrays (views).
+    """
+
+    def __init__(self, capacity=None, initial_size=1024):
+        """
+        :param capacity: maximal number of points, None for no limit
+        :param initial_size: initial size of a growing buffer
+        """
+        self.capacity = capacity or None
+        self._start = 0
+        self._size = 0
+        if self.capacity:
+            self._x = np.empty(2 * self.capacity)
+            self._y = np.empty(2 * self.capacity)
+        else:
+            self._x = np.empty(initial_size)
+            self._y = np.empty(initial_size)
+
+    def __len__(self):
+        return self._size
+
+    def append(self, x, y):
+        if self.capacity:
+            if self._size == self.capacity:
+                index = self._start
+                self._start = (self._start + 1) % self.capacity
+            else:
+                index = (self._start + self._size) % self.capacity
+                self._size += 1
+            self._x[index] = self._x[index + self.capacity] = x
+            self._y[index] = self._y[index + self.capacity] = y
+        else:
+            if self._size == self._x.size:
+                self._x = np.concatenate((self._x, np.empty(self._x.size)))
+                self._y = np.concatenate((self._y, np.empty(self._y.size)))
+            self._x[self._size] = x
+            self._y[self._size] = y
+            self._size += 1
+
+    def get_data(self):
+        """
+        :returns: x and y arrays (views on the buffer), oldest point first
+        """
+        end = self._start + self._size
+        return self._x[self._start : end], self._y[self._start : end]
+
+    def clear(self):
+        self._start = 0
+        self._size = 0
+
+    def set_capacity(self, capacity):
+        """Changes the capacity, the last points are kept"""
+        x_data, y_data = self.get_data()
+        if capacity:
+            x_data = x_data[-capacity:]
+            y_data = y_data[-capacity:]
+        x_data = x_data.copy()
+        y_data = y_data.copy()
+        self.__init__(capacity, max(1024, x_data.size * 2))
+        for x, y in zip(x_data, y_data):
+            self.append(x, y)
+
+
 class TwoAxisPlotWidget(qt_import.QWidget):
     def __init__(self, parent, realtime_plot=False):
 
@@ -179,12 +258,26 @@ class MplCanvas(FigureCanvas):
 
         self.single_curve = None
         self.real_time = None
-        self._axis_x_array = np.empty(0)
-        self._axis_y_array = np.empty(0)
-        self._axis_x_limits = [None, None]
-        self._axis_y_limits = [None, None]
+
+        # real time curve: points are buffered by append_new_point and
+        # drawn by render_points at most max_fps times per second
+        self.max_fps = DEFAULT_MAX_FPS
+        self._points = RingBuffer()
+        self._point_count = 0
+        self._index_x = True
+        self._fill_patch = None
+        self._background = None
+        self._render_pending = False
+        self._last_render_time = 0
+        self._render_timer = qt_import.QTimer(self)
+        self._render_timer.setSingleShot(True)
+        self._render_timer.timeout.connect(self.render_points)
+        self.mpl_connect("draw_event", self._on_draw)
 
         self._curves_dict = {}
+        # curve name -> CurveDecimator, full data of the curves
+        self._decimators = {}
+        self.axes.callbacks.connect("xlim_changed", self._on_xlim_changed)
         self.setMaximumSize(2000, 2000)
 
     def refresh(self):
@@ -197,15 +290,25 @@ class MplCanvas(FigureCanvas):
         self.real_time = real_time
         # clear all axes after plot is called
         # self.axes.hold(not real_time)
-        self.axes.clear()
+        self.clear()
 
     def set_max_plot_points(self, max_points):
         self.max_plot_points = max_points
+        self._points.set_capacity(max_points)
+
+    def set_max_fps(self, max_fps):
+        self.max_fps = max_fps
 
     def clear(self):
         self._curves_dict = {}
+        self._decimators = {}
         self.single_curve = None
+        self._fill_patch = None
+        self._background = None
+        self._points.clear()
+        self._point_count = 0
         self.axes.cla()
+        self.axes.callbacks.connect("xlim_changed", self._on_xlim_changed)
         self.axes.grid(True)
 
     def hide_curves(self):
@@ -259,67 +362,137 @@ class MplCanvas(FigureCanvas):
             )
 
         self._curves_dict[name] = line
+        self._decimators[name] = CurveDecimator(y_axis_array, x_axis_array)
 
         self.axes.set_xlim(0, y_axis_array.size)
+        self.update_decimated_curve(name)
 
         self.refresh()
 
         return line
 
     def update_curves(self, data_dict):
-        for data_key in data_dict:
-            for curve_key in self._curves_dict.keys():
-                if data_key == curve_key:
-                    if data_dict[data_key].size > 200:
-                        num_points = data_dict[data_key].size / 200
-                        self._curves_dict[curve_key].set_ydata(
-                            data_dict[data_key][::num_points]
-                        )
-                        self._curves_dict[curve_key].set_xdata(
-                            data_dict["x_array"][::num_points]
-                        )
-                    else:
-                        self._curves_dict[curve_key].set_ydata(data_dict[data_key])
-                        self._curves_dict[curve_key].set_xdata(data_dict["x_array"])
+        """
+        Descript. : Sets the data of the curves with a key in data_dict,
+                    x values are taken from data_dict["x_array"].
+                    Long curves are drawn min/max decimated.
+        """
+        for curve_key in self._curves_dict.keys():
+            if curve_key in data_dict:
+                self._decimators[curve_key].set_data(
+                    data_dict[curve_key], data_dict.get("x_array")
+                )
+                self.update_decimated_curve(curve_key)
         self.fig.canvas.draw()
 
-    def append_new_point(self, y, x=None):
-        self._axis_y_array = np.append(self._axis_y_array, y)
-        if x:
-            self._axis_x_array = np.append(self._axis_x_array, x)
-        else:
-            self._axis_x_array = np.arange(len(self._axis_y_array))
+    def update_decimated_curve(self, name):
+        """
+        Descript. : Sets the points of the curve visible in the current
+                    x range, decimated to the axes width
+        """
+        x_array, y_array = self._decimators[name].get_data(
+            self.axes.get_xlim(), max(int(self.axes.bbox.width), 1)
+        )
+        self._curves_dict[name].set_data(x_array, y_array)
 
-        if self.max_plot_points:
-            if self._axis_y_array.size > self.max_plot_points:
-                self._axis_y_array = np.delete(self._axis_y_array, 0)
-                self._axis_x_array = np.delete(self._axis_x_array, 0)
+    def _on_xlim_changed(self, axes):
+        for name in self._decimators:
+            self.update_decimated_curve(name)
+
+    def append_new_point(self, y, x=None):
+        """
+        Descript. : Adds a point to the real time curve. The curve is
+                    redrawn later, at most max_fps times per second.
+                    Without x the points are plotted against their index.
+        """
+        self._index_x = x is None
+        if x is None:
+            x = self._point_count
+        self._points.append(x, y)
+        self._point_count += 1
+
+        if not self.isVisible():
+            # drawn when the plot is shown
+            self._render_pending = True
+        elif not self._render_timer.isActive():
+            delay = self._last_render_time + 1.0 / self.max_fps - time.time()
+            self._render_timer.start(int(max(0, delay) * 1000))
+
+    def render_points(self):
+        """
+        Descript. : Draws the real time curve. Only the curve is redrawn
+                    (blitting) unless the axes limits have to change.
+        """
+        if not self.isVisible():
+            self._render_pending = True
+            return
+        self._render_pending = False
+        self._last_render_time = time.time()
+
+        x_array, y_array = self._points.get_data()
+        if x_array.size == 0:
+            return
+        if self._index_x:
+            x_array = np.arange(x_array.size)
 
         if self.single_curve is None:
             self.single_curve, = self.axes.plot(
-                self._axis_y_array, linewidth=2, marker="s"
+                x_array, y_array, linewidth=2, marker="s", animated=True
+            )
+            self._fill_patch, = self.axes.fill(
+                [0], [0], "r", linewidth=2, animated=True
+            )
+            self.axes.grid(True)
+        self.single_curve.set_data(x_array, y_array)
+        self._fill_patch.set_xy(
+            np.column_stack(
+                (
+                    np.concatenate(([x_array[0]], x_array, [x_array[-1]])),
+                    np.concatenate(([0], y_array, [0])),
+                )
             )
-        else:
-            self.axes.fill(self._axis_y_array, "r", linewidth=2)
-
-        self._axis_y_limits[1] = (
-            self._axis_y_array.max() + self._axis_y_array.max() * 0.05
         )
-        self.axes.set_ylim(self._axis_y_limits)
-        self.single_curve.set_xdata(self._axis_x_array)
-        self.single_curve.set_ydata(self._axis_y_array)
-        self.axes.relim()
-        self.axes.autoscale_view()
-        self.fig.canvas.draw()
-        self.fig.canvas.flush_events()
-        self.axes.grid(True)
 
+        x_min = x_array.min()
+        x_max = x_array.max()
         # TODO move y lims as propery
-        self.axes.set_ylim(
-            (0, self._axis_y_array.max() + self._axis_y_array.max() * 0.05)
-        )
-        # self.draw()
-        # self.set_title("Scan in progress. Please wait...")
+        y_max = y_array.max() * 1.05
+        if y_max <= 0:
+            y_max = 1
+        (view_x_min, view_x_max) = self.axes.get_xlim()
+        view_y_max = self.axes.get_ylim()[1]
+        if (
+            self._background is None
+            or x_min < view_x_min
+            or x_max > view_x_max
+            or y_max > view_y_max
+            or y_max < view_y_max / 2
+        ):
+            x_range = max(x_max - x_min, 1)
+            self.axes.set_xlim((x_min, x_max + x_range * X_RANGE_MARGIN))
+            self.axes.set_ylim((0, y_max))
+            # full redraw, the curve is drawn by _on_draw
+            self.draw()
+        else:
+            self.restore_region(self._background)
+            self._draw_animated()
+            self.blit(self.axes.bbox)
+
+    def _draw_animated(self):
+        self.axes.draw_artist(self._fill_patch)
+        self.axes.draw_artist(self.single_curve)
+
+    def _on_draw(self, event):
+        # after every full redraw: saves the background of the real time
+        # curve and draws it
+        if self._fill_patch is not None and self._fill_patch.axes is self.axes:
+            self._background = self.copy_from_bbox(self.axes.bbox)
+            self._draw_animated()
+
+    def showEvent(self, event):
+        FigureCanvas.showEvent(self, event)
+        if self._render_pending:
+            self._render_timer.start(0)
 
     def set_axes_labels(self, x_label, y_label):
         self.axes.set_xlabel(x_label)
@@ -21,6 +21,7 @@ import numpy as np
 import pyqtgraph as pg
 
 from mxcubeqt.utils import qt_import
+from mxcubeqt.utils.curve_decimation import CurveDecimator
 
 __credits__ = ["MXCuBE collaboration"]
 __license__ = "LGPLv3+"
@@ -37,6 +38,8 @@ class PlotWidget(qt_import.QWidget):
         qt_import.QWidget.__init__(self, parent)
 
         self.curves_dict = {}
+        # curve key -> CurveDecimator, full data of the curves
+        self.decimators = {}
         self.visible_curve = None
 
         self.view_box = CustomViewBox()
@@ -62,12 +65,16 @@ class PlotWidget(qt_import.QWidget):
 
         self.one_dim_plot.scene().sigMouseMoved.connect(self.one_dim_plot_mouse_moved)
         self.two_dim_plot.scene.sigMouseMoved.connect(self.two_dim_plot_mouse_moved)
+        self.view_box.sigXRangeChanged.connect(self.update_decimated_curves)
 
     def set_plot_type(self, plot_type):
         self.one_dim_plot.setVisible(plot_type == "1D")
         self.two_dim_plot.setVisible(plot_type == "2D")
 
     def add_curve(self, key, y_array, x_array, color):
+        # long curves are drawn min/max decimated to the plot width
+        self.decimators[key] = CurveDecimator(y_array, x_array)
+        x_array, y_array = self.get_decimated_data(key)
         self.curves_dict[key] = self.one_dim_plot.plot(
             y=y_array,
             x=x_array,
@@ -122,11 +129,48 @@ class PlotWidget(qt_import.QWidget):
     def update_curves(self, result):
         for key in result.keys():
             if key in self.curves_dict:
-                self.curves_dict[key].setData(y=result[key]) #, x=result['x_array'])
+                self.update_curve(key, result[key]) #, x=result['x_array'])
+
+    def update_curve(self, key, y_array):
+        """Updates a single curve"""
+        if key in self.curves_dict:
+            self.decimators[key].set_data(y_array)
+            self.update_decimated_curve(key)
+
+    def get_decimated_data(self, key):
+        """Returns x and y arrays of the curve key for the visible x range"""
+        x_range = None
+        if not self.view_box.state["autoRange"][0]:
+            x_range = self.view_box.viewRange()[0]
+        return self.decimators[key].get_data(
+            x_range, max(int(self.view_box.width()), 1)
+        )
+
+    def update_decimated_curve(self, key):
+        x_array, y_array = self.get_decimated_data(key)
+        self.curves_dict[key].setData(y=y_array, x=x_array)
+
+    def update_decimated_curves(self, *args):
+        """Decimates the curves again for the new visible x range"""
+        for key in self.decimators:
+            if key in self.curves_dict:
+                self.update_decimated_curve(key)
 
     def plot_result(self, result, aspect=None):
         self.two_dim_plot.setImage(result)
 
+    def update_result(self, result, levels=None):
+        """Redraws the 2D image data in place, without resetting the view
+           and without recomputing the color levels if levels are given
+        """
+        image_item = self.two_dim_plot.getImageItem()
+        if image_item.image is None or image_item.image.shape != result.shape:
+            self.two_dim_plot.setImage(result)
+        elif levels is None:
+            image_item.updateImage(result)
+        else:
+            image_item.updateImage(result, autoLevels=False, levels=levels)
+
     def autoscale_axes(self):
         #self.one_dim_plot.enableAutoRange(self.view_box.XYAxes, True)
         self.view_box.autoRange(padding=0.02)
@@ -137,6 +181,7 @@ class PlotWidget(qt_import.QWidget):
         self.one_dim_plot.clear()
         self.two_dim_plot.clear()
         self.curves_dict = {}
+        self.decimators = {}
 
     def hide_all_curves(self):
         for key in self.curves_dict.keys():
@@ -21,7 +21,7 @@ import logging
 import re
 import importlib
 
-from mxcubeqt.utils import icons, queue_item, qt_import
+from mxcubeqt.utils import icons, queue_item, qt_import, snapshot_cache
 from mxcubeqt.widgets.create_discrete_widget import CreateDiscreteWidget
 from mxcubeqt.widgets.create_helical_widget import CreateHelicalWidget
 from mxcubeqt.widgets.create_char_widget import CreateCharWidget
@@ -363,42 +363,54 @@ class TaskToolBoxWidget(qt_import.QWidget):
                     "Select the sample, basket or task group you would like to add to."
                 )
             else:
-                for item in items:
-                    shapes = HWR.beamline.sample_view.get_selected_points()
-                    task_model = item.get_model()
-                    # TODO Consider if GPhL workflow needs task-per-shape
-                    # like xrf does
-
-                    # Create a new group if sample is selected
-                    if isinstance(task_model, queue_model_objects.Sample):
-                        task_model = self.create_task_group(task_model)
-                        if self.tool_box.currentWidget() in (
-                            self.discrete_page,
-                            self.char_page,
-                            self.energy_scan_page,
-                            self.xrf_spectrum_page,
-                        ) and len(shapes):
-                            # This could be done in more nicer way...
-                            for shape in shapes:
-                                self.create_task(task_model, shape)
-                        else:
-                            self.create_task(task_model)
-                    elif isinstance(task_model, queue_model_objects.Basket):
-                        for sample_node in task_model.get_sample_list():
-                            task_group = self.create_task_group(sample_node)
-                            if self.tool_box.currentWidget() in (
-                                self.discrete_page,
-                                self.char_page,
-                                self.energy_scan_page,
-                                self.xrf_spectrum_page,
-                                self.xray_imaging_page,
-                            ) and len(shapes):
-                                for shape in shapes:
-                                    self.create_task(task_group, shape)
-                            else:
-                                self.create_task(task_group)
+                self.create_tasks(items)
+                self.tree_brick.select_last_added_item()
+                self.tree_brick.update_enable_collect()
+
+            self.tool_box.currentWidget().update_selection()
+
+    def create_tasks(self, items):
+        """Creates the tasks of the current page for the selected items
+           in one batch: the tree is refreshed and the queue saved once,
+           when all tasks have been added. If the creation fails the task
+           groups and tasks added so far are removed.
+
+        :param items: selected tree items (baskets, samples, task groups
+                      or tasks)
+        :returns: list of added task groups and tasks
+        """
+        current_page = self.tool_box.currentWidget()
+        shapes = HWR.beamline.sample_view.get_selected_points()
+        added_nodes = []
+
+        dc_tree_widget = self.tree_brick.dc_tree_widget
+        dc_tree_widget.begin_bulk_update()
+        try:
+            for item in items:
+                task_model = item.get_model()
+                # TODO Consider if GPhL workflow needs task-per-shape
+                # like xrf does
+
+                # Create a new group if sample is selected
+                if isinstance(task_model, queue_model_objects.Sample):
+                    task_model = self.create_task_group(task_model)
+                    added_nodes.append(task_model)
+                    if current_page in (
+                        self.discrete_page,
+                        self.char_page,
+                        self.energy_scan_page,
+                        self.xrf_spectrum_page,
+                    ) and len(shapes):
+                        # This could be done in more nicer way...
+                        for shape in shapes:
+                            added_nodes.extend(self.create_task(task_model, shape))
                     else:
-                        if self.tool_box.currentWidget() in (
+                        added_nodes.extend(self.create_task(task_model))
+                elif isinstance(task_model, queue_model_objects.Basket):
+                    for sample_node in task_model.get_sample_list():
+                        task_group = self.create_task_group(sample_node)
+                        added_nodes.append(task_group)
+                        if current_page in (
                             self.discrete_page,
                             self.char_page,
                             self.energy_scan_page,
@@ -406,13 +418,50 @@ class TaskToolBoxWidget(qt_import.QWidget):
                             self.xray_imaging_page,
                         ) and len(shapes):
                             for shape in shapes:
-                                self.create_task(task_model, shape)
+                                added_nodes.extend(self.create_task(task_group, shape))
                         else:
-                            self.create_task(task_model)
-                self.tree_brick.select_last_added_item()
-                self.tree_brick.update_enable_collect()
+                            added_nodes.extend(self.create_task(task_group))
+                else:
+                    if current_page in (
+                        self.discrete_page,
+                        self.char_page,
+                        self.energy_scan_page,
+                        self.xrf_spectrum_page,
+                        self.xray_imaging_page,
+                    ) and len(shapes):
+                        for shape in shapes:
+                            added_nodes.extend(self.create_task(task_model, shape))
+                    else:
+                        added_nodes.extend(self.create_task(task_model))
+        except BaseException:
+            logging.getLogger("GUI").exception(
+                "Task creation failed, no task has been added to the queue"
+            )
+            self.remove_nodes(added_nodes)
+            added_nodes = []
+        finally:
+            dc_tree_widget.end_bulk_update()
 
-            self.tool_box.currentWidget().update_selection()
+        return added_nodes
+
+    def remove_nodes(self, nodes):
+        """Removes queue nodes and their tree items, whatever the tree
+           selection is
+        """
+        dc_tree_widget = self.tree_brick.dc_tree_widget
+        node_ids = set(id(node) for node in nodes)
+        for node in reversed(nodes):
+            parent = node.get_parent()
+            if id(parent) in node_ids:
+                # removed with its parent
+                continue
+            item = dc_tree_widget.get_item_by_model(node)
+            if item is not dc_tree_widget.sample_tree_widget:
+                dc_tree_widget.remove_item(item)
+            elif parent is not None and node in parent.get_children():
+                # not in the tree
+                HWR.beamline.queue_model.del_child(parent, node)
+        dc_tree_widget.check_for_path_collisions()
 
     def create_task_group(self, task_model):
         group_task_node = queue_model_objects.TaskGroup()
@@ -428,19 +477,25 @@ class TaskToolBoxWidget(qt_import.QWidget):
         return group_task_node
 
     def create_task(self, task_node, shape=None):
+        """Adds the tasks of the current page to a task group, or a copy
+           of a task next to it
+
+        :returns: list of added task nodes
+        """
         # Selected item is a task group
         if isinstance(task_node, queue_model_objects.TaskGroup):
             sample = task_node.get_parent()
             comment = self.comments_widget.get_comment_text()
             task_list = self.tool_box.currentWidget().create_task(sample, shape, comment)
 
-            for child_task_node in task_list:
+            for child_task_node in task_list or ():
                 HWR.beamline.queue_model.add_child(task_node, child_task_node)
+            return list(task_list or ())
         # The selected item is a task, make a copy.
         else:
             new_node = HWR.beamline.queue_model.copy_node(task_node)
             new_snapshot = (
-                HWR.beamline.sample_view.get_snapshot()
+                snapshot_cache.get_snapshot()
             )
 
             if isinstance(task_node, queue_model_objects.Characterisation):
@@ -460,6 +515,7 @@ class TaskToolBoxWidget(qt_import.QWidget):
             HWR.beamline.queue_model.add_child(
                 task_node.get_parent(), new_node
             )
+            return [new_node]
 
     def collect_now_button_click(self):
         if not self.tree_brick.dc_tree_widget.enable_collect_condition:
@@ -24,3 +24,158 @@ def hwr():
 def blsetup(hwr):
     return hwr.get_hardware_object("beamline-setup")
 """
+
+import os
+import types
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    from mxcubeqt.utils import qt_import
+
+    app = qt_import.QApplication.instance()
+    if app is None:
+        app = qt_import.QApplication([])
+    return app
+
+
+class QueueEntryMock(object):
+    def __init__(self):
+        self.dequeued = []
+
+    def dequeue(self, queue_entry):
+        self.dequeued.append(queue_entry)
+
+    def set_enabled(self, state):
+        pass
+
+
+class QueueModelMock(object):
+    """Queue model adding the nodes to a DataCollectTree, as
+       QueueModel.add_child does through the "child_added" signal
+    """
+
+    def __init__(self):
+        from mxcubecore.model import queue_model_objects
+
+        self.root = queue_model_objects.RootNode()
+        self.tree = None
+
+    def get_model_root(self):
+        return self.root
+
+    def add_child(self, parent, child):
+        self.root._total_node_count += 1
+        child._parent = parent
+        child._node_id = self.root._total_node_count
+        parent._children.append(child)
+        if self.tree is not None:
+            self.tree.add_to_view(parent, child)
+
+    def del_child(self, parent, child):
+        parent._children.remove(child)
+
+    def copy_node(self, node):
+        new_node = node.copy()
+        new_node.set_executed(False)
+        return new_node
+
+    def view_created(self, view_item, task):
+        view_item._data_model = task
+        view_item.setText(0, task.get_display_name())
+        view_item.set_queue_entry(QueueEntryMock())
+
+
+class TreeBrickMock(object):
+    def __init__(self):
+        self.autosave_requests = 0
+        self.autosave_nodes = []
+
+    def auto_save_queue(self, *nodes):
+        self.autosave_requests += 1
+        self.autosave_nodes.extend(nodes)
+
+    def show_sample_centring_tab(self):
+        pass
+
+    def select_last_added_item(self):
+        pass
+
+    def update_enable_collect(self):
+        pass
+
+
+@pytest.fixture
+def sample_tree(qapp, monkeypatch):
+    """DataCollectTree fed by a QueueModelMock. Returns a namespace with
+       the tree, the queue model and add_samples(num_samples)
+    """
+    from mxcubecore import HardwareRepository as HWR
+    from mxcubecore.model import queue_model_objects
+    from mxcubeqt.widgets.dc_tree_widget import DataCollectTree
+
+    queue_model = QueueModelMock()
+    monkeypatch.setattr(
+        HWR,
+        "beamline",
+        types.SimpleNamespace(
+            queue_model=queue_model,
+            session=types.SimpleNamespace(
+                get_default_prefix=lambda *args, **kwargs: "prefix"
+            ),
+            diffractometer=None,
+            plate_manipulator=None,
+            sample_changer=None,
+            sample_view=types.SimpleNamespace(
+                get_selected_points=lambda: [],
+                get_snapshot=lambda *args, **kwargs: None,
+            ),
+        ),
+        raising=False,
+    )
+
+    tree_brick = TreeBrickMock()
+    tree = DataCollectTree(None)
+    tree.tree_brick = tree_brick
+    tree.selection_changed_cb = lambda items: None
+    tree.samples_initialized = True
+    queue_model.tree = tree
+
+    def add_samples(num_samples, samples_per_basket=10):
+        samples = []
+        root = queue_model.get_model_root()
+        for index in range(num_samples):
+            if index % samples_per_basket == 0:
+                basket = queue_model_objects.Basket()
+                basket_index = index // samples_per_basket + 1
+                basket.init_from_sc_basket(
+                    (
+                        basket_index,
+                        types.SimpleNamespace(
+                            present=True, get_coords=lambda: (basket_index,)
+                        ),
+                    )
+                )
+                queue_model.add_child(root, basket)
+            sample = queue_model_objects.Sample()
+            sample.name = "sample %d" % (index + 1)
+            sample.location = (
+                index // samples_per_basket + 1,
+                index % samples_per_basket + 1,
+            )
+            basket.add_sample(sample)
+            queue_model.add_child(basket, sample)
+            samples.append(sample)
+        return samples
+
+    yield types.SimpleNamespace(
+        tree=tree,
+        tree_brick=tree_brick,
+        queue_model=queue_model,
+        add_samples=add_samples,
+    )
+    tree.deleteLater()
@@ -0,0 +1,174 @@
+import time
+
+import pytest
+
+from mxcubecore.model import queue_model_objects
+
+
+def add_characterisations(sample_tree, samples):
+    """Adds a task group with a characterisation to every sample"""
+    tasks = []
+    sample_tree.tree.begin_bulk_update()
+    try:
+        for sample in samples:
+            task_group = queue_model_objects.TaskGroup()
+            task_group.set_name("Characterisation")
+            sample_tree.queue_model.add_child(sample, task_group)
+            task = queue_model_objects.Characterisation()
+            sample_tree.queue_model.add_child(task_group, task)
+            tasks.append(task)
+    finally:
+        sample_tree.tree.end_bulk_update()
+    return tasks
+
+
+def find_item_by_scan(tree, node):
+    """Previous get_item_by_model: scan of the tree items"""
+    from mxcubeqt.utils import qt_import
+
+    iterator = qt_import.QTreeWidgetItemIterator(tree.sample_tree_widget)
+    item = iterator.value()
+    while item:
+        if item.get_model() is node:
+            return item
+        iterator += 1
+        item = iterator.value()
+    return tree.sample_tree_widget
+
+
+def check_index(sample_tree):
+    """Checks that every node of the queue model is found in the tree and
+       that the index only holds items of the tree
+
+    :returns: number of nodes
+    """
+    tree = sample_tree.tree
+    num_nodes = 0
+    nodes = list(sample_tree.queue_model.get_model_root().get_children())
+    while nodes:
+        node = nodes.pop()
+        item = tree.get_item_by_model(node)
+        assert item is not tree.sample_tree_widget
+        assert item.get_model() is node
+        assert item.treeWidget() is tree.sample_tree_widget
+        nodes.extend(node.get_children())
+        num_nodes += 1
+    assert len(tree.model_item_index) == num_nodes
+    return num_nodes
+
+
+@pytest.mark.parametrize("num_samples", (100, 1000, 5000))
+def test_get_item_by_model(sample_tree, num_samples):
+    tree = sample_tree.tree
+    tree.begin_bulk_update()
+    start_time = time.time()
+    samples = sample_tree.add_samples(num_samples)
+    tree.end_bulk_update()
+    tasks = add_characterisations(sample_tree, samples)
+    populate_time = time.time() - start_time
+
+    start_time = time.time()
+    num_nodes = check_index(sample_tree)
+    lookup_time = time.time() - start_time
+    start_time = time.time()
+    for task in tasks[-100:]:
+        assert find_item_by_scan(tree, task) is tree.get_item_by_model(task)
+    scan_time = (time.time() - start_time) / 100
+    print(
+        "%d samples, %d nodes: populated in %.3f s, lookup %.1f us "
+        "(tree scan %.1f us)"
+        % (
+            num_samples,
+            num_nodes,
+            populate_time,
+            lookup_time / num_nodes * 1e6,
+            scan_time * 1e6,
+        )
+    )
+
+    # delete
+    deleted_task = tasks[len(tasks) // 2]
+    deleted_item = tree.get_item_by_model(deleted_task)
+    tree.delete_click([deleted_item])
+    assert tree.get_item_by_model(deleted_task) is tree.sample_tree_widget
+    check_index(sample_tree)
+
+    # cut and paste to the last sample
+    cut_task = tasks[0]
+    tree.sample_tree_widget.setCurrentItem(tree.get_item_by_model(cut_task))
+    tree.cut_item()
+    assert tree.get_item_by_model(cut_task) is tree.sample_tree_widget
+    tree.sample_tree_widget.clearSelection()
+    tree.get_item_by_model(samples[-1].get_children()[0]).setSelected(True)
+    tree.paste_item()
+    (pasted_task,) = [
+        task for task in samples[-1].get_children()[0].get_children()
+        if task is not tasks[-1]
+    ]
+    assert tree.get_item_by_model(pasted_task).get_model() is pasted_task
+    check_index(sample_tree)
+
+    # clear
+    tree.clear_tree()
+    for node in (samples[0], samples[-1], tasks[-1], pasted_task):
+        assert tree.get_item_by_model(node) is tree.sample_tree_widget
+    assert not tree.model_item_index
+
+
+def test_autosave_changed_nodes(sample_tree):
+    from mxcubeqt.utils import qt_import
+    from mxcubeqt.utils.widget_utils import DataModelInputBinder
+
+    tree = sample_tree.tree
+    tree_brick = sample_tree.tree_brick
+    samples = sample_tree.add_samples(2)
+    tasks = add_characterisations(sample_tree, samples)
+    assert tree_brick.autosave_requests == 1
+    assert tree_brick.autosave_nodes == [
+        node for task in tasks for node in (task.get_parent(), task)
+    ]
+
+    # parameters edited in the parameter widgets of the selected item
+    tree_brick.autosave_nodes = []
+    tree.sample_tree_widget.clearSelection()
+    tree.get_item_by_model(tasks[1]).setSelected(True)
+    path_template = tasks[1].reference_image_collection.acquisitions[
+        0
+    ].path_template
+    binder = DataModelInputBinder(path_template)
+    prefix_ledit = qt_import.QLineEdit()
+    binder.bind_value_update("base_prefix", prefix_ledit, str)
+    prefix_ledit.setText("edited")
+    assert path_template.base_prefix == "edited"
+    assert tree_brick.autosave_nodes == [tasks[1]]
+
+    # parameters of another task (e.g. task toolbox)
+    other_binder = DataModelInputBinder(queue_model_objects.PathTemplate())
+    other_ledit = qt_import.QLineEdit()
+    other_binder.bind_value_update("base_prefix", other_ledit, str)
+    other_ledit.setText("other")
+    assert tree_brick.autosave_nodes == [tasks[1]]
+
+    # the task group of a deleted task is saved again
+    tree_brick.autosave_nodes = []
+    tree.delete_click([tree.get_item_by_model(tasks[0])])
+    assert tree_brick.autosave_nodes == [tasks[0].get_parent()]
+
+
+def test_filter_after_hide_empty_baskets(sample_tree):
+    tree = sample_tree.tree
+    tree_filter = tree.tree_filter
+    samples = sample_tree.add_samples(20)
+    sample_items = [tree.get_item_by_model(sample) for sample in samples]
+    basket_items = [item.parent() for item in sample_items[::10]]
+
+    # second basket emptied by a filter, the basket itself is not hidden
+    tree_filter.apply(set(id(item) for item in sample_items[10:]))
+    assert not basket_items[1].isHidden()
+    tree.hide_empty_baskets()
+    assert basket_items[1].isHidden()
+    assert not basket_items[0].isHidden()
+
+    # the filter knows the basket hidden by hide_empty_baskets
+    tree_filter.apply(set())
+    assert not any(item.isHidden() for item in basket_items + sample_items)
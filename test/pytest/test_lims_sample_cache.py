@@ -0,0 +1,137 @@
+import time
+import types
+
+import gevent
+import pytest
+
+from mxcubecore import HardwareRepository as HWR
+from mxcubecore.BaseHardwareObjects import HardwareObject
+
+
+LIMS_DELAY = 0.3
+
+
+class HardwareObjectMock(HardwareObject):
+    def __init__(self):
+        HardwareObject.__init__(self, "mock")
+
+    def get_current_phase(self):
+        return None
+
+    def has_shutterless(self):
+        return False
+
+
+class LimsMock(HardwareObjectMock):
+    """LIMS answering after LIMS_DELAY s"""
+
+    def __init__(self):
+        HardwareObjectMock.__init__(self)
+        self.requests = []
+
+    def get_samples(self, proposal_id, session_id):
+        self.requests.append((proposal_id, session_id))
+        gevent.sleep(LIMS_DELAY)
+        return [
+            types.SimpleNamespace(
+                containerSampleChangerLocation="1",
+                proteinAcronym="protein",
+                sampleName="sample%d" % index,
+            )
+            for index in range(3)
+        ]
+
+
+@pytest.fixture
+def tree_brick(qapp, monkeypatch):
+    monkeypatch.setattr(HWR, "get_hardware_repository", lambda: "hwr")
+    monkeypatch.setattr(
+        HWR,
+        "beamline",
+        types.SimpleNamespace(
+            lims=LimsMock(),
+            session=types.SimpleNamespace(proposal_id=1, session_id=10),
+            detector=HardwareObjectMock(),
+            diffractometer=HardwareObjectMock(),
+            queue_manager=HardwareObjectMock(),
+            queue_model=HardwareObjectMock(),
+            sample_view=HardwareObjectMock(),
+            sample_changer=None,
+            plate_manipulator=None,
+            safety_shutter=None,
+            machine_info=None,
+        ),
+        raising=False,
+    )
+    from mxcubeqt.bricks.tree_brick import TreeBrick
+
+    tree_brick = TreeBrick(None, "tree_brick")
+    tree_brick.is_logged_in = True
+    tree_brick.sample_changer_widget.synch_ispyb_button.setEnabled(True)
+    yield tree_brick
+    tree_brick.close()
+
+
+def wait_for_samples(qapp, tree_brick, timeout=5):
+    """Runs Qt and gevent until the sample combo is filled
+
+    :returns: number of Qt timer ticks (10 ms) during the wait
+    """
+    ticks = [0]
+    timer = tree_brick.startTimer(10)
+    tree_brick.timerEvent = lambda event: ticks.__setitem__(0, ticks[0] + 1)
+    start_time = time.time()
+    try:
+        while time.time() - start_time < timeout:
+            qapp.processEvents()
+            gevent.sleep(0.005)
+            if tree_brick.sample_changer_widget.synch_ispyb_button.isEnabled():
+                break
+    finally:
+        tree_brick.killTimer(timer)
+    assert tree_brick.sample_changer_widget.sample_combo.count() == 3
+    return ticks[0]
+
+
+def test_sync_does_not_block(qapp, tree_brick):
+    lims = HWR.beamline.lims
+
+    start_time = time.time()
+    tree_brick.synch_ispyb_button_clicked()
+    assert time.time() - start_time < LIMS_DELAY / 3
+    assert not tree_brick.sample_changer_widget.synch_ispyb_button.isEnabled()
+    # the GUI handled events while LIMS was queried
+    assert wait_for_samples(qapp, tree_brick) > 10
+    assert lims.requests == [(1, 10)]
+
+    # second sync within the TTL: from the cache
+    tree_brick.sample_changer_widget.sample_combo.clear()
+    tree_brick.synch_ispyb_button_clicked()
+    wait_for_samples(qapp, tree_brick)
+    assert lims.requests == [(1, 10)]
+    assert tree_brick.lims_sample_cache.stats["hits"] == 1
+
+    # forced reload
+    tree_brick.sample_changer_widget.sample_combo.clear()
+    tree_brick.reload_lims_samples_clicked()
+    wait_for_samples(qapp, tree_brick)
+    assert lims.requests == [(1, 10), (1, 10)]
+
+
+def test_sync_cache_expired(qapp, tree_brick):
+    lims = HWR.beamline.lims
+    tree_brick.lims_sample_cache.ttl = 0.1
+
+    tree_brick.synch_ispyb_button_clicked()
+    wait_for_samples(qapp, tree_brick)
+    time.sleep(0.1)
+    tree_brick.synch_ispyb_button_clicked()
+    wait_for_samples(qapp, tree_brick)
+    assert len(lims.requests) == 2
+
+    # other session
+    HWR.beamline.session.session_id = 11
+    tree_brick.lims_sample_cache.ttl = 300
+    tree_brick.synch_ispyb_button_clicked()
+    wait_for_samples(qapp, tree_brick)
+    assert lims.requests[-1] == (1, 11)
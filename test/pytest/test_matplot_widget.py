@@ -0,0 +1,153 @@
+import time
+
+import numpy as np
+
+
+def get_ring_buffer(*args, **kwargs):
+    from mxcubeqt.widgets.matplot_widget import RingBuffer
+
+    return RingBuffer(*args, **kwargs)
+
+
+def check_data(ring_buffer, x_values, y_values=None):
+    if y_values is None:
+        y_values = [2 * x for x in x_values]
+    x_data, y_data = ring_buffer.get_data()
+    assert len(ring_buffer) == len(x_values)
+    assert list(x_data) == list(x_values)
+    assert list(y_data) == list(y_values)
+
+
+def append(ring_buffer, x_values):
+    for x in x_values:
+        ring_buffer.append(x, 2 * x)
+
+
+def test_ring_buffer_wrap_around():
+    ring_buffer = get_ring_buffer(5)
+    check_data(ring_buffer, [])
+    append(ring_buffer, range(3))
+    check_data(ring_buffer, range(3))
+    append(ring_buffer, range(3, 5))
+    check_data(ring_buffer, range(5))
+
+    for last in range(6, 23):
+        ring_buffer.append(last - 1, 2 * (last - 1))
+        check_data(ring_buffer, range(last - 5, last))
+        # contiguous views on the buffer, no copy
+        x_data, y_data = ring_buffer.get_data()
+        assert np.shares_memory(x_data, ring_buffer._x)
+        assert np.shares_memory(y_data, ring_buffer._y)
+    assert ring_buffer._x.size == 10
+
+    ring_buffer.clear()
+    check_data(ring_buffer, [])
+    append(ring_buffer, range(7))
+    check_data(ring_buffer, range(2, 7))
+
+
+def test_ring_buffer_capacity_one():
+    ring_buffer = get_ring_buffer(1)
+    append(ring_buffer, range(4))
+    check_data(ring_buffer, [3])
+
+
+def test_ring_buffer_unbounded():
+    ring_buffer = get_ring_buffer(initial_size=4)
+    assert ring_buffer.capacity is None
+    append(ring_buffer, range(4))
+    assert ring_buffer._x.size == 4
+    append(ring_buffer, range(4, 100))
+    check_data(ring_buffer, range(100))
+    # the buffer doubles when full
+    assert ring_buffer._x.size == 128
+
+    # 0 is no limit
+    ring_buffer = get_ring_buffer(0, initial_size=1)
+    append(ring_buffer, range(10))
+    check_data(ring_buffer, range(10))
+
+
+def test_ring_buffer_set_capacity():
+    ring_buffer = get_ring_buffer(5)
+    append(ring_buffer, range(8))
+
+    # smaller, the last points are kept
+    ring_buffer.set_capacity(3)
+    check_data(ring_buffer, range(5, 8))
+    append(ring_buffer, range(8, 10))
+    check_data(ring_buffer, range(7, 10))
+
+    # larger
+    ring_buffer.set_capacity(6)
+    check_data(ring_buffer, range(7, 10))
+    append(ring_buffer, range(10, 14))
+    check_data(ring_buffer, range(8, 14))
+
+    # no limit
+    ring_buffer.set_capacity(None)
+    assert ring_buffer.capacity is None
+    check_data(ring_buffer, range(8, 14))
+    append(ring_buffer, range(14, 2000))
+    check_data(ring_buffer, range(8, 2000))
+
+    # limit on a growing buffer
+    ring_buffer.set_capacity(100)
+    check_data(ring_buffer, range(1900, 2000))
+    assert ring_buffer._x.size == 200
+    append(ring_buffer, range(2000, 2050))
+    check_data(ring_buffer, range(1950, 2050))
+
+
+def test_render_points_benchmark(qapp):
+    """100000 points appended to a real time plot showing the last 1000
+       points, rendered at 10 fps by a feed of 1000 points per second
+    """
+    from mxcubeqt.widgets.matplot_widget import MplCanvas
+
+    num_points = 100000
+    max_points = 1000
+    points_per_render = 100
+    canvas = MplCanvas()
+    canvas.set_real_time(True)
+    canvas.set_max_plot_points(max_points)
+    canvas.resize(500, 400)
+    canvas.show()
+    qapp.processEvents()
+
+    draw_count = [0]
+    canvas.mpl_connect(
+        "draw_event", lambda event: draw_count.__setitem__(0, draw_count[0] + 1)
+    )
+    y_values = np.abs(np.sin(np.arange(num_points) / 50.0)) * 100
+
+    start_time = time.time()
+    for index, y in enumerate(y_values):
+        canvas.append_new_point(y)
+        if index % points_per_render == points_per_render - 1:
+            canvas.render_points()
+    total_time = time.time() - start_time
+    canvas._render_timer.stop()
+
+    x_data, y_data = canvas.single_curve.get_data()
+    assert len(x_data) == max_points
+    assert np.array_equal(y_data, y_values[-max_points:])
+    # one curve and one filled area, created once
+    assert len(canvas.axes.lines) == 1
+    assert len(canvas.axes.patches) == 1
+    # the x range only grows when the curve leaves the view
+    assert draw_count[0] < num_points // points_per_render // 10
+
+    print(
+        "%d points, %d points shown: %.2f s in total (%.1f us per point), "
+        "%d renders, %d full redraws"
+        % (
+            num_points,
+            max_points,
+            total_time,
+            total_time / num_points * 1e6,
+            num_points // points_per_render,
+            draw_count[0],
+        )
+    )
+    canvas.close()
@@ -0,0 +1,246 @@
+import random
+import time
+import types
+
+import pytest
+
+from mxcubecore import HardwareRepository as HWR
+from mxcubecore.HardwareObjects.QueueModel import QueueModel
+from mxcubecore.model import queue_model_objects
+
+from mxcubeqt.utils.path_collision import PathCollisionIndex, get_conflicts
+
+
+def get_conflicts_by_pairs(ranges):
+    """Reference: compares every range with all the others"""
+    conflicts = set()
+    for start, end, range_id in ranges:
+        for other_start, other_end, other_id in ranges:
+            if other_id != range_id and start < other_end and other_start < end:
+                conflicts.add(range_id)
+    return conflicts
+
+
+@pytest.mark.parametrize(
+    "ranges, expected",
+    (
+        # overlapping
+        ([(0, 10, "a"), (5, 15, "b")], {"a", "b"}),
+        ([(5, 15, "b"), (0, 10, "a"), (20, 30, "c")], {"a", "b"}),
+        # same range
+        ([(0, 10, "a"), (0, 10, "b")], {"a", "b"}),
+        # touching
+        ([(0, 10, "a"), (10, 20, "b"), (20, 30, "c")], set()),
+        # nested
+        ([(0, 100, "a"), (10, 20, "b"), (30, 40, "c")], {"a", "b", "c"}),
+        ([(0, 100, "a"), (10, 20, "b"), (100, 110, "c")], {"a", "b"}),
+        # overlapping a range ending before the previous one
+        ([(0, 100, "a"), (10, 20, "b"), (50, 150, "c")], {"a", "b", "c"}),
+        # zero length
+        ([(0, 10, "a"), (5, 5, "z")], {"a", "z"}),
+        ([(0, 10, "a"), (0, 0, "y"), (10, 10, "z")], set()),
+        ([(5, 5, "y"), (5, 5, "z")], set()),
+        ([(0, 0, "z")], set()),
+        ([], set()),
+    ),
+)
+def test_get_conflicts(ranges, expected):
+    assert get_conflicts(ranges) == expected
+    assert get_conflicts_by_pairs(ranges) == expected
+
+
+def test_get_conflicts_random():
+    rand = random.Random(0)
+    for index in range(500):
+        ranges = []
+        for range_id in range(rand.randint(0, 12)):
+            start = rand.randint(0, 50)
+            ranges.append((start, start + rand.randint(0, 10), range_id))
+        assert get_conflicts(ranges) == get_conflicts_by_pairs(ranges)
+
+
+@pytest.fixture
+def queue_model(monkeypatch):
+    queue_model = QueueModel("queue-model")
+    monkeypatch.setattr(
+        HWR,
+        "beamline",
+        types.SimpleNamespace(queue_model=queue_model),
+        raising=False,
+    )
+    return queue_model
+
+
+def add_sample(queue_model):
+    sample = queue_model_objects.Sample()
+    queue_model.add_child(queue_model.get_model_root(), sample)
+    task_group = queue_model_objects.TaskGroup()
+    queue_model.add_child(sample, task_group)
+    return task_group
+
+
+def add_collection(
+    queue_model, task_group, start_num, num_files, prefix="prefix", run_number=1
+):
+    data_collection = queue_model_objects.DataCollection()
+    path_template = data_collection.get_path_template()
+    path_template.directory = "/data/test"
+    path_template.base_prefix = prefix
+    path_template.run_number = run_number
+    path_template.start_num = start_num
+    path_template.num_files = num_files
+    queue_model.add_child(task_group, data_collection)
+    return data_collection
+
+
+def get_path_templates(queue_model):
+    return [
+        path_template for node, path_template in queue_model.get_path_templates()
+    ]
+
+
+def check_index(index, queue_model, path_templates=None):
+    """Checks the index against QueueModel.check_for_path_collisions
+
+    :returns: number of conflicts
+    """
+    conflicts = index.get_conflicts()
+    if path_templates is None:
+        path_templates = get_path_templates(queue_model)
+    for path_template in path_templates:
+        collision = queue_model.check_for_path_collisions(path_template)
+        assert (id(path_template) in conflicts) == collision
+        assert index.check_path_template(path_template) == collision
+    return len(conflicts)
+
+
+def test_index_edits(queue_model):
+    task_group = add_sample(queue_model)
+    collections = [
+        add_collection(queue_model, task_group, 1, 100),
+        add_collection(queue_model, task_group, 101, 100),
+        add_collection(queue_model, task_group, 50, 10, run_number=2),
+        add_collection(queue_model, task_group, 150, 0),
+        add_collection(queue_model, task_group, 1, 100, prefix="other"),
+    ]
+    path_templates = [dc.get_path_template() for dc in collections]
+
+    index = PathCollisionIndex()
+    assert check_index(index, queue_model) == 2
+
+    def edit(path_template, **values):
+        for name, value in values.items():
+            setattr(path_template, name, value)
+        assert index.refresh() == 1
+        assert index.refresh() == 0
+        return check_index(index, queue_model)
+
+    # run 2 overlaps run 1
+    assert edit(path_templates[2], run_number=1) == 4
+    # the first collection ends where the second starts
+    assert edit(path_templates[2], run_number=2) == 2
+    # new prefix
+    assert edit(path_templates[4], base_prefix="prefix", start_num=20) == 4
+    assert edit(path_templates[4], wedge_prefix="wedge") == 2
+    # longer range, nested ranges
+    assert edit(path_templates[0], num_files=300) == 3
+    # same directory
+    path_templates[0].directory = "/data/test/"
+    assert index.refresh() == 0
+    # new directory
+    assert edit(path_templates[0], directory="/data/other") == 2
+    assert edit(path_templates[1], num_files=0, start_num=150) == 0
+    # update of a single path template
+    path_templates[1].start_num = 100
+    path_templates[1].num_files = 100
+    assert index.update(path_templates[1])
+    assert not index.update(path_templates[1])
+    assert check_index(index, queue_model) == 2
+    # path template not in the queue
+    assert not index.update(queue_model_objects.PathTemplate())
+
+
+def test_index_invalidate(queue_model):
+    task_group = add_sample(queue_model)
+    first = add_collection(queue_model, task_group, 1, 100)
+    index = PathCollisionIndex()
+    assert check_index(index, queue_model) == 0
+
+    # added nodes are found after invalidate
+    other_task_group = add_sample(queue_model)
+    second = add_collection(queue_model, other_task_group, 51, 100)
+    assert not index.get_conflicts()
+    index.invalidate()
+    assert check_index(index, queue_model) == 2
+
+    # removed nodes
+    queue_model.del_child(other_task_group, second)
+    index.invalidate()
+    assert check_index(index, queue_model) == 0
+
+    # copied node
+    copy = queue_model.copy_node(first)
+    queue_model.add_child(task_group, copy)
+    copy.get_path_template().run_number = 1
+    index.invalidate()
+    assert check_index(index, queue_model) == 2
+
+    # other model root, rebuilt without invalidate
+    queue_model._selected_model = queue_model._free_pin_model
+    assert check_index(index, queue_model) == 0
+    queue_model._selected_model = queue_model._ispyb_model
+    assert check_index(index, queue_model) == 2
+
+
+@pytest.mark.parametrize("num_collections", (1000, 5000))
+def test_index_benchmark(queue_model, num_collections):
+    rand = random.Random(num_collections)
+    collections = []
+    for index in range(num_collections):
+        if index % 10 == 0:
+            task_group = add_sample(queue_model)
+        collections.append(
+            add_collection(
+                queue_model,
+                task_group,
+                rand.randint(1, 100 * num_collections),
+                rand.randint(0, 200),
+                prefix="prefix%d" % rand.randint(0, 9),
+                run_number=rand.randint(1, 3),
+            )
+        )
+    path_templates = [dc.get_path_template() for dc in collections]
+    checked = path_templates[-100:]
+
+    index = PathCollisionIndex()
+    start_time = time.time()
+    num_conflicts = len(index.get_conflicts())
+    build_time = time.time() - start_time
+    check_index(index, queue_model, checked)
+
+    # edit of one path template, as done by the data collection widgets
+    start_time = time.time()
+    for path_template in checked:
+        path_template.start_num += 7
+        index.refresh()
+        index.get_conflicts()
+    edit_time = (time.time() - start_time) / len(checked)
+    check_index(index, queue_model, checked)
+
+    # previous check: QueueModel.check_for_path_collisions for every item
+    start_time = time.time()
+    for path_template in checked:
+        queue_model.check_for_path_collisions(path_template)
+    pairs_time = (time.time() - start_time) / len(checked) * num_collections
+
+    print(
+        "%d collections, %d conflicts: index built in %.1f ms, check after "
+        "an edit %.1f ms (check_for_path_collisions of every item %.1f ms)"
+        % (
+            num_collections,
+            num_conflicts,
+            build_time * 1e3,
+            edit_time * 1e3,
+            pairs_time * 1e3,
+        )
+    )
@@ -0,0 +1,270 @@
+import json
+import time
+import types
+
+import pytest
+
+from mxcubecore import HardwareRepository as HWR
+from mxcubecore.HardwareObjects.QueueModel import QueueModel
+from mxcubecore.model import queue_model_objects
+
+
+class RedisPipelineMock(object):
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name, args))
+
+    def execute(self):
+        self.redis.executed.append(self.commands)
+        for name, args in self.commands:
+            getattr(self.redis, name)(*args)
+
+
+class RedisMock(object):
+    """In memory redis, keeps the commands of the executed pipelines"""
+
+    def __init__(self):
+        self.values = {}
+        self.executed = []
+
+    def pipeline(self):
+        return RedisPipelineMock(self)
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+    def hset(self, key, field, value):
+        self.values.setdefault(key, {})[field] = value
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.values.get(key, {}).pop(field, None)
+
+    def hgetall(self, key):
+        return dict(
+            (field.encode(), value.encode())
+            for field, value in self.values.get(key, {}).items()
+        )
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def get_written(self, name):
+        """Returns the arguments of the name commands of the last pipeline"""
+        return [args for command, args in self.executed[-1] if command == name]
+
+
+@pytest.fixture
+def queue_model(monkeypatch):
+    queue_model = QueueModel("queue-model")
+    monkeypatch.setattr(
+        HWR,
+        "beamline",
+        types.SimpleNamespace(queue_model=queue_model),
+        raising=False,
+    )
+    return queue_model
+
+
+@pytest.fixture
+def redis():
+    return RedisMock()
+
+
+@pytest.fixture
+def autosave(qapp, redis):
+    from mxcubeqt.utils.queue_autosave import QueueAutoSave, RedisQueueBackend
+
+    autosave = QueueAutoSave(delay=20, max_delay=100)
+    autosave.set_backend(RedisQueueBackend(redis, "test"))
+    return autosave
+
+
+def add_samples(queue_model, num_samples):
+    task_groups = []
+    for index in range(num_samples):
+        sample = queue_model_objects.Sample()
+        sample.location = (1, index + 1)
+        queue_model.add_child(queue_model.get_model_root(), sample)
+        task_group = queue_model_objects.TaskGroup()
+        task_group.set_name("group %d" % index)
+        queue_model.add_child(sample, task_group)
+        add_collection(queue_model, task_group, "prefix%d" % index)
+        task_groups.append(task_group)
+    return task_groups
+
+
+def add_collection(queue_model, task_group, prefix):
+    data_collection = queue_model_objects.DataCollection()
+    data_collection.acquisitions[0].path_template.base_prefix = prefix
+    queue_model.add_child(task_group, data_collection)
+    return data_collection
+
+
+def wait_for_save(qapp, autosave, saves, timeout=5):
+    start_time = time.time()
+    while autosave.stats["saves"] < saves and time.time() - start_time < timeout:
+        qapp.processEvents()
+        time.sleep(0.005)
+    autosave.wait()
+    assert autosave.stats["saves"] == saves
+
+
+def get_saved_prefixes(redis):
+    prefixes = []
+    manifest = json.loads(redis.get("test:queue_manifest"))
+    for key in manifest["order"]:
+        record = json.loads(redis.values["test:queue_nodes"][key])
+        entry = record["task_group_entry"]
+        prefixes.append(entry.split('"base_prefix": "')[1].split('"')[0])
+    return prefixes
+
+
+def test_burst_coalescing(qapp, queue_model, redis, autosave):
+    task_groups = add_samples(queue_model, 3)
+    for task_group in task_groups:
+        for data_collection in task_group.get_children():
+            for index in range(10):
+                autosave.schedule(data_collection)
+    assert autosave.stats["requests"] == 30
+    wait_for_save(qapp, autosave, 1)
+
+    # one pipeline writing the 3 task groups and the manifest
+    assert len(redis.executed) == 1
+    assert len(redis.get_written("hset")) == 3
+    assert get_saved_prefixes(redis) == ["prefix0", "prefix1", "prefix2"]
+
+    # no change, nothing written
+    autosave.schedule()
+    autosave.flush()
+    assert autosave.stats["saves"] == 1
+
+
+def test_changed_groups_written(qapp, queue_model, redis, autosave):
+    task_groups = add_samples(queue_model, 4)
+    autosave.flush()
+    autosave.wait()
+
+    # parameters edited in place
+    data_collection = task_groups[2].get_children()[0]
+    data_collection.acquisitions[0].path_template.base_prefix = "edited2"
+    autosave.schedule(data_collection)
+    wait_for_save(qapp, autosave, 2)
+    written = redis.get_written("hset")
+    assert [args[1] for args in written] == [str(task_groups[2]._node_id)]
+    assert not redis.get_written("delete")
+    assert get_saved_prefixes(redis) == ["prefix0", "prefix1", "edited2", "prefix3"]
+
+    # new collection in a task group and a new task group
+    add_collection(queue_model, task_groups[0], "added0")
+    autosave.schedule(task_groups[0])
+    new_task_group = add_samples(queue_model, 1)[0]
+    autosave.schedule(new_task_group)
+    wait_for_save(qapp, autosave, 3)
+    written = [args[1] for args in redis.get_written("hset")]
+    assert sorted(written) == sorted(
+        [str(task_groups[0]._node_id), str(new_task_group._node_id)]
+    )
+    assert len(redis.values["test:queue_nodes"]) == 5
+
+
+def test_group_deletion(qapp, queue_model, redis, autosave):
+    task_groups = add_samples(queue_model, 3)
+    autosave.flush()
+    autosave.wait()
+
+    queue_model.del_child(task_groups[1].get_parent(), task_groups[1])
+    autosave.schedule(task_groups[1].get_parent())
+    wait_for_save(qapp, autosave, 2)
+    assert not redis.get_written("hset")
+    assert redis.get_written("hdel") == [
+        ("test:queue_nodes", str(task_groups[1]._node_id))
+    ]
+    assert sorted(redis.values["test:queue_nodes"]) == sorted(
+        [str(task_groups[0]._node_id), str(task_groups[2]._node_id)]
+    )
+    assert get_saved_prefixes(redis) == ["prefix0", "prefix2"]
+
+
+def test_restore_round_trip(qapp, monkeypatch, queue_model, redis, autosave):
+    from mxcubeqt.utils.queue_autosave import (
+        QueueAutoSave,
+        RedisQueueBackend,
+        restore_queue,
+    )
+
+    task_groups = add_samples(queue_model, 3)
+    autosave.flush()
+    autosave.wait()
+    saved_nodes = dict(redis.values["test:queue_nodes"])
+
+    # new session: other queue model, the samples without task groups,
+    # node ids start again
+    other_queue_model = QueueModel("queue-model")
+    monkeypatch.setattr(HWR.beamline, "queue_model", other_queue_model)
+    for index in range(3):
+        sample = queue_model_objects.Sample()
+        sample.location = (1, index + 1)
+        other_queue_model.add_child(other_queue_model.get_model_root(), sample)
+
+    other_autosave = QueueAutoSave(delay=20, max_delay=100)
+    other_autosave.set_backend(RedisQueueBackend(redis, "test"))
+    selected_model, records = other_autosave.load()
+    assert selected_model == "ispyb"
+    restored = restore_queue(records)
+    other_autosave.remap(restored, [key for key, _ in records])
+
+    restored_groups = [
+        sample.get_children()[0]
+        for sample in other_queue_model.get_model_root().get_children()
+    ]
+    assert [task_group.get_name() for task_group in restored_groups] == [
+        task_group.get_name() for task_group in task_groups
+    ]
+    assert [
+        task_group.get_children()[0].acquisitions[0].path_template.base_prefix
+        for task_group in restored_groups
+    ] == ["prefix0", "prefix1", "prefix2"]
+    saved_keys = json.loads(redis.get("test:queue_manifest"))["order"]
+    assert [str(task_group._node_id) for task_group in restored_groups] != saved_keys
+
+    # restored task groups are not written again
+    num_executed = len(redis.executed)
+    other_autosave.schedule()
+    other_autosave.flush()
+    other_autosave.wait()
+    assert len(redis.executed) == num_executed + 1
+    assert not redis.get_written("hset")
+    assert not redis.get_written("hdel")
+    assert redis.values["test:queue_nodes"] == saved_nodes
+
+    # an edited restored task group is saved under its previous key
+    data_collection = restored_groups[1].get_children()[0]
+    data_collection.acquisitions[0].path_template.base_prefix = "edited1"
+    other_autosave.schedule(data_collection)
+    other_autosave.flush()
+    other_autosave.wait()
+    assert [args[1] for args in redis.get_written("hset")] == [
+        str(task_groups[1]._node_id)
+    ]
+    assert sorted(redis.values["test:queue_nodes"]) == sorted(saved_nodes)
+    assert get_saved_prefixes(redis) == ["prefix0", "edited1", "prefix2"]
+
+    # a new task group does not take the key of a restored one
+    sample = other_queue_model.get_model_root().get_children()[2]
+    new_task_group = queue_model_objects.TaskGroup()
+    other_queue_model.add_child(sample, new_task_group)
+    add_collection(other_queue_model, new_task_group, "added2")
+    other_autosave.schedule(new_task_group)
+    other_autosave.flush()
+    other_autosave.wait()
+    written = [args[1] for args in redis.get_written("hset")]
+    assert len(written) == 1 and written[0] not in saved_nodes
+    assert get_saved_prefixes(redis) == ["prefix0", "edited1", "prefix2", "added2"]
@@ -0,0 +1,108 @@
+import types
+
+import pytest
+
+from mxcubecore.model import queue_model_objects
+
+
+class CharacterisationPageMock(object):
+    """Task page creating one characterisation per call, failing at the
+       fail_at th call
+    """
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.num_calls = 0
+
+    def get_task_node_name(self):
+        return "Characterisation"
+
+    def create_task(self, sample, shape, comment):
+        self.num_calls += 1
+        if self.num_calls == self.fail_at:
+            raise RuntimeError("Task creation failed")
+        return [queue_model_objects.Characterisation()]
+
+
+def get_task_toolbox(sample_tree, page):
+    """TaskToolBoxWidget methods bound to the sample tree and page"""
+    # widget modules create pixmaps when imported, after the QApplication
+    from mxcubeqt.widgets.task_toolbox_widget import TaskToolBoxWidget
+
+    task_toolbox = types.SimpleNamespace(
+        tree_brick=types.SimpleNamespace(dc_tree_widget=sample_tree.tree),
+        tool_box=types.SimpleNamespace(currentWidget=lambda: page),
+        comments_widget=types.SimpleNamespace(get_comment_text=lambda: ""),
+        discrete_page=None,
+        char_page=page,
+        energy_scan_page=None,
+        xrf_spectrum_page=None,
+        xray_imaging_page=None,
+    )
+    for name in ("create_tasks", "create_task_group", "create_task", "remove_nodes"):
+        setattr(task_toolbox, name, getattr(TaskToolBoxWidget, name).__get__(task_toolbox))
+    return task_toolbox
+
+
+def get_tree_state(sample_tree):
+    return (
+        len(sample_tree.tree.model_item_index),
+        sample_tree.tree.sample_tree_widget.topLevelItem(0).childCount(),
+        [len(sample.get_children()) for sample in sample_tree.samples],
+    )
+
+
+@pytest.fixture
+def tree_with_groups(sample_tree):
+    sample_tree.samples = sample_tree.add_samples(20)
+    page = CharacterisationPageMock()
+    task_toolbox = get_task_toolbox(sample_tree, page)
+    sample_items = [
+        sample_tree.tree.get_item_by_model(sample) for sample in sample_tree.samples
+    ]
+    task_toolbox.create_tasks(sample_items)
+    return sample_tree, page, task_toolbox
+
+
+def test_create_tasks(tree_with_groups):
+    sample_tree, page, task_toolbox = tree_with_groups
+
+    for sample in sample_tree.samples:
+        (task_group,) = sample.get_children()
+        assert len(task_group.get_children()) == 1
+        assert sample_tree.tree.get_item_by_model(task_group).childCount() == 1
+    # one save request for the whole batch
+    assert sample_tree.tree_brick.autosave_requests == 1
+
+
+def test_create_tasks_rollback_samples(tree_with_groups):
+    sample_tree, page, task_toolbox = tree_with_groups
+    state = get_tree_state(sample_tree)
+    sample_items = [
+        sample_tree.tree.get_item_by_model(sample) for sample in sample_tree.samples
+    ]
+    page.fail_at = page.num_calls + 10
+
+    assert task_toolbox.create_tasks(sample_items) == []
+    assert get_tree_state(sample_tree) == state
+
+
+def test_create_tasks_rollback_selected_task_groups(tree_with_groups):
+    """Tasks added to selected (deletable) task groups are removed"""
+    sample_tree, page, task_toolbox = tree_with_groups
+    task_groups = [sample.get_children()[0] for sample in sample_tree.samples]
+    group_items = [
+        sample_tree.tree.get_item_by_model(task_group) for task_group in task_groups
+    ]
+    for group_item in group_items:
+        assert group_item.deletable
+        group_item.setSelected(True)
+    state = get_tree_state(sample_tree)
+    page.fail_at = page.num_calls + 10
+
+    assert task_toolbox.create_tasks(group_items) == []
+    assert get_tree_state(sample_tree) == state
+    for task_group, group_item in zip(task_groups, group_items):
+        assert len(task_group.get_children()) == 1
+        assert group_item.childCount() == 1
+        assert group_item.isSelected()